@@ -0,0 +1,230 @@
+# Loopback benchmark of the topside to Arduino command pipeline, Linux only
+#
+# The server runs against arduinoEmulator ptys and the client talks to it over
+# 127.0.0.1, all in this process. Results are printed as JSON so runs can be
+# compared across commits.
+#
+# python benchmarks/pipelineBenchmark.py
+# python benchmarks/pipelineBenchmark.py --duration 5 \
+#     --serial-delay 0 0.005 0.02 --output results.json
+#
+# CPU per message is the process CPU time (client, server and emulators)
+# divided by the messages sent.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, "..", "rov-server"))
+sys.path.insert(1, os.path.join(BENCHMARK_DIRECTORY, "..", "topside-client"))
+
+# The modules are not packages, they are imported from their directories
+from arduinoEmulator import startEmulators  # noqa: E402
+from asyncServer import asyncTcpServer  # noqa: E402
+from latencyStats import latencyHistogram, latencyStats  # noqa: E402
+from tcpClient import tcpClient  # noqa: E402
+
+MOTOR_VALUES = [0.5, 0.0, 0.25, -0.5, 0.0, 0.0, 0.0, 0.0]
+
+
+def startServer(port, serialPorts, sensorRate):
+    """Starts the asyncio server in a daemon thread and waits for it
+
+    Args:
+        port: motor port, sensors use port + 1
+        serialPorts: emulated Arduino ports
+        sensorRate: sensor polls per second
+
+    Returns:
+        asyncTcpServer
+    """
+    server = asyncTcpServer("127.0.0.1", port, sensorRate=sensorRate,
+                            serialPorts=serialPorts)
+    serverThread = threading.Thread(target=server.run, name="benchmark-server")
+    serverThread.daemon = True
+    serverThread.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port + 1),
+                                     timeout=1).close()
+            # The first sensor reading has to be cached before SEN is answered
+            time.sleep(2.0 / sensorRate)
+            return server
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Server did not start")
+
+
+def runTimed(duration, action):
+    """Calls action in a loop for duration seconds
+
+    Args:
+        duration: seconds
+        action: function called once per message
+
+    Returns:
+        dict with messages, rate, CPU per message and latency percentiles in
+        milliseconds
+    """
+    latency = latencyHistogram(window=1000000)
+    errors = 0
+    cpuStart = time.process_time()
+    start = time.monotonic()
+    end = start + duration
+    now = start
+    while now < end:
+        sentAt = now
+        try:
+            action()
+        except (ValueError, OSError):
+            errors += 1
+        now = time.monotonic()
+        latency.record(now - sentAt)
+    cpu = time.process_time() - cpuStart
+    elapsed = now - start
+    messages = latency.total
+    return {
+        "messages": messages,
+        "errors": errors,
+        "perSecond": round(messages / elapsed, 1),
+        "cpuPerMessageUs": round(cpu / messages * 1e6,
+                                 2) if messages else None,
+        "latencyMs": latency.percentiles(),
+    }
+
+
+def benchmarkProtocol(protocol, port, duration, motor):
+    """Runs the motor and sensor scenarios over one protocol
+
+    Args:
+        protocol: "binary" or "text"
+        port: motor port of the server
+        duration: seconds per scenario
+        motor: emulated motor Arduino, counts the commands that reach the
+            serial port
+
+    Returns:
+        dict of scenario name to results
+    """
+    results = {}
+    motorClient = tcpClient("127.0.0.1", port, protocol=protocol)
+    sensorClient = tcpClient("127.0.0.1", port + 1, protocol=protocol)
+    motorClient.startConnection()
+    sensorClient.startConnection()
+    try:
+        # Commands are queued latest-wins, so this is the rate the server
+        # accepts them
+        serialBefore = motor.commandCount
+        results["motorThroughput"] = runTimed(
+            duration,
+            lambda: motorClient.sendMotorCommand("D", MOTOR_VALUES))
+        results["motorThroughput"]["reachedSerial"] = (motor.commandCount -
+                                                       serialBefore)
+        results["sensorRoundTrip"] = runTimed(duration,
+                                              sensorClient.requestSensorSample)
+        if protocol == "binary":
+            # Every command waits for the Arduino's OK, hop times come from the
+            # trace reply
+            stats = latencyStats(window=1000000)
+            motorClient.latencyStats = stats
+            results["motorTraced"] = runTimed(
+                duration,
+                lambda: motorClient.sendTracedMotorCommand("D", MOTOR_VALUES))
+            results["motorTraced"]["hopsMs"] = stats.report()
+    finally:
+        motorClient.closeConnection()
+        sensorClient.closeConnection()
+    return results
+
+
+def gitCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              cwd=BENCHMARK_DIRECTORY).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def runBenchmark(duration=3.0, serialDelays=(0.0, 0.005, 0.02),
+                 protocols=("binary", "text"), baudRate=9600, port=18000,
+                 sensorRate=20.0):
+    """Runs every scenario for every injected serial delay and protocol
+
+    Args:
+        duration: seconds per scenario
+        serialDelays: firmware processing delays injected in the emulated
+            Arduinos, in seconds
+        protocols: client protocols to benchmark
+        baudRate: baud rate paced by the emulated Arduinos
+        port: motor port of the server, sensors use port + 1
+        sensorRate: sensor polls per second on the server
+
+    Returns:
+        dict ready to be written as JSON
+    """
+    motor, sensor = startEmulators(baudRate=baudRate)
+    server = startServer(port, [motor.portPath, sensor.portPath], sensorRate)
+    runs = []
+    try:
+        for serialDelay in serialDelays:
+            motor.processingDelay = serialDelay
+            sensor.processingDelay = serialDelay
+            for protocol in protocols:
+                runs.append({"serialDelay": serialDelay, "protocol": protocol,
+                             "results": benchmarkProtocol(
+                                 protocol, port, duration, motor)})
+    finally:
+        server.stopAllServices()
+        time.sleep(0.5)
+        motor.stop()
+        sensor.stop()
+    return {
+        "commit": gitCommit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "duration": duration,
+        "baudRate": baudRate,
+        "sensorRate": sensorRate,
+        "runs": runs,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the command "
+                                                 "pipeline over loopback "
+                                                 "against emulated Arduinos")
+    parser.add_argument("--duration", type=float, default=3.0,
+                        help="seconds per scenario")
+    parser.add_argument("--serial-delay", type=float, nargs="+",
+                        default=[0.0, 0.005, 0.02],
+                        help="firmware delays to inject, seconds")
+    parser.add_argument("--protocol", nargs="+", default=["binary", "text"],
+                        choices=["binary", "text"])
+    parser.add_argument("--baud-rate", type=int, default=9600)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--sensor-rate", type=float, default=20.0)
+    parser.add_argument("--output", default=None,
+                        help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - '
+                               '%(message)s')
+    report = runBenchmark(args.duration, args.serial_delay, args.protocol,
+                          args.baud_rate, args.port, args.sensor_rate)
+    reportJSON = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(reportJSON + "\n")
+    else:
+        print(reportJSON)
@@ -54,6 +54,35 @@ int rotationLock = 0; // Stores rotation lock, 0 = unlocked, 1 = locked
 char stick_or_pad;
 int speedMod = 10;
 
+// ESC values mixed and ramped on the Pi ("ESC x,y,zl,zr,claw", see rov-server/thrustMixer.py)
+// while set, mainLoop does not mix or ramp; the next joystick command hands mixing back to the Arduino
+
+bool escMode = false;
+
+// thruster ramp timing, serial is read on every loop but speeds only step every stepInterval ms
+
+const unsigned long stepInterval = 50;
+unsigned long lastStep = 0;
+
+// binary serial frames, negotiated with "MODE <baud>" after READY, see rov-server/serialFrames.py
+// frame: start | type | payload length | payload | CRC-8 of type, length and payload
+
+const byte FRAME_START = 0xA5;
+const byte SERIAL_MOTOR = 0x01;     // payload: mode char then 8 int16 in thousandths
+const byte SERIAL_TEXT = 0x03;      // payload: text command, reply is text
+const byte SERIAL_PING = 0x04;      // keeps binary mode alive
+const byte SERIAL_TEXT_MODE = 0x05; // back to text mode at 9600
+const byte SERIAL_ESC = 0x06;       // payload: x, y, zl, zr ESC values then the claw state as int8
+const byte REPLY_FLAG = 0x80;
+const byte SERIAL_ERROR = 0xFF;
+const int MAX_PAYLOAD = 64;
+const unsigned long LINK_TIMEOUT = 2000; // ms without a valid frame before going back to text mode
+
+bool binaryMode = false;
+unsigned long lastFrame = 0;
+byte frameBuffer[MAX_PAYLOAD + 3]; // type, length, payload, crc
+int framePosition = -1;            // -1 while waiting for the start byte
+
 // debug variables
 
 bool hasReceivedSerial = false;
@@ -209,6 +238,13 @@ void ParseCommands(String dataFromPi)
         return;
     }
 
+    if (dataFromPi.startsWith("ESC ")) // ESC values mixed on the Pi
+    {
+        ParseEsc(dataFromPi.substring(4));
+        Serial.println("OK");
+        return;
+    }
+
     // this array is as follows: [0] = movement inputs, [1] = right stick, [2] = claw states + buttons
     String dataFromPiArray[4];
     String tmp_str = dataFromPi;
@@ -249,51 +285,208 @@ void ParseCommands(String dataFromPi)
     tmp_str = tmp_str.substring(tmp_str.indexOf(',') + 1);
     String bottom_button_String = tmp_str;
 
-    stick_or_pad = dataFromPiArray[3].charAt(0);
+    int top_button = top_button_String.toInt();       // x on XBOX
+    int bottom_button = bottom_button_String.toInt(); // a on XBOX
 
     // convert the strings to ints and floats
+    ApplyCommand(dataFromPiArray[3].charAt(0), x_String.toFloat(), z_String.toFloat(), speed_Rotation_String.toFloat(), speed_Y_String.toFloat(),
+                 L_button_String.toInt(), L_trigger_String.toFloat(), R_button_String.toInt(), R_trigger_String.toFloat());
+
+    Serial.println("OK");
+}
+
+// sets the scan values from a command, shared by the text and binary protocols
+void ApplyCommand(char mode, float cmd_x, float cmd_z, float cmd_rotation, float cmd_y, int L_button, float L_trigger_value, int R_button, float R_trigger_value)
+{
+    escMode = false;
+    stick_or_pad = mode;
 
     switch (stick_or_pad)
     {
 
     case 'S':
         // stick
-        scan_x = x_String.toFloat();
-        scan_z = z_String.toFloat();
+        scan_x = cmd_x;
+        scan_z = cmd_z;
         break;
 
     case 'D':
         // dpad
-        scan_xd = -x_String.toInt();
-        scan_zd = z_String.toInt();
+        scan_xd = -(int)cmd_x;
+        scan_zd = (int)cmd_z;
         break;
 
     default:
         break;
     }
 
-    scan_rotation = -1.0f * (float) ((int)(speed_Rotation_String.toFloat() * 100.0f)) / 100.0f;
-    scan_y = -1.0f * speed_Y_String.toFloat();
+    scan_rotation = -1.0f * (float) ((int)(cmd_rotation * 100.0f)) / 100.0f;
+    scan_y = -1.0f * cmd_y;
 
-    int L_trigger = L_trigger_String.toFloat() >= 0.5f ? -1 : 0;
-    int R_trigger = R_trigger_String.toFloat() >= 0.5f ? 1 : 0;
+    int L_trigger = L_trigger_value >= 0.5f ? -1 : 0;
+    int R_trigger = R_trigger_value >= 0.5f ? 1 : 0;
 
     claw_state = R_trigger + L_trigger;
 
-    int L_button = L_button_String.toInt();
-    int R_button = R_button_String.toInt();
-
     verticalLock = R_button;
     rotationLock = L_button;
+}
 
-    int top_button = top_button_String.toInt();       // x on XBOX
-    int bottom_button = bottom_button_String.toInt(); // a on XBOX
+// parses "x,y,zl,zr,claw"
+void ParseEsc(String values)
+{
+    int esc[5];
+    for (int i = 0; i < 5; i++)
+    {
+        int comma = values.indexOf(',');
+        esc[i] = (comma < 0 ? values : values.substring(0, comma)).toInt();
+        values = values.substring(comma + 1);
+    }
+    ApplyEsc(esc[0], esc[1], esc[2], esc[3], esc[4]);
+}
 
-    Serial.println("OK");
+// writes ESC values right away, they are only kept within the current maximums
+void ApplyEsc(int esc_x, int esc_y, int esc_zl, int esc_zr, int claw)
+{
+    escMode = true;
+
+    x = target_x = constrain(esc_x, maxRev, maxFwd);
+    y = target_y = constrain(esc_y, maxRev, maxFwd);
+    zl = target_zl = constrain(esc_zl, maxRev, maxFwd);
+    zr = target_zr = constrain(esc_zr, maxRev, maxFwd);
+    claw_state = constrain(claw, -1, 1);
+
+    analogWrite(PIN_X, x);
+    analogWrite(PIN_ZL, zl);
+    analogWrite(PIN_ZR, zr);
+    analogWrite(PIN_Y, y);
+    SetClawState(claw_state);
+}
+
+byte Crc8(byte crc, byte data)
+{
+    crc ^= data;
+    for (int bit = 0; bit < 8; bit++)
+        crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    return crc;
+}
+
+void SendFrame(byte type, const byte *payload, byte length)
+{
+    byte crc = Crc8(Crc8(0, type), length);
+    for (int i = 0; i < length; i++)
+        crc = Crc8(crc, payload[i]);
+    Serial.write(FRAME_START);
+    Serial.write(type);
+    Serial.write(length);
+    Serial.write(payload, length);
+    Serial.write(crc);
+}
+
+void StartBinaryMode(long baud)
+{
+    if (baud < 9600 || baud > 1000000)
+    {
+        Serial.println("MODE ERROR");
+        return;
+    }
+    Serial.println("MODE " + String(baud));
+    Serial.flush(); // the reply must leave at the old baud rate
+    Serial.begin(baud);
+    binaryMode = true;
+    framePosition = -1;
+    lastFrame = millis();
+}
+
+void StopBinaryMode()
+{
+    Serial.flush();
+    Serial.begin(9600);
+    binaryMode = false;
+}
+
+// int16 little endian from the payload, in thousandths
+float PayloadValue(int offset)
+{
+    return (int16_t)(frameBuffer[offset] | (frameBuffer[offset + 1] << 8)) / 1000.0f;
+}
+
+void HandleFrame()
+{
+    byte type = frameBuffer[0];
+    byte length = frameBuffer[1];
+    byte *payload = frameBuffer + 2;
+    lastFrame = millis();
+    hasReceivedSerial = true;
+
+    if (type == SERIAL_MOTOR && length == 17)
+    {
+        ApplyCommand((char)payload[0], PayloadValue(3), PayloadValue(5), PayloadValue(7), PayloadValue(9),
+                     (int)PayloadValue(11), PayloadValue(13), (int)PayloadValue(15), PayloadValue(17));
+        SendFrame(SERIAL_MOTOR | REPLY_FLAG, payload, 0);
+    }
+    else if (type == SERIAL_ESC && length == 5)
+    {
+        ApplyEsc(payload[0], payload[1], payload[2], payload[3], (int8_t)payload[4]);
+        SendFrame(SERIAL_ESC | REPLY_FLAG, payload, 0);
+    }
+    else if (type == SERIAL_TEXT)
+    {
+        bool isType = length == 4 && memcmp(payload, "TYPE", 4) == 0;
+        const char *reply = isType ? "MOTOR" : "INVALID";
+        SendFrame(SERIAL_TEXT | REPLY_FLAG, (const byte *)reply, strlen(reply));
+    }
+    else if (type == SERIAL_PING)
+    {
+        SendFrame(SERIAL_PING | REPLY_FLAG, payload, 0);
+    }
+    else if (type == SERIAL_TEXT_MODE)
+    {
+        SendFrame(SERIAL_TEXT_MODE | REPLY_FLAG, payload, 0);
+        StopBinaryMode();
+    }
+    else
+    {
+        SendFrame(SERIAL_ERROR, payload, 0);
+    }
+}
+
+// reads the available bytes, handles every complete frame and drops the ones with a bad checksum
+void ReadFrames()
+{
+    while (Serial.available() > 0 && binaryMode)
+    {
+        byte data = Serial.read();
+        if (framePosition < 0)
+        {
+            if (data == FRAME_START)
+                framePosition = 0;
+            continue;
+        }
+        frameBuffer[framePosition++] = data;
+        if (framePosition == 2 && frameBuffer[1] > MAX_PAYLOAD)
+        {
+            framePosition = -1;
+            continue;
+        }
+        if (framePosition >= 2 && framePosition == frameBuffer[1] + 3)
+        {
+            byte crc = 0;
+            for (int i = 0; i < framePosition - 1; i++)
+                crc = Crc8(crc, frameBuffer[i]);
+            framePosition = -1;
+            if (crc == frameBuffer[frameBuffer[1] + 2])
+                HandleFrame();
+        }
+    }
 }
 
 void mainLoop()
 {
+    // the Pi mixes and ramps, ApplyEsc already wrote the values
+    if (escMode)
+        return;
+
     // vertical moves if not locked...
     if (verticalLock == 0)
         MoveVertical(scan_y);
@@ -337,15 +530,28 @@ void mainLoop()
 
 void loop()
 {
-    if (Serial.available() > 0)
+    if (binaryMode)
+    {
+        ReadFrames();
+        // the Pi pings an idle link, silence means it is gone or was restarted
+        if (binaryMode && millis() - lastFrame > LINK_TIMEOUT)
+            StopBinaryMode();
+    }
+    else if (Serial.available() > 0)
     {
         hasReceivedSerial = true;
         String inputData = Serial.readStringUntil('\n');
-        ParseCommands(inputData);
+        if (inputData.startsWith("MODE "))
+            StartBinaryMode(inputData.substring(5).toInt());
+        else
+            ParseCommands(inputData);
     }
 
-    if (DEBUG_MODE == 0 && hasReceivedSerial)
-        mainLoop();
-
-    delay(50);
+    unsigned long now = millis();
+    if (now - lastStep >= stepInterval)
+    {
+        lastStep = now;
+        if (DEBUG_MODE == 0 && hasReceivedSerial)
+            mainLoop();
+    }
 }
\ No newline at end of file
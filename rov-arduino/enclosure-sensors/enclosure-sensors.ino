@@ -12,6 +12,23 @@ PMBus pmbus;
 // Define Variables
 String outputData;
 
+// binary serial frames, negotiated with "MODE <baud>" after READY, see rov-server/serialFrames.py
+// frame: start | type | payload length | payload | CRC-8 of type, length and payload
+const byte FRAME_START = 0xA5;
+const byte SERIAL_SENSOR_REQUEST = 0x02; // reply payload: 8 little endian floats, same order as the text reply
+const byte SERIAL_TEXT = 0x03;           // payload: text command, reply is text
+const byte SERIAL_PING = 0x04;           // keeps binary mode alive
+const byte SERIAL_TEXT_MODE = 0x05;      // back to text mode at 9600
+const byte REPLY_FLAG = 0x80;
+const byte SERIAL_ERROR = 0xFF;
+const int MAX_PAYLOAD = 64;
+const unsigned long LINK_TIMEOUT = 2000; // ms without a valid frame before going back to text mode
+
+bool binaryMode = false;
+unsigned long lastFrame = 0;
+byte frameBuffer[MAX_PAYLOAD + 3]; // type, length, payload, crc
+int framePosition = -1;            // -1 while waiting for the start byte
+
 void setup()
 {
     // Start Serial
@@ -33,10 +50,127 @@ void setup()
 void loop()
 {
 
-    if (Serial.available() > 0)
+    if (binaryMode)
+    {
+        readFrames();
+        // the Pi pings an idle link, silence means it is gone or was restarted
+        if (binaryMode && millis() - lastFrame > LINK_TIMEOUT)
+            stopBinaryMode();
+    }
+    else if (Serial.available() > 0)
     {
         String inputData = Serial.readStringUntil('\n');
-        Serial.println(processData(inputData));
+        if (inputData.startsWith("MODE "))
+            startBinaryMode(inputData.substring(5).toInt());
+        else
+            Serial.println(processData(inputData));
+    }
+}
+
+void startBinaryMode(long baud)
+{
+    if (baud < 9600 || baud > 1000000)
+    {
+        Serial.println("MODE ERROR");
+        return;
+    }
+    Serial.println("MODE " + String(baud));
+    Serial.flush(); // the reply must leave at the old baud rate
+    Serial.begin(baud);
+    binaryMode = true;
+    framePosition = -1;
+    lastFrame = millis();
+}
+
+void stopBinaryMode()
+{
+    Serial.flush();
+    Serial.begin(9600);
+    binaryMode = false;
+}
+
+byte crc8(byte crc, byte data)
+{
+    crc ^= data;
+    for (int bit = 0; bit < 8; bit++)
+        crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    return crc;
+}
+
+void sendFrame(byte type, const byte *payload, byte length)
+{
+    byte crc = crc8(crc8(0, type), length);
+    for (int i = 0; i < length; i++)
+        crc = crc8(crc, payload[i]);
+    Serial.write(FRAME_START);
+    Serial.write(type);
+    Serial.write(length);
+    Serial.write(payload, length);
+    Serial.write(crc);
+}
+
+void handleFrame()
+{
+    byte type = frameBuffer[0];
+    byte length = frameBuffer[1];
+    byte *payload = frameBuffer + 2;
+    lastFrame = millis();
+
+    if (type == SERIAL_SENSOR_REQUEST)
+    {
+        // AVR floats are little endian IEEE 754, like struct "<8f" on the Pi
+        float values[8] = {getHumidity(), getTemperature(), (float)getLeak(), pmbus.vin_request(), pmbus.vout_request(),
+                           pmbus.current_out_request(), pmbus.temp_request(), pmbus.power_out_request()};
+        sendFrame(SERIAL_SENSOR_REQUEST | REPLY_FLAG, (const byte *)values, sizeof(values));
+    }
+    else if (type == SERIAL_TEXT)
+    {
+        payload[length] = 0; // the crc byte is no longer needed
+        String reply = processData(String((const char *)payload));
+        sendFrame(SERIAL_TEXT | REPLY_FLAG, (const byte *)reply.c_str(), min(reply.length(), (unsigned int)MAX_PAYLOAD));
+    }
+    else if (type == SERIAL_PING)
+    {
+        sendFrame(SERIAL_PING | REPLY_FLAG, payload, 0);
+    }
+    else if (type == SERIAL_TEXT_MODE)
+    {
+        sendFrame(SERIAL_TEXT_MODE | REPLY_FLAG, payload, 0);
+        stopBinaryMode();
+    }
+    else
+    {
+        sendFrame(SERIAL_ERROR, payload, 0);
+    }
+}
+
+// reads the available bytes, handles every complete frame and drops the ones with a bad checksum
+void readFrames()
+{
+    while (Serial.available() > 0 && binaryMode)
+    {
+        byte data = Serial.read();
+        if (framePosition < 0)
+        {
+            if (data == FRAME_START)
+                framePosition = 0;
+            continue;
+        }
+        frameBuffer[framePosition++] = data;
+        if (framePosition == 2 && frameBuffer[1] > MAX_PAYLOAD)
+        {
+            framePosition = -1;
+            continue;
+        }
+        if (framePosition >= 2 && framePosition == frameBuffer[1] + 3)
+        {
+            byte crc = 0;
+            for (int i = 0; i < framePosition - 1; i++)
+                crc = crc8(crc, frameBuffer[i]);
+            framePosition = -1;
+            if (crc == frameBuffer[frameBuffer[1] + 2])
+                handleFrame();
+        }
     }
 }
 
@@ -0,0 +1,325 @@
+# Emulates the motor and sensor Arduinos on pseudo-terminals, Linux only
+#
+# python arduinoEmulator.py
+#   prints the two emulated ports, pass them to the server with --serial-port
+# python arduinoEmulator.py --processing-delay 0.02 --drop-rate 0.001 \
+#     --disconnect-after 500
+#   adds firmware processing time, dropped bytes and a disconnect after
+#   500 commands
+
+import serialFrames
+import argparse
+import logging
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+
+class emulatedArduino:
+    def __init__(self, boardType: str, baudRate: int = 9600,
+                 processingDelay: float = 0.0, dropRate: float = 0.0,
+                 disconnectAfter: int = None, bootDelay: float = 0.0,
+                 readyInterval: float = 0.5,
+                 binaryFrames: bool = True) -> None:
+        """Serial behaviour of one enclosure Arduino on a pseudo-terminal
+
+        The port path is available in portPath once start is called.
+
+        Args:
+            boardType: "MOTOR" or "SENSOR"
+            baudRate: baud rate whose byte time is applied to every byte sent
+                and received, 0 disables pacing
+            processingDelay: seconds spent by the firmware on every command
+            dropRate: probability that a byte sent to the host is lost
+            disconnectAfter: commands after which the port is closed, None
+                keeps it open
+            bootDelay: seconds before the first READY
+            readyInterval: seconds between READY lines until the first command,
+                a pty cannot reset the board when it is opened
+            binaryFrames: accept the MODE handshake and serialFrames, False
+                emulates text only firmware
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.boardType = boardType
+        self.baudRate = baudRate
+        self.processingDelay = processingDelay
+        self.dropRate = dropRate
+        self.disconnectAfter = disconnectAfter
+        self.bootDelay = bootDelay
+        self.readyInterval = readyInterval
+        self.binaryFrames = binaryFrames
+        self.binaryMode = False
+        self.textBaudRate = baudRate
+        self.frameDecoder = serialFrames.serialFrameDecoder()
+        self.lastFrame = 0.0
+        self.commandCount = 0
+        self.lastMotorCommand = None
+        self.portPath = None
+        self.master = None
+        self.slave = None
+        self.running = False
+        self.thread = None
+        self.sensorValues = [45.0, 25.0, 0, 12.0, 5.0, 1.5, 30.0, 7.5]
+
+    def start(self) -> str:
+        """Creates the pseudo-terminal and starts the firmware loop
+
+        Args:
+            None
+
+        Returns:
+            path of the emulated serial port
+
+        Raises:
+            None
+        """
+        self.master, self.slave = pty.openpty()
+        # No echo or newline translation, like a real serial port
+        tty.setraw(self.slave)
+        self.portPath = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self.firmwareLoop,
+                                       name=f"emulator-{self.boardType}")
+        self.thread.daemon = True
+        self.thread.start()
+        logging.info(f"Emulated {self.boardType} Arduino at {self.portPath}")
+        return self.portPath
+
+    def stop(self) -> None:
+        """Stops the firmware loop and closes the pseudo-terminal
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(2)
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = None
+        self.slave = None
+
+    def byteTime(self, byteCount: int) -> float:
+        # 8N1, 10 bits per byte
+        return byteCount * 10.0 / self.baudRate if self.baudRate else 0.0
+
+    def writeLine(self, line: str) -> None:
+        self.writeBytes((line + "\r\n").encode('utf-8'))
+
+    def writeBytes(self, data: bytes) -> None:
+        if self.dropRate:
+            data = bytes(byte for byte in data
+                         if random.random() >= self.dropRate)
+        time.sleep(self.byteTime(len(data)))
+        os.write(self.master, data)
+
+    def firmwareLoop(self) -> None:
+        """Reads commands from the host and answers them like the firmware does
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        time.sleep(self.bootDelay)
+        received = b""
+        nextReady = 0.0
+        while self.running:
+            # READY is repeated until the host talks, it may open the port
+            # after boot
+            if self.commandCount == 0 and not received and \
+                    time.monotonic() >= nextReady:
+                self.writeLine("READY")
+                nextReady = time.monotonic() + self.readyInterval
+            silence = time.monotonic() - self.lastFrame
+            if self.binaryMode and silence > serialFrames.LINK_TIMEOUT:
+                self.setTextMode()
+            readable, _, _ = select.select([self.master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                chunk = os.read(self.master, 1024)
+            except OSError:
+                break
+            time.sleep(self.byteTime(len(chunk)))
+            if self.binaryMode:
+                for frameType, payload in self.frameDecoder.feed(chunk):
+                    self.lastFrame = time.monotonic()
+                    self.handleFrame(frameType, payload)
+                    if self.checkDisconnect():
+                        return
+                continue
+            received += chunk
+            while b"\n" in received and not self.binaryMode:
+                line, received = received.split(b"\n", 1)
+                command = line.decode('utf-8', errors='replace')
+                self.handleCommand(command.rstrip("\r"))
+                if self.checkDisconnect():
+                    return
+
+    def checkDisconnect(self) -> bool:
+        if self.disconnectAfter is None or \
+                self.commandCount < self.disconnectAfter:
+            return False
+        logging.warning(f"Emulated {self.boardType} Arduino disconnecting "
+                        f"after {self.commandCount} commands")
+        self.running = False
+        os.close(self.master)
+        self.master = None
+        return True
+
+    def handleCommand(self, command: str) -> None:
+        """Answers one command
+
+        Args:
+            command: line received from the host, without the newline
+
+        Returns:
+            None
+        """
+        self.commandCount += 1
+        if self.processingDelay:
+            time.sleep(self.processingDelay)
+        if command == "TYPE":
+            self.writeLine(self.boardType)
+        elif command.startswith("MODE ") and self.binaryFrames:
+            self.writeLine(command)
+            self.binaryMode = True
+            self.baudRate = int(command[5:])
+            self.frameDecoder.reset()
+            self.lastFrame = time.monotonic()
+        elif self.boardType == "MOTOR":
+            # ParseCommands accepts anything and always answers OK
+            self.lastMotorCommand = command
+            self.writeLine("OK")
+        else:
+            self.writeLine(self.readSensors())
+
+    def handleFrame(self, frameType: int, payload: bytes) -> None:
+        """Answers one binary frame
+
+        Args:
+            frameType: type of the frame
+            payload: payload of the frame
+
+        Returns:
+            None
+        """
+        self.commandCount += 1
+        if self.processingDelay:
+            time.sleep(self.processingDelay)
+        replyType = frameType | serialFrames.REPLY_FLAG
+        reply = b""
+        isMotor = self.boardType == "MOTOR"
+        if frameType == serialFrames.SERIAL_MOTOR and isMotor:
+            mode, *values = serialFrames.MOTOR_PAYLOAD.unpack(payload)
+            groups = (values[0:2], values[2:4], values[4:8])
+            self.lastMotorCommand = mode.decode('ascii') + "\t" + "\t".join(
+                ",".join(f"{value / serialFrames.MOTOR_SCALE:g}"
+                         for value in group) for group in groups)
+        elif frameType == serialFrames.SERIAL_ESC and isMotor:
+            *escValues, claw = serialFrames.ESC_PAYLOAD.unpack(payload)
+            self.lastMotorCommand = serialFrames.escCommand(escValues, claw)
+        elif frameType == serialFrames.SERIAL_SENSOR_REQUEST and \
+                self.boardType == "SENSOR":
+            self.readSensors()
+            reply = serialFrames.SENSOR_PAYLOAD.pack(*self.sensorValues)
+        elif frameType == serialFrames.SERIAL_TEXT:
+            reply = (self.boardType if payload == b"TYPE"
+                     else "INVALID").encode('utf-8')
+        elif frameType in (serialFrames.SERIAL_PING,
+                           serialFrames.SERIAL_TEXT_MODE):
+            pass
+        else:
+            replyType = serialFrames.SERIAL_ERROR
+        self.writeBytes(serialFrames.encodeSerialFrame(replyType, reply))
+        if frameType == serialFrames.SERIAL_TEXT_MODE:
+            self.setTextMode()
+
+    def setTextMode(self) -> None:
+        self.binaryMode = False
+        self.baudRate = self.textBaudRate
+
+    def readSensors(self) -> str:
+        # Slow random walk, two decimals like Arduino String(float)
+        self.sensorValues = [
+            value + random.uniform(-0.05, 0.05) if index != 2 else value
+            for index, value in enumerate(self.sensorValues)]
+        return "\t".join(f"{value:.2f}" if index != 2 else str(value)
+                         for index, value in enumerate(self.sensorValues))
+
+
+def startEmulators(**options):
+    """Starts an emulated motor and sensor Arduino
+
+    Args:
+        options: keyword arguments given to both emulatedArduino
+
+    Returns:
+        (motor emulatedArduino, sensor emulatedArduino)
+    """
+    motor = emulatedArduino("MOTOR", **options)
+    sensor = emulatedArduino("SENSOR", **options)
+    motor.start()
+    sensor.start()
+    return motor, sensor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Emulate the enclosure "
+                                                 "Arduinos on "
+                                                 "pseudo-terminals")
+    parser.add_argument("--baud-rate", type=int, default=9600,
+                        help="byte pacing, 0 disables it")
+    parser.add_argument("--processing-delay", type=float, default=0.0,
+                        help="seconds spent on every command")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="probability of losing a byte sent to the host")
+    parser.add_argument("--disconnect-after", type=int, default=None,
+                        help="close the port after this many commands")
+    parser.add_argument("--boot-delay", type=float, default=0.0,
+                        help="seconds before the first READY")
+    parser.add_argument("--text-only", action="store_true",
+                        help="emulate firmware without binary frames")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - '
+                               '%(message)s')
+    motor, sensor = startEmulators(baudRate=args.baud_rate,
+                                   processingDelay=args.processing_delay,
+                                   dropRate=args.drop_rate,
+                                   disconnectAfter=args.disconnect_after,
+                                   bootDelay=args.boot_delay,
+                                   binaryFrames=not args.text_only)
+    print(f"--serial-port {motor.portPath} --serial-port {sensor.portPath}")
+    try:
+        while motor.running or sensor.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    motor.stop()
+    sensor.stop()
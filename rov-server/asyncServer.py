@@ -0,0 +1,282 @@
+from tcpServer import tcpServer, clientSession, configureClientSocket
+from sensorPoller import asyncTelemetrySubscriber
+import frameProtocol as fp
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+import argparse
+import logging
+
+
+class asyncTcpServer(tcpServer):
+    def __init__(self, serverIP: str, serverPort: int,
+                 sensorRate: float = 20.0, clientTimeout: float = 30.0,
+                 serialWorkers: int = 4, serialPorts: list = None,
+                 commandDeadline: float = 1.0, statsPort: int = None,
+                 mixOnPi: bool = False) -> None:
+        """asyncio version of the ROV server, serves the motor and sensor ports
+        from one event loop
+
+        Unlike tcpServer, any number of clients can be connected to each port
+        at the same time.
+
+        Args:
+            serverIP: IP address of this computer (device hosting the server)
+            serverPort: port that the motor server will be avaliable on,
+                sensors use serverPort + 1
+            sensorRate: readings per second taken from the sensor Arduino
+            clientTimeout: seconds without data before a client connection is
+                closed, counted from its first command
+            serialWorkers: threads available for blocking serial I/O
+            serialPorts: serial ports to probe instead of the detected USB
+                ports, e.g. from arduinoEmulator
+            commandDeadline: seconds without a motor command before the
+                thrusters are set to neutral
+            statsPort: local port serving statsReport as JSON, default is
+                serverPort + 2
+            mixOnPi: mix the setpoints into ESC values with thrustMixer, the
+                motor Arduino must support the ESC command
+
+        Returns:
+            None
+
+        Raises:
+            null
+        """
+        self.loop = None
+        self.stopEvent = None
+        self.executor = ThreadPoolExecutor(max_workers=serialWorkers,
+                                           thread_name_prefix="serial")
+        super().__init__(serverIP, serverPort, sensorRate, serialPorts,
+                         clientTimeout, commandDeadline, statsPort, mixOnPi)
+
+    async def handleClient(self, reader, writer):
+        """Serves a single client until it disconnects or times out
+
+        Args:
+            reader: asyncio StreamReader of the connection
+            writer: asyncio StreamWriter of the connection
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        clientAddress = writer.get_extra_info('peername')
+        serverPort = writer.get_extra_info('sockname')[1]
+        clientSocket = writer.get_extra_info('socket')
+        if clientSocket is not None:
+            configureClientSocket(clientSocket)
+        session = clientSession(clientAddress)
+        streamTask = None
+        replyTasks = set()
+        logging.info(f"Connection from: {clientAddress} on port {serverPort}, "
+                     f"{self.metrics.connectionOpened()} active")
+        try:
+            while self.runThreading:
+                # Subscribed clients only listen, so they are not timed out,
+                # nor is a client that has not sent its first command yet
+                timeout = (None if session.subscriber is not None
+                           or session.protocol is None
+                           else self.clientTimeout)
+                receivedData = await asyncio.wait_for(
+                    reader.read(4096), timeout)
+                if not receivedData:
+                    break
+                session.receivedAt = time.monotonic()
+                self.detectProtocol(session, receivedData)
+                if session.protocol == "text":
+                    transmitData = await self.loop.run_in_executor(
+                        self.executor, self.processChunk, session,
+                        receivedData)
+                    if transmitData:
+                        writer.write(transmitData)
+                else:
+                    receivedFrames = self.receiveFrames(session, receivedData)
+                    for receivedFrame in receivedFrames:
+                        if receivedFrame.type == fp.FRAME_MOTOR_TRACED:
+                            # Waits for the Arduino, the frames behind it are
+                            # answered in the meantime
+                            replyTask = asyncio.ensure_future(
+                                self.processTracedMotorFrameAsync(
+                                    session, receivedFrame, writer))
+                            replyTasks.add(replyTask)
+                            replyTask.add_done_callback(replyTasks.discard)
+                        else:
+                            # Setpoints are queued to the serial worker and
+                            # sensor requests read the cache, neither blocks
+                            writer.write(self.processFrame(session,
+                                                           receivedFrame))
+                await writer.drain()
+                if session.subscriber is not None and \
+                        session.subscriber is not session.streamingSubscriber:
+                    session.streamingSubscriber = session.subscriber
+                    streamTask = asyncio.ensure_future(
+                        self.streamTelemetryAsync(session.subscriber, session,
+                                                  writer))
+        except asyncio.TimeoutError:
+            logging.warning(f"{clientAddress} - No data for "
+                            f"{self.clientTimeout}s, closing connection")
+            self.metrics.countError("clientTimeout")
+        except fp.frameError as e:
+            logging.error(f"{clientAddress} - Invalid frame, dropping client: "
+                          f"{e}")
+            self.metrics.countError("invalidFrame")
+        except (ConnectionError, OSError) as e:
+            logging.error(f"{clientAddress} - Socket Error Occurred {e}")
+            self.metrics.countError("socket")
+        finally:
+            self.unsubscribeTelemetry(session)
+            if streamTask is not None:
+                streamTask.cancel()
+            for replyTask in replyTasks:
+                replyTask.cancel()
+            writer.close()
+            logging.info(f"Connection closed: {clientAddress}, "
+                         f"{self.metrics.connectionClosed()} active")
+
+    async def processTracedMotorFrameAsync(self, session, receivedFrame,
+                                           writer):
+        """Answers a traced setpoint once the Arduino has replied
+
+        Args:
+            session: clientSession of the client
+            receivedFrame: FRAME_MOTOR_TRACED frame
+            writer: asyncio StreamWriter of the connection
+
+        Returns:
+            null
+        """
+        transmitData = await self.loop.run_in_executor(
+            self.executor, self.processTracedMotorFrame, session,
+            receivedFrame, session.receivedAt)
+        try:
+            writer.write(transmitData)
+            await writer.drain()
+        except (ConnectionError, OSError) as e:
+            logging.error(f"{session.clientAddress} - Unable to send trace "
+                          f"reply {e}")
+
+    def createSubscriber(self, rate: float):
+        # Subscriptions are made by processFrame on the loop's thread
+        return asyncTelemetrySubscriber(rate, self.loop)
+
+    async def streamTelemetryAsync(self, subscriber, session, writer):
+        """Sends every reading of a subscriber until it is closed
+
+        Args:
+            subscriber: asyncTelemetrySubscriber of the client
+            session: clientSession of the client
+            writer: asyncio StreamWriter of the connection
+
+        Returns:
+            null
+        """
+        try:
+            while self.runThreading and subscriber.active:
+                reading = await subscriber.getAsync()
+                if reading is not None:
+                    writer.write(self.encodeSensorReading(
+                        reading, fp.CHANNEL_TELEMETRY, reading.sequence))
+                    await writer.drain()
+                    self.metrics.countMessage("telemetry")
+        except (ConnectionError, OSError) as e:
+            logging.error(f"{session.clientAddress} - Telemetry stream "
+                          f"stopped {e}")
+            subscriber.close()
+
+    async def serve(self):
+        """Starts the motor and sensor servers and runs until stopped
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopEvent = asyncio.Event()
+        logging.info(f"Starting asyncio servers on ports {self.motorPort} and "
+                     f"{self.sensorPort}")
+        self.sensorPoller.start()
+        self.udpMotors.start()
+        self.commandWatchdog.start()
+        if self.thrustMixer is not None:
+            self.thrustMixer.start()
+        self.statsServer.start()
+        self.latencyStats.startPeriodicDump()
+        servers = [await asyncio.start_server(self.handleClient,
+                                              self.serverIP, port)
+                   for port in (self.motorPort, self.sensorPort)]
+        try:
+            await self.stopEvent.wait()
+        finally:
+            for server in servers:
+                server.close()
+                await server.wait_closed()
+            self.sensorPoller.stop()
+            self.udpMotors.stop()
+            self.commandWatchdog.stop()
+            if self.thrustMixer is not None:
+                self.thrustMixer.stop()
+            self.statsServer.stop()
+            self.executor.shutdown(wait=False)
+            self.serialH.closeAllConnections()
+            logging.debug("asyncio servers closed")
+
+    def run(self):
+        """Runs the event loop in this thread until stopped or interrupted
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logging.warning("Keyboard Interrupt was preformed, closing "
+                            "servers")
+
+    def stopAllServices(self):
+        logging.warning("Stopping all services")
+        self.runThreading = False
+        if self.loop is None:
+            # Serial setup failed before the event loop was started
+            self.serialH.closeAllConnections()
+            quit()
+        self.loop.call_soon_threadsafe(self.stopEvent.set)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="ROV server")
+    parser.add_argument("--ip", default="10.10.2.5")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--serial-port", action="append", default=None,
+                        help="port to probe instead of the USB ports, "
+                             "repeatable, e.g. arduinoEmulator ptys")
+    parser.add_argument("--stats-port", type=int, default=None,
+                        help="local port serving the STATS report, default is "
+                             "--port + 2")
+    parser.add_argument("--log-level", default="INFO",
+                        help="DEBUG logs every connection detail, the STATS "
+                             "report does not need it")
+    parser.add_argument("--mix-on-pi", action="store_true",
+                        help="mix the thrusters with thrustMixer and send ESC "
+                             "values to the motor Arduino")
+    args = parser.parse_args()
+    logging.basicConfig(filename="log.log", encoding='utf-8',
+                        level=args.log_level.upper(),
+                        format='%(asctime)s - %(name)s - %(levelname)s - '
+                               '%(message)s')
+    c = asyncTcpServer(args.ip, args.port, serialPorts=args.serial_port,
+                       statsPort=args.stats_port, mixOnPi=args.mix_on_pi)
+    c.run()
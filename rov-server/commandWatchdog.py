@@ -0,0 +1,158 @@
+import frameProtocol as fp
+from serialCommunication import serialQueueFull
+import threading
+import logging
+import time
+
+# Every axis at zero, the thrusters ramp down to stop
+NEUTRAL_COMMAND = fp.motorPayloadToText(fp.encodeMotorPayload("D", [0] * 8))
+
+
+class commandWatchdog:
+    def __init__(self, serialH, deadline: float = 1.0,
+                 checkInterval: float = 0.05) -> None:
+        """Stops the thrusters when motor commands stop arriving
+
+        The motor Arduino keeps its last setpoint forever, so a stalled topside
+        or a hung link would leave the ROV driving. The watchdog is armed by
+        the first motor command and sends NEUTRAL_COMMAND once whenever no
+        command arrived for deadline seconds.
+
+        Args:
+            serialH: serialHandler connected to the motor Arduino
+            deadline: seconds allowed between two motor commands, longer than
+                the 0.5s topside keepalive
+            checkInterval: seconds between two checks, the worst case reaction
+                is deadline + checkInterval
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.serialH = serialH
+        self.deadline = deadline
+        self.checkInterval = checkInterval
+        self.lastCommand = None
+        self.tripped = False
+        self.missCount = 0
+        self.longestGap = 0.0
+        self.runThreading = False
+        self.watchThread = None
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts the monitoring thread
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.watchThread is not None:
+            return
+        logging.info(f"Motor command deadline {self.deadline * 1000:.0f}ms")
+        self.runThreading = True
+        self.watchThread = threading.Thread(target=self.watchCommands,
+                                            name="command-watchdog")
+        self.watchThread.daemon = True
+        self.watchThread.start()
+
+    def stop(self) -> None:
+        """Stops the monitoring thread
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.runThreading = False
+        if self.watchThread is not None:
+            self.watchThread.join(2)
+            self.watchThread = None
+
+    def submitMotorCommands(self, command: str):
+        """Queues a client's motor command and restarts the deadline, every
+        transport goes through here
+
+        Args:
+            command: motor command for the Arduino
+
+        Returns:
+            concurrent.futures.Future of the Arduino's reply, see
+            serialHandler.submitMotorCommands
+
+        Raises:
+            serialQueueFull: The motor command queue is full
+        """
+        # Queued under the lock, so a neutral setpoint can never be queued
+        # after a newer command
+        with self.lock:
+            future = self.serialH.submitMotorCommands(command)
+            now = time.monotonic()
+            if self.lastCommand is not None:
+                self.longestGap = max(self.longestGap, now - self.lastCommand)
+            if self.tripped:
+                logging.warning("Motor commands resumed after "
+                                f"{now - self.lastCommand:.2f}s")
+                self.tripped = False
+            self.lastCommand = now
+        return future
+
+    def watchCommands(self) -> None:
+        """Monitoring loop, sends the neutral setpoint when the deadline passes
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        while self.runThreading:
+            time.sleep(self.checkInterval)
+            with self.lock:
+                if self.lastCommand is None or self.tripped:
+                    continue
+                if time.monotonic() - self.lastCommand <= self.deadline:
+                    continue
+                try:
+                    self.serialH.submitMotorCommands(NEUTRAL_COMMAND)
+                except serialQueueFull as e:
+                    # Checked again on the next interval
+                    logging.error(f"Unable to queue the neutral setpoint: {e}")
+                    continue
+                self.tripped = True
+                self.missCount += 1
+            logging.warning("No motor command for "
+                            f"{self.deadline * 1000:.0f}ms, thrusters set to "
+                            f"neutral ({self.missCount} misses)")
+
+    def report(self) -> dict:
+        """Returns the deadline metrics
+
+        Args:
+            None
+
+        Returns:
+            dict with the deadline, miss count, whether the thrusters are held
+            at neutral and the longest gap seen in ms
+        """
+        with self.lock:
+            return {
+                "deadlineMs": round(self.deadline * 1000, 3),
+                "misses": self.missCount,
+                "tripped": self.tripped,
+                "longestGapMs": round(self.longestGap * 1000, 3),
+            }
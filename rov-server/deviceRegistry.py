@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+
+DEFAULT_REGISTRY_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "device_registry.json")
+
+
+def deviceKey(portInfo) -> str:
+    """Stable identity of a USB serial device
+
+    Args:
+        portInfo: ListPortInfo from serial.tools.list_ports
+
+    Returns:
+        The USB serial number, or the hwid for boards without one (hwid
+        includes the USB location)
+    """
+    return portInfo.serial_number or portInfo.hwid
+
+
+class deviceRegistry:
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH) -> None:
+        """On-disk map of USB devices to Arduino roles for a faster startup
+
+        Known boards are opened without probing.
+
+        Args:
+            path: JSON file holding the registry
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.path = path
+        self.devices = {}
+        self.load()
+
+    def load(self) -> None:
+        """Reads the registry file, empty if it is missing or corrupted
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        try:
+            with open(self.path, "r") as registryFile:
+                self.devices = json.load(registryFile)
+            logging.debug(f"Loaded {len(self.devices)} devices from "
+                          f"{self.path}")
+        except FileNotFoundError:
+            self.devices = {}
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable device registry "
+                            f"{self.path}: {e}")
+            self.devices = {}
+
+    def save(self) -> None:
+        """Writes the registry file
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        try:
+            temporaryPath = self.path + ".tmp"
+            with open(temporaryPath, "w") as registryFile:
+                json.dump(self.devices, registryFile, indent=4, sort_keys=True)
+            os.replace(temporaryPath, self.path)
+        except OSError as e:
+            logging.error(f"Unable to save device registry {self.path}: {e}")
+
+    def lookup(self, portInfo):
+        """Returns the role remembered for a device
+
+        Args:
+            portInfo: ListPortInfo from serial.tools.list_ports
+
+        Returns:
+            "MOTOR", "SENSOR" or None for unknown devices
+        """
+        entry = self.devices.get(deviceKey(portInfo))
+        return entry["role"] if entry else None
+
+    def remember(self, portInfo, role: str) -> None:
+        """Stores the role of a device, call save to persist it
+
+        Args:
+            portInfo: ListPortInfo from serial.tools.list_ports
+            role: "MOTOR" or "SENSOR"
+
+        Returns:
+            None
+        """
+        self.devices[deviceKey(portInfo)] = {
+            "role": role,
+            "lastPort": portInfo.device,
+            "description": portInfo.description,
+        }
+
+    def forget(self, portInfo) -> None:
+        """Removes a device, it will be probed on the next startup
+
+        Args:
+            portInfo: ListPortInfo from serial.tools.list_ports
+
+        Returns:
+            None
+        """
+        self.devices.pop(deviceKey(portInfo), None)
+
+    def clear(self) -> None:
+        """Removes every device
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.devices = {}
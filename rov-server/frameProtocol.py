@@ -0,0 +1,383 @@
+# Binary framing for the topside <-> ROV TCP link
+#
+# This file is shared by rov-server and topside-client, keep both copies
+# identical (checked in lint.yml).
+#
+# Every frame is a fixed header followed by a payload:
+#   magic (2s) | version (B) | type (B) | channel (B) | sequence (I) |
+#   length (H) | payload
+# Motor and sensor payloads are struct packed, everything else is utf-8 text.
+
+import struct
+import collections
+
+PROTOCOL_VERSION = 3
+FRAME_MAGIC = b"KR"
+HEADER = struct.Struct("<2sBBBIH")
+MAX_PAYLOAD = 0xFFFF
+
+# Frame types
+FRAME_MOTOR = 1           # Motor setpoint, MOTOR_PAYLOAD
+FRAME_SENSOR_REQUEST = 2  # Latest sensor values request, empty payload
+FRAME_SENSOR_DATA = 3     # Cached sensor reading, SENSOR_PAYLOAD
+FRAME_TEXT = 4            # Legacy text command wrapped in a frame
+FRAME_REPLY = 5           # Text reply to a MOTOR or TEXT frame
+FRAME_ERROR = 6           # Text error reply
+FRAME_SUBSCRIBE = 7       # Push readings to this connection, SUBSCRIBE_PAYLOAD
+FRAME_MOTOR_TRACED = 8    # Setpoint with server timings, MOTOR_PAYLOAD
+FRAME_TRACE_REPLY = 9     # TRACE_PAYLOAD followed by the Arduino's reply
+FRAME_TIME_SYNC = 10      # TIME_SYNC_PAYLOAD, replied with the server times
+
+# Channels, replies are matched to requests by (channel, sequence)
+CHANNEL_MOTOR = 0
+CHANNEL_SENSOR = 1
+CHANNEL_CONTROL = 2
+CHANNEL_TELEMETRY = 3    # Sensor readings pushed to subscribers, never a reply
+# Lower is handled first when several frames are waiting
+CHANNEL_PRIORITY = {CHANNEL_MOTOR: 0, CHANNEL_CONTROL: 1, CHANNEL_SENSOR: 2,
+                    CHANNEL_TELEMETRY: 3}
+
+# Motor payload: mode ('D' dpad or 'S' stick), x, z, rotation, y, left bumper,
+# left trigger, right bumper, right trigger
+MOTOR_PAYLOAD = struct.Struct("<c8f")
+# Sensor payload: reading sequence, age of the reading in seconds, server
+# time.time() of the reading, then humidity, enclosure temperature, leak, vin,
+# vout, current out, pmbus temperature, power out
+SENSOR_PAYLOAD = struct.Struct("<Ifd8f")
+SENSOR_FIELD_COUNT = 8
+# Subscribe payload: readings per second, 0 to unsubscribe
+SUBSCRIBE_PAYLOAD = struct.Struct("<f")
+# Trace payload, seconds spent on the server: frame received -> serial write,
+# serial write -> Arduino reply, frame received -> reply
+TRACE_PAYLOAD = struct.Struct("<fff")
+# Time sync payload, time.time() values: client send, server receive, server
+# send, the request only sets the first
+TIME_SYNC_PAYLOAD = struct.Struct("<ddd")
+
+frame = collections.namedtuple("frame",
+                               ["type", "channel", "sequence", "payload"])
+sensorSample = collections.namedtuple("sensorSample",
+                                      ["values", "sequence", "age",
+                                       "sampleTime"])
+serverTrace = collections.namedtuple("serverTrace",
+                                     ["queue", "serial", "total", "reply"])
+timeSync = collections.namedtuple("timeSync",
+                                  ["clientSent", "serverReceived",
+                                   "serverSent"])
+
+
+def framePriority(receivedFrame) -> int:
+    """Sort key putting motor frames ahead of control and sensor frames
+
+    Args:
+        receivedFrame: frame
+
+    Returns:
+        priority of the frame's channel, lower is more urgent
+    """
+    return CHANNEL_PRIORITY.get(receivedFrame.channel, len(CHANNEL_PRIORITY))
+
+
+class frameError(Exception):
+    """The received bytes do not form a valid frame."""
+    pass
+
+
+def encodeFrame(frameType: int, channel: int, sequence: int,
+                payload: bytes = b"") -> bytes:
+    """Builds a frame ready to be written to a socket
+
+    Args:
+        frameType: One of the FRAME_* constants
+        channel: One of the CHANNEL_* constants
+        sequence: Sequence number of the frame, wraps at 32 bits
+        payload: Payload bytes
+
+    Returns:
+        The encoded frame
+
+    Raises:
+        frameError: The payload does not fit in a frame
+    """
+    if len(payload) > MAX_PAYLOAD:
+        raise frameError(f"Payload of {len(payload)} bytes is too large")
+    return HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, frameType, channel,
+                       sequence & 0xFFFFFFFF, len(payload)) + payload
+
+
+def isFramedStream(data: bytes) -> bool:
+    """Checks if the first bytes of a connection belong to the binary protocol
+
+    Args:
+        data: First bytes received on the connection
+
+    Returns:
+        True if the data starts with the frame magic
+    """
+    return data[:len(FRAME_MAGIC)] == FRAME_MAGIC
+
+
+def encodeMotorPayload(mode: str, values: list) -> bytes:
+    """Packs a motor setpoint
+
+    Args:
+        mode: 'D' when the dpad is used for horizontal movement, 'S' for the
+            left stick
+        values: [x, z, rotation, y, left bumper, left trigger, right bumper,
+            right trigger]
+
+    Returns:
+        Packed payload
+    """
+    return MOTOR_PAYLOAD.pack(mode.encode('ascii'),
+                              *[float(value) for value in values])
+
+
+def decodeMotorPayload(payload: bytes):
+    """Unpacks a motor setpoint
+
+    Args:
+        payload: Packed payload
+
+    Returns:
+        (mode, values) as given to encodeMotorPayload
+
+    Raises:
+        frameError: The payload has the wrong size
+    """
+    if len(payload) != MOTOR_PAYLOAD.size:
+        raise frameError(f"Motor payload is {len(payload)} bytes, expected "
+                         f"{MOTOR_PAYLOAD.size}")
+    unpacked = MOTOR_PAYLOAD.unpack(payload)
+    return unpacked[0].decode('ascii'), list(unpacked[1:])
+
+
+def motorPayloadToText(payload: bytes) -> str:
+    """Converts a motor payload to the string understood by the motor Arduino
+
+    Args:
+        payload: Packed payload
+
+    Returns:
+        Tab and comma separated motor command, same format as the text protocol
+    """
+    mode, v = decodeMotorPayload(payload)
+    return (f"{mode}\t{v[0]:g},{v[1]:g}\t{v[2]:g},{v[3]:g}\t"
+            f"{v[4]:g},{v[5]:g},{v[6]:g},{v[7]:g}")
+
+
+def encodeSensorPayload(values: list, sequence: int = 0, age: float = 0.0,
+                        sampleTime: float = 0.0) -> bytes:
+    """Packs sensor values
+
+    Args:
+        values: SENSOR_FIELD_COUNT numbers in the order of SENSOR_PAYLOAD
+        sequence: sequence number of the reading on the server
+        age: seconds since the reading was taken
+        sampleTime: server time.time() when the reading was taken, 0 if unknown
+
+    Returns:
+        Packed payload
+    """
+    return SENSOR_PAYLOAD.pack(sequence & 0xFFFFFFFF, age, sampleTime,
+                               *[float(value) for value in values])
+
+
+def decodeSensorPayload(payload: bytes):
+    """Unpacks sensor values
+
+    Args:
+        payload: Packed payload
+
+    Returns:
+        sensorSample with a list of SENSOR_FIELD_COUNT floats
+
+    Raises:
+        frameError: The payload has the wrong size
+    """
+    if len(payload) != SENSOR_PAYLOAD.size:
+        raise frameError(f"Sensor payload is {len(payload)} bytes, expected "
+                         f"{SENSOR_PAYLOAD.size}")
+    unpacked = SENSOR_PAYLOAD.unpack(payload)
+    return sensorSample(list(unpacked[3:]), unpacked[0], unpacked[1],
+                        unpacked[2])
+
+
+def encodeSubscribePayload(rate: float) -> bytes:
+    """Packs a telemetry subscription request
+
+    Args:
+        rate: readings per second, 0 to unsubscribe
+
+    Returns:
+        Packed payload
+    """
+    return SUBSCRIBE_PAYLOAD.pack(rate)
+
+
+def decodeSubscribePayload(payload: bytes) -> float:
+    """Unpacks a telemetry subscription request
+
+    Args:
+        payload: Packed payload
+
+    Returns:
+        Requested readings per second
+
+    Raises:
+        frameError: The payload has the wrong size
+    """
+    if len(payload) != SUBSCRIBE_PAYLOAD.size:
+        raise frameError(f"Subscribe payload is {len(payload)} bytes, "
+                         f"expected {SUBSCRIBE_PAYLOAD.size}")
+    return SUBSCRIBE_PAYLOAD.unpack(payload)[0]
+
+
+def encodeTracePayload(queue: float, serial: float, total: float,
+                       reply: str) -> bytes:
+    """Packs the server timings of a traced setpoint
+
+    Args:
+        queue: seconds from frame received to serial write
+        serial: seconds from serial write to the Arduino's reply
+        total: seconds from frame received to reply
+        reply: the Arduino's reply
+
+    Returns:
+        Packed payload
+    """
+    return TRACE_PAYLOAD.pack(queue, serial, total) + reply.encode('utf-8')
+
+
+def decodeTracePayload(payload: bytes):
+    """Unpacks the server timings of a traced setpoint
+
+    Args:
+        payload: Packed payload
+
+    Returns:
+        serverTrace
+
+    Raises:
+        frameError: The payload is too short
+    """
+    if len(payload) < TRACE_PAYLOAD.size:
+        raise frameError(f"Trace payload is {len(payload)} bytes, expected at "
+                         f"least {TRACE_PAYLOAD.size}")
+    return serverTrace(*TRACE_PAYLOAD.unpack_from(payload),
+                       payload[TRACE_PAYLOAD.size:].decode('utf-8'))
+
+
+def encodeTimeSyncPayload(clientSent: float, serverReceived: float = 0.0,
+                          serverSent: float = 0.0) -> bytes:
+    """Packs the times of a clock exchange
+
+    Args:
+        clientSent: client time.time() when the request was sent
+        serverReceived: server time.time() when the request was received, 0 in
+            the request
+        serverSent: server time.time() when the reply was sent, 0 in the
+            request
+
+    Returns:
+        Packed payload
+    """
+    return TIME_SYNC_PAYLOAD.pack(clientSent, serverReceived, serverSent)
+
+
+def decodeTimeSyncPayload(payload: bytes):
+    """Unpacks the times of a clock exchange
+
+    Args:
+        payload: Packed payload
+
+    Returns:
+        timeSync
+
+    Raises:
+        frameError: The payload has the wrong size
+    """
+    if len(payload) != TIME_SYNC_PAYLOAD.size:
+        raise frameError(f"Time sync payload is {len(payload)} bytes, "
+                         f"expected {TIME_SYNC_PAYLOAD.size}")
+    return timeSync(*TIME_SYNC_PAYLOAD.unpack(payload))
+
+
+def decodeDatagram(data: bytes):
+    """Decodes a UDP datagram, which carries exactly one frame
+
+    Args:
+        data: Bytes of the datagram
+
+    Returns:
+        frame
+
+    Raises:
+        frameError: The datagram is not a single complete frame
+    """
+    decoder = frameDecoder()
+    frames = decoder.feed(data)
+    if len(frames) != 1 or decoder.buffer:
+        raise frameError(f"Datagram of {len(data)} bytes is not a single "
+                         "frame")
+    return frames[0]
+
+
+def isNewerSequence(sequence: int, lastSequence: int) -> bool:
+    """Compares 32 bit sequence numbers, allowing for wrap around
+
+    Args:
+        sequence: Sequence number just received
+        lastSequence: Newest sequence number received so far
+
+    Returns:
+        True if sequence comes after lastSequence
+    """
+    return 0 < ((sequence - lastSequence) & 0xFFFFFFFF) < 0x80000000
+
+
+class frameDecoder:
+    def __init__(self) -> None:
+        """Incremental decoder, turns a split byte stream back into frames
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """Adds received bytes and returns every frame that is now complete
+
+        Args:
+            data: Bytes received from the socket
+
+        Returns:
+            List of complete frames, may be empty
+
+        Raises:
+            frameError: The stream is corrupted or uses another protocol
+                version
+        """
+        self.buffer += data
+        frames = []
+        while len(self.buffer) >= HEADER.size:
+            (magic, version, frameType, channel, sequence,
+             length) = HEADER.unpack_from(self.buffer)
+            if magic != FRAME_MAGIC:
+                raise frameError(f"Bad frame magic {magic!r}")
+            if version != PROTOCOL_VERSION:
+                raise frameError(f"Unsupported protocol version {version}, "
+                                 f"expected {PROTOCOL_VERSION}")
+            end = HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append(frame(frameType, channel, sequence,
+                                bytes(self.buffer[HEADER.size:end])))
+            del self.buffer[:end]
+        return frames
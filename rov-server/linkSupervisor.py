@@ -0,0 +1,207 @@
+import threading
+import logging
+import random
+
+# The same file is used by the rov-server and the topside-client, keep both
+# copies identical (checked in lint.yml)
+
+# Link states
+LINK_UP = "UP"
+LINK_DOWN = "DOWN"              # Lost, a reconnect is scheduled
+LINK_CONNECTING = "CONNECTING"  # A connection attempt is running
+LINK_CLOSED = "CLOSED"          # Stopped on purpose, never reconnected
+
+
+class linkSupervisor:
+    def __init__(self, name: str, connect, initialDelay: float = 0.5,
+                 maxDelay: float = 10.0, jitter: float = 0.5) -> None:
+        """Reconnects a serial or TCP link in the background with exponential
+        backoff and jitter
+
+        Command paths check isUp and fail fast while the link is down instead
+        of reconnecting inline. The owner reports failures with linkDown, the
+        supervisor thread then calls connect until it succeeds, waiting
+        initialDelay, 2 * initialDelay, ... up to maxDelay between attempts.
+
+        Args:
+            name: name of the link in the logs
+            connect: callable opening the link, returns True when connected,
+                False or an exception otherwise
+            initialDelay: seconds before the first reconnect attempt
+            maxDelay: longest wait between two attempts
+            jitter: fraction of every wait that is randomised, so links lost
+                together do not retry together
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.name = name
+        self.connect = connect
+        self.initialDelay = initialDelay
+        self.maxDelay = maxDelay
+        self.jitter = jitter
+        self.state = LINK_DOWN
+        self.lastError = None
+        self.reconnectCount = 0
+        self.failureCount = 0
+        self.condition = threading.Condition()
+        self.reconnectThread = None
+
+    def isUp(self) -> bool:
+        return self.state == LINK_UP
+
+    def linkUp(self) -> None:
+        """Marks the link as connected, called after the first connection
+
+        Ignored during a reconnect attempt, the result of connect decides.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            if self.state in (LINK_CLOSED, LINK_CONNECTING):
+                return
+            self.state = LINK_UP
+            self.lastError = None
+            self.condition.notify_all()
+
+    def linkDown(self, reason: str) -> None:
+        """Marks the link as lost and reconnects in the background
+
+        Args:
+            reason: why the link was lost, kept in lastError
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            if self.state == LINK_CLOSED:
+                return
+            if self.state == LINK_UP:
+                logging.warning(f"{self.name} link lost: {reason}")
+                self.failureCount += 1
+                self.state = LINK_DOWN
+                self.lastError = reason
+            elif self.lastError is None:
+                self.lastError = reason
+            if self.reconnectThread is None:
+                self.reconnectThread = threading.Thread(
+                    target=self.reconnectLoop, name=f"reconnect-{self.name}")
+                self.reconnectThread.daemon = True
+                self.reconnectThread.start()
+
+    def waitUp(self, timeout: float = None) -> bool:
+        """Blocks until the link is up
+
+        Args:
+            timeout: seconds to wait, None waits until the link is up or closed
+
+        Returns:
+            True if the link is up
+
+        Raises:
+            None
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.state in (LINK_UP, LINK_CLOSED), timeout)
+            return self.state == LINK_UP
+
+    def close(self) -> None:
+        """Stops reconnecting, the owner closes the link itself
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            self.state = LINK_CLOSED
+            reconnectThread = self.reconnectThread
+            self.condition.notify_all()
+        if reconnectThread is not None and \
+                reconnectThread is not threading.current_thread():
+            reconnectThread.join(2)
+
+    def nextDelay(self, attempt: int) -> float:
+        delay = min(self.maxDelay, self.initialDelay * 2 ** attempt)
+        return delay * (1.0 - self.jitter * random.random())
+
+    def reconnectLoop(self) -> None:
+        """Reconnect thread, calls connect with backoff until it succeeds or
+        the supervisor is closed
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        attempt = 0
+        while True:
+            with self.condition:
+                # close wakes the wait up
+                self.condition.wait_for(lambda: self.state == LINK_CLOSED,
+                                        self.nextDelay(attempt))
+                if self.state == LINK_CLOSED:
+                    self.reconnectThread = None
+                    return
+                self.state = LINK_CONNECTING
+            attempt += 1
+            try:
+                connected = self.connect()
+            except Exception as e:
+                connected = False
+                self.lastError = str(e)
+            with self.condition:
+                if self.state == LINK_CLOSED:
+                    self.reconnectThread = None
+                    return
+                if connected:
+                    logging.info(f"{self.name} link reconnected after "
+                                 f"{attempt} attempts")
+                    self.reconnectCount += 1
+                    self.state = LINK_UP
+                    self.lastError = None
+                    self.reconnectThread = None
+                    self.condition.notify_all()
+                    return
+                self.state = LINK_DOWN
+            logging.debug(f"{self.name} reconnect attempt {attempt} failed: "
+                          f"{self.lastError}")
+
+    def report(self) -> dict:
+        """Returns the link state and counters
+
+        Args:
+            None
+
+        Returns:
+            dict with the state, the number of failures and reconnects, and the
+            last error
+        """
+        return {
+            "state": self.state,
+            "failures": self.failureCount,
+            "reconnects": self.reconnectCount,
+            "lastError": self.lastError,
+        }
@@ -0,0 +1,78 @@
+# Lists available serial com ports and device names
+#
+# python listPorts.py
+#   lists the ports and the role remembered in the device registry
+# python listPorts.py --refresh
+#   probes every Arduino port and rewrites the registry
+# python listPorts.py --clear
+#   empties the registry, the next server start probes every port
+
+
+import argparse
+import serial.tools.list_ports
+from deviceRegistry import deviceRegistry, deviceKey, DEFAULT_REGISTRY_PATH
+from serialHandler import serialHandler, unableToConnectToArduino
+
+
+def isArduinoPort(port):
+    # For Raspbery Pi
+    return ("/dev/ttyUSB" in port) or ("/dev/ttyACM" in port)
+
+
+def printPorts(registry):
+    ports = serial.tools.list_ports.comports()
+    for portInfo in sorted(ports):
+        role = registry.lookup(portInfo) or "unknown"
+        print(f"{portInfo.device}\t{role}\t{deviceKey(portInfo)}\t"
+              f"{portInfo.description}")
+
+
+def printRegistry(registry):
+    print(f"Registry {registry.path}")
+    for key, entry in sorted(registry.devices.items()):
+        print(f"{entry['role']}\t{entry.get('lastPort', '')}\t{key}")
+
+
+def refreshRegistry(registry):
+    handler = serialHandler(registry.path)
+    ports = serial.tools.list_ports.comports()
+    for portInfo in sorted(ports):
+        if not isArduinoPort(portInfo.device):
+            continue
+        try:
+            typeData, temp = handler.probePort(portInfo.device)
+        except unableToConnectToArduino as e:
+            print(e)
+            continue
+        temp.closeConnection()
+        if typeData in ("MOTOR", "SENSOR"):
+            print(f"{typeData} Arduino at {portInfo.device}")
+            registry.remember(portInfo, typeData)
+        else:
+            print(f"Unknown Serial Device at {portInfo.device}, "
+                  f"'{typeData}'")
+            registry.forget(portInfo)
+    registry.save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="List serial ports and "
+                                                 "manage the Arduino device "
+                                                 "registry")
+    parser.add_argument("--registry", default=DEFAULT_REGISTRY_PATH,
+                        help="registry file")
+    parser.add_argument("--refresh", action="store_true",
+                        help="probe every Arduino port and update the "
+                             "registry")
+    parser.add_argument("--clear", action="store_true",
+                        help="remove every device from the registry")
+    args = parser.parse_args()
+
+    registry = deviceRegistry(args.registry)
+    if args.clear:
+        registry.clear()
+        registry.save()
+    if args.refresh:
+        refreshRegistry(registry)
+    printPorts(registry)
+    printRegistry(registry)
@@ -0,0 +1,346 @@
+import frameProtocol as fp
+import collections
+import asyncio
+import threading
+import logging
+import time
+
+# values: parsed sensor values, raw: reply of the Arduino, timestamp:
+# time.monotonic() when the reply was received, sequence: increments for every
+# new reading
+sensorReading = collections.namedtuple("sensorReading",
+                                       ["values", "raw", "timestamp",
+                                        "sequence"])
+
+
+def parseSensorData(data: str) -> list:
+    """Parses the tab separated reply of the sensor Arduino
+
+    Args:
+        data: reply of the sensor Arduino
+
+    Returns:
+        list of sensor values
+
+    Raises:
+        ValueError: The reply does not contain the expected values
+    """
+    values = [float(value) for value in data.split("\t")]
+    if len(values) != fp.SENSOR_FIELD_COUNT:
+        raise ValueError(f"Expected {fp.SENSOR_FIELD_COUNT} sensor values, "
+                         f"received '{data}'")
+    return values
+
+
+class sensorPoller:
+    def __init__(self, serialH, pollRate: float = 20.0) -> None:
+        """Samples the sensor Arduino in the background and caches readings
+
+        Args:
+            serialH: serialHandler connected to the sensor Arduino
+            pollRate: readings per second requested from the Arduino
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.serialH = serialH
+        self.pollInterval = 1.0 / pollRate
+        self.reading = None
+        self.sequence = 0
+        self.errorCount = 0
+        self.runThreading = False
+        self.pollThread = None
+        self.listeners = []
+
+    def start(self) -> None:
+        """Starts the polling thread
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.pollThread is not None:
+            return
+        logging.info("Starting sensor poller every "
+                     f"{self.pollInterval * 1000:.0f}ms")
+        self.runThreading = True
+        self.pollThread = threading.Thread(target=self.pollSensors,
+                                           name="sensor-poller")
+        self.pollThread.daemon = True
+        self.pollThread.start()
+
+    def stop(self) -> None:
+        """Stops the polling thread
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.runThreading = False
+        if self.pollThread is not None:
+            self.pollThread.join(2)
+            self.pollThread = None
+
+    def latest(self):
+        """Returns the cached reading without touching the serial port
+
+        Args:
+            None
+
+        Returns:
+            The latest sensorReading, None until the first successful reading
+
+        Raises:
+            None
+        """
+        return self.reading
+
+    def addListener(self, callback) -> None:
+        """Registers a function called with every reading on the poll thread
+
+        Args:
+            callback: function taking a sensorReading, it must not block
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.listeners = self.listeners + [callback]
+
+    def removeListener(self, callback) -> None:
+        """Unregisters a function added with addListener
+
+        Args:
+            callback: function given to addListener
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.listeners = [listener for listener in self.listeners
+                          if listener != callback]
+
+    def pollSensors(self) -> None:
+        """Polling loop, keeps a fixed rate regardless of how long the Arduino
+        takes to reply
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        nextPoll = time.monotonic()
+        while self.runThreading:
+            # Nothing to poll while the serial link reconnects, the cached
+            # reading ages meanwhile
+            if not self.serialH.sensorLinkUp():
+                time.sleep(self.pollInterval)
+                nextPoll = time.monotonic()
+                continue
+            try:
+                raw = self.serialH.sendSensorCommands("GET")
+                values = parseSensorData(raw)
+                self.sequence += 1
+                # Readers get the whole tuple at once, no lock is needed
+                self.reading = sensorReading(values, raw, time.monotonic(),
+                                             self.sequence)
+                for listener in self.listeners:
+                    listener(self.reading)
+            except Exception as e:
+                self.errorCount += 1
+                logging.error(f"Sensor poll failed ({self.errorCount} "
+                              f"errors): {e}")
+
+            nextPoll += self.pollInterval
+            delay = nextPoll - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Serial is slower than the requested rate, do not catch up
+                nextPoll = time.monotonic()
+
+
+class telemetrySubscriber:
+    def __init__(self, rate: float, bufferSize: int = 8) -> None:
+        """Per client buffer of readings pushed by the sensorPoller
+
+        The buffer is bounded and drops the oldest reading when full, so a slow
+        client never holds up the poller or the other subscribers.
+
+        Args:
+            rate: readings per second wanted by the client, 0 for every reading
+            bufferSize: readings kept while the client is busy
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.buffer = collections.deque(maxlen=bufferSize)
+        self.condition = threading.Condition()
+        self.nextDue = 0.0
+        self.droppedCount = 0
+        self.active = True
+
+    def offer(self, reading) -> None:
+        """Adds a reading if it is due at the requested rate
+
+        Args:
+            reading: the new sensorReading
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        # Readings a little early are still sent so poll jitter does not skip
+        # every other reading
+        if reading.timestamp < self.nextDue - self.interval / 4:
+            return
+        if reading.timestamp - self.nextDue < self.interval:
+            self.nextDue += self.interval
+        else:
+            self.nextDue = reading.timestamp + self.interval
+        self.deliver(reading)
+
+    def deliver(self, reading) -> None:
+        """Buffers a due reading for get, called by the poller
+
+        Args:
+            reading: the new sensorReading
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.droppedCount += 1
+            self.buffer.append(reading)
+            self.condition.notify()
+
+    def get(self, timeout: float = None):
+        """Waits for the next reading
+
+        Args:
+            timeout: seconds to wait, None waits until a reading arrives or the
+                subscriber is closed
+
+        Returns:
+            The oldest buffered sensorReading, None on timeout or once closed
+
+        Raises:
+            None
+        """
+        with self.condition:
+            if not self.buffer and self.active:
+                self.condition.wait(timeout)
+            if not self.buffer or not self.active:
+                return None
+            return self.buffer.popleft()
+
+    def close(self) -> None:
+        """Wakes up and stops the consumer
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.condition:
+            self.active = False
+            self.condition.notify_all()
+
+
+class asyncTelemetrySubscriber(telemetrySubscriber):
+    def __init__(self, rate: float, loop, bufferSize: int = 8) -> None:
+        """Subscriber whose readings are awaited on an event loop
+
+        The poller hands every due reading to the loop with
+        call_soon_threadsafe, so no executor thread waits for readings. Must be
+        created on the loop's thread.
+
+        Args:
+            rate: readings per second wanted by the client, 0 for every reading
+            loop: event loop of the consumer
+            bufferSize: readings kept while the client is busy
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        super().__init__(rate, bufferSize)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=bufferSize)
+
+    def deliver(self, reading) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self.enqueue, reading)
+        except RuntimeError:
+            # The loop is closed, the server is stopping
+            self.active = False
+
+    def enqueue(self, reading) -> None:
+        """Adds a reading, or None to wake the consumer, on the loop thread
+
+        Args:
+            reading: sensorReading, None once closed
+
+        Returns:
+            None
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+            if reading is not None:
+                self.droppedCount += 1
+        self.queue.put_nowait(reading)
+
+    async def getAsync(self):
+        """Waits for the next reading
+
+        Args:
+            None
+
+        Returns:
+            The oldest buffered sensorReading, None once closed
+        """
+        if not self.active:
+            return None
+        reading = await self.queue.get()
+        return reading if self.active else None
+
+    def close(self) -> None:
+        self.active = False
+        self.deliver(None)
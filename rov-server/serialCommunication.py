@@ -1,16 +1,34 @@
+from concurrent.futures import Future
+from linkSupervisor import linkSupervisor
+from latencyStats import latencyStats
+import serialFrames
 import serial
+import collections
 import logging
+import threading
 import time
 
+# Binary exchanges in a row without a valid reply before the link is reset,
+# e.g. the Arduino rebooted into text mode
+MAX_FRAME_FAILURES = 3
+
+
+class serialQueueFull(Exception):
+    """The command queue of the serial worker is full."""
+    pass
 
 
 class arduinoCom:
-    def __init__(self, comPort: str, baudRate: int) -> None:
+    def __init__(self, comPort: str, baudRate: int,
+                 fastBaudRate: int = None) -> None:
         """Comunication Protocol for Arduino <-> Raspberry Pi
 
         Args:
             comPort: Communication port path for Specificed Arduino
             baudRate: Baudrate for SerialPort 
+            fastBaudRate: Baudrate negotiated after connecting together with
+                binary frames, see serialFrames. None keeps the text protocol
+                at baudRate
 
         Returns:
             None
@@ -20,43 +38,409 @@ class arduinoCom:
         """
         self.comPort = comPort
         self.baudRate = baudRate
+        self.serialConnection = None
+        # Serializes access to the port when several clients share this Arduino
+        self.lock = threading.Lock()
+        # Serial worker, see startWorker
+        self.workerThread = None
+        self.workerCondition = threading.Condition()
+        self.commandQueue = collections.deque()
+        self.queueSize = 0
+        self.latestCommand = None
+        # Binary frames, see negotiateMode
+        self.fastBaudRate = fastBaudRate
+        self.binaryMode = False
+        self.frameDecoder = serialFrames.serialFrameDecoder()
+        self.frameFailures = 0
+        # Reopens the port in the background after a serial error, commands
+        # fail fast meanwhile
+        self.supervisor = linkSupervisor(comPort, self.reconnect)
+        # Worker metrics, see report
+        self.roundTrips = latencyStats()
+        self.errorCount = 0
+        self.droppedCount = 0
         logging.debug(f"New arduino {comPort} at {baudRate}")
 
-
-    def startConnection(self):
+    def startConnection(self, cancelEvent: threading.Event = None,
+                        readyTimeout: float = 10.0, resetBoard: bool = True,
+                        expectedType: str = None):
         """Establishes Connection with the Arduino through Serial
 
         Args:
-            None
+            cancelEvent: Aborts the wait for READY when set, used by parallel
+                discovery
+            readyTimeout: Seconds to wait for the Arduino to send READY
+            resetBoard: When False, DTR is held low so opening the port does
+                not reboot the Arduino and the READY wait is skipped, used for
+                boards that are already running
+            expectedType: Without reset, reply the board must give to TYPE
+                before the mode is negotiated, a board that rebooted anyway
+                answers READY or nothing
 
         Returns:
-            None
+            True if the port was opened, False if it is unavailable, the wait
+            was cancelled or the board did not answer expectedType
 
         Raises:
             None
         """
         try:
+            if not resetBoard:
+                # Best effort, some USB adapters still pulse DTR when the port
+                # is opened
+                self.serialConnection = serial.Serial(timeout=5)
+                self.serialConnection.port = self.comPort
+                self.serialConnection.baudrate = self.baudRate
+                self.serialConnection.dtr = False
+                self.serialConnection.open()
+                self.serialConnection.reset_input_buffer()
+                logging.info(f"Connected to {self.comPort} at {self.baudRate} "
+                             "without reset")
+                if expectedType is not None:
+                    # MODE sent to a board in its bootloader would be lost and
+                    # a late READY taken as a reply
+                    typeData = self.queryType()
+                    if typeData != expectedType:
+                        logging.warning(f"{self.comPort} answered "
+                                        f"'{typeData}' instead of "
+                                        f"{expectedType} without reset")
+                        self.closeConnection()
+                        return False
+                self.negotiateMode()
+                self.supervisor.linkUp()
+                return True
             self.serialConnection = serial.Serial(self.comPort, self.baudRate, timeout=5)
             self.serialConnection.flush()
             logging.info(f"Connected to {self.comPort} at {self.baudRate}")
-            timeout = 0
-            while timeout < 10:
-                serialFeedback = self.serialConnection.readline().decode('utf-8').rstrip()
+            # Short reads while waiting so a cancel is noticed quickly
+            self.serialConnection.timeout = 0.5
+            deadline = time.monotonic() + readyTimeout
+            while time.monotonic() < deadline:
+                if cancelEvent is not None and cancelEvent.is_set():
+                    logging.debug(f"Connection to {self.comPort} cancelled")
+                    self.closeConnection()
+                    return False
+                serialFeedback = self.serialConnection.readline().decode(
+                    'utf-8', errors='replace').rstrip()
                 if(serialFeedback == "READY"):
                     logging.debug(f"Arduino at {self.comPort} READY")
                     break
-                timeout += 1
+            self.serialConnection.timeout = 5
             # TODO : Needs not ready error
+            self.negotiateMode()
+            self.supervisor.linkUp()
             return True
         except serial.SerialException as e:
             logging.error(f"Device not available to {self.comPort} at {self.baudRate} Exception: {e}")
             return False
 
+    def reconnect(self) -> bool:
+        """Reopens the port from the supervisor thread while the link is down
+
+        Args:
+            None
+
+        Returns:
+            True if the Arduino is connected again
+
+        Raises:
+            None
+        """
+        # The port is not locked while waiting for READY, commands fail fast as
+        # the link is not up
+        with self.lock:
+            if self.serialConnection is not None:
+                self.closeConnection()
+        if not self.startConnection():
+            return False
+        # The port can open while USB re-enumerates without a working Arduino
+        # behind it
+        try:
+            if self.binaryMode:
+                reply = self.exchangeFrame("TYPE")
+            else:
+                self.serialConnection.write("TYPE\n".encode('utf-8'))
+                reply = self.serialConnection.readline().decode(
+                    'utf-8', errors='replace').rstrip()
+        except (serial.SerialException, serialFrames.serialFrameError) as e:
+            reply = ""
+            logging.debug(f"{self.comPort} - TYPE failed after reconnecting: "
+                          f"{e}")
+        if reply == "":
+            self.closeConnection()
+            return False
+        return True
+
+    def queryType(self, timeout: float = 0.5) -> str:
+        """Asks a text mode Arduino for its type without waiting for READY
+
+        Args:
+            timeout: Seconds to wait for the reply, a running board answers
+                within milliseconds
+
+        Returns:
+            The Arduino's reply, empty if none arrived
+
+        Raises:
+            serial.SerialException: The port failed
+        """
+        self.serialConnection.timeout = timeout
+        try:
+            self.serialConnection.write("TYPE\n".encode('utf-8'))
+            return self.serialConnection.readline().decode(
+                'utf-8', errors='replace').rstrip()
+        finally:
+            self.serialConnection.timeout = 5
+
+    def negotiateMode(self) -> bool:
+        """Asks the Arduino to switch to fastBaudRate and binary frames
+
+        Firmware without frame support answers something else and the text
+        protocol is kept.
+
+        Args:
+            None
+
+        Returns:
+            True if binary frames are in use
+
+        Raises:
+            serial.SerialException: The port failed during the handshake
+        """
+        self.binaryMode = False
+        if self.fastBaudRate is None:
+            return False
+        request = f"MODE {self.fastBaudRate}"
+        self.serialConnection.timeout = 1.0
+        try:
+            self.serialConnection.write((request + "\n").encode('utf-8'))
+            reply = self.serialConnection.readline().decode(
+                'utf-8', errors='replace').rstrip()
+            if reply != request:
+                logging.info(f"{self.comPort} does not support binary frames "
+                             f"('{reply}'), using text at {self.baudRate}")
+                return False
+            # The Arduino switches as soon as its reply is sent
+            self.serialConnection.baudrate = self.fastBaudRate
+            self.serialConnection.reset_input_buffer()
+            self.frameDecoder.reset()
+            self.binaryMode = True
+            if self.exchangeFrame(serialFrames.PING_COMMAND) == "PONG":
+                logging.info(f"{self.comPort} using binary frames at "
+                             f"{self.fastBaudRate}")
+                return True
+            logging.warning(f"{self.comPort} did not answer at "
+                            f"{self.fastBaudRate}, using text at "
+                            f"{self.baudRate}")
+        except serialFrames.serialFrameError as e:
+            logging.warning(f"{self.comPort} did not answer at "
+                            f"{self.fastBaudRate}, using text at "
+                            f"{self.baudRate}: {e}")
+        finally:
+            self.serialConnection.timeout = 5
+        # The Arduino goes back to text mode once it has not received a frame
+        # for LINK_TIMEOUT
+        self.binaryMode = False
+        self.serialConnection.baudrate = self.baudRate
+        time.sleep(serialFrames.LINK_TIMEOUT + 0.2)
+        self.serialConnection.reset_input_buffer()
+        return False
+
+    def exchangeFrame(self, data: str) -> str:
+        """Sends a text command as a binary frame and translates the reply, the
+        port must be locked by the caller
+
+        Args:
+            data: The data that is being send to the Arduino
+
+        Returns:
+            The Arduinos's response in the text protocol
+
+        Raises:
+            serialFrameError: No valid reply before the port timeout
+        """
+        frame = serialFrames.commandToFrame(data.rstrip("\r\n"))
+        # The type byte follows the start byte, the reply sets REPLY_FLAG on it
+        replyType = frame[1] | serialFrames.REPLY_FLAG
+        self.serialConnection.write(frame)
+        deadline = time.monotonic() + self.serialConnection.timeout
+        while time.monotonic() < deadline:
+            received = self.serialConnection.read(
+                max(1, self.serialConnection.in_waiting))
+            for frameType, payload in self.frameDecoder.feed(received):
+                if frameType in (replyType, serialFrames.SERIAL_ERROR):
+                    return serialFrames.frameToReply(frameType, payload)
+                # Late reply to an exchange that timed out, answering with it
+                # would shift every later reply
+                logging.debug(f"{self.comPort} - Discarding reply frame "
+                              f"0x{frameType:02X}, expected 0x{replyType:02X}")
+        self.frameDecoder.reset()
+        raise serialFrames.serialFrameError("No reply frame from "
+                                            f"{self.comPort}")
 
+    def startWorker(self, queueSize: int = 16) -> None:
+        """Starts the thread that owns all serial I/O with this Arduino
 
-        
+        Once started, commands go through submit and sendData waits on
+        the worker.
 
-        
+        Args:
+            queueSize: Maximum number of queued commands, latest-wins commands
+                do not count
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.workerThread is not None:
+            return
+        self.queueSize = queueSize
+        self.workerThread = threading.Thread(target=self.serialWorker,
+                                             name=f"serial-{self.comPort}")
+        self.workerThread.daemon = True
+        self.workerThread.start()
+        logging.debug(f"Started serial worker for {self.comPort}")
+
+    def stopWorker(self) -> None:
+        """Stops the serial worker, queued commands are cancelled
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        with self.workerCondition:
+            workerThread = self.workerThread
+            self.workerThread = None
+            pending = list(self.commandQueue)
+            self.commandQueue.clear()
+            if self.latestCommand is not None:
+                pending.append(self.latestCommand)
+                self.latestCommand = None
+            self.workerCondition.notify_all()
+        for data, future in pending:
+            future.cancel()
+        if workerThread is not None and \
+                workerThread is not threading.current_thread():
+            workerThread.join(2)
+
+    def submit(self, data: str, latestWins: bool = False) -> Future:
+        """Queues data for the Arduino without waiting for the round trip
+
+        Args:
+            data: The data that is being send to the Arduino
+            latestWins: Replaces the previous latest-wins command if it has not
+                been written yet, used for motor setpoints where only the
+                newest value matters
+
+        Returns:
+            Future resolving to the Arduino's response, superseded commands
+            resolve to "DROPPED"
+
+        Raises:
+            serialQueueFull: Too many commands are waiting for the serial port
+        """
+        if self.workerThread is None:
+            self.startWorker()
+        future = Future()
+        superseded = None
+        with self.workerCondition:
+            if latestWins:
+                superseded = self.latestCommand
+                self.latestCommand = (data, future)
+            elif len(self.commandQueue) >= self.queueSize:
+                raise serialQueueFull(f"{self.comPort} has "
+                                      f"{len(self.commandQueue)} queued "
+                                      "commands")
+            else:
+                self.commandQueue.append((data, future))
+            self.workerCondition.notify()
+        if superseded is not None and \
+                superseded[1].set_running_or_notify_cancel():
+            self.droppedCount += 1
+            superseded[1].set_result("DROPPED")
+        return future
+
+    def serialWorker(self) -> None:
+        """Writes queued commands to the Arduino, latest-wins commands go first
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        while True:
+            with self.workerCondition:
+                while self.workerThread is threading.current_thread() and \
+                        not self.commandQueue and self.latestCommand is None:
+                    # In binary mode an idle link is kept alive, the Arduino
+                    # would fall back to text mode. The wait is timed in text
+                    # mode too, a reconnect can switch the link to binary
+                    # meanwhile
+                    woken = self.workerCondition.wait(
+                        serialFrames.KEEPALIVE_INTERVAL)
+                    if not woken and self.binaryMode:
+                        break
+                if self.workerThread is not threading.current_thread():
+                    return
+                if self.latestCommand is not None:
+                    data, future = self.latestCommand
+                    self.latestCommand = None
+                elif self.commandQueue:
+                    data, future = self.commandQueue.popleft()
+                else:
+                    data, future = serialFrames.PING_COMMAND, Future()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # Timestamps for latency tracing, set before the result so
+                # waiters always see them
+                future.writeStarted = time.monotonic()
+                reply = self.exchangeData(data)
+                future.replied = time.monotonic()
+                if reply == "ERROR":
+                    self.errorCount += 1
+                else:
+                    self.roundTrips.record(
+                        "roundTrip", future.replied - future.writeStarted)
+                future.set_result(reply)
+            except Exception as e:
+                logging.error(f"{self.comPort} - Serial worker error: {e}")
+                future.set_exception(e)
+
+    def report(self) -> dict:
+        """Returns the worker and link metrics
+
+        Args:
+            None
+
+        Returns:
+            dict with the port, protocol, queued commands, error and drop
+            counts, round trip percentiles and link state
+        """
+        with self.workerCondition:
+            queued = len(self.commandQueue) + (self.latestCommand is not None)
+        return {
+            "port": self.comPort,
+            "binary": self.binaryMode,
+            "queued": queued,
+            "errors": self.errorCount,
+            "dropped": self.droppedCount,
+            "corruptFrames": self.frameDecoder.errorCount,
+            "roundTripMs": self.roundTrips.report().get(
+                "roundTrip", {"count": 0}),
+            "link": self.supervisor.report(),
+        }
 
     def sendData(self, data: str) -> str:
         """Sends and recives data from the Arduino
@@ -70,35 +454,74 @@ class arduinoCom:
         Raises:
             None
         """
-        # Verifies if there is an active connection
-        if(self.serialConnection == None):
-            logging.warning(f"Attempting reconnection on {self.comPort}")
-            self.startConnection()
+        workerThread = self.workerThread
+        if workerThread is not None and \
+                workerThread is not threading.current_thread():
+            return self.submit(data).result()
+        return self.exchangeData(data)
 
-        # Send data to arduino
-        try:
-            sendString = data if data.endswith("\n") else data + "\n"
-            self.serialConnection.write(sendString.encode('utf-8'))
-            serialFeedback = self.serialConnection.readline().decode('utf-8').rstrip()
-            return serialFeedback
-
-        # Exception handling for Serial Communication Issue
-        except serial.SerialTimeoutException as e:
-            logging.error(f"{self.comPort} - SerialTimeoutException - Exception: {e}")
-            if(not(self.serialConnection == None)):
-                self.closeConnection()
-            return "ERROR"
-        except serial.SerialException as e:
-            logging.error(f"{self.comPort} - SerialException - Exception: {e}")
-            if(not(self.serialConnection == None)):
-                self.closeConnection()
-            return "ERROR"
-        # Exception for Serial Object not being available
-        except AttributeError:
-            logging.error(f"{self.comPort} - Object not available")
-            return "ERROR"
-            
+    def exchangeData(self, data: str) -> str:
+        """Writes data to the Arduino and reads its reply on the calling thread
+
+        Args:
+            data: The data that is being send to the Arduino
+
+        Returns:
+            The Arduinos's response
+
+        Raises:
+            None
+        """
+        with self.lock:
+            # Fails fast while the supervisor reconnects, reopening the port
+            # can take seconds
+            if not self.supervisor.isUp() or self.serialConnection is None:
+                self.supervisor.linkDown("not connected")
+                return "ERROR"
+
+            # Send data to arduino
+            try:
+                if self.binaryMode:
+                    reply = self.exchangeFrame(data)
+                    self.frameFailures = 0
+                    return reply
+                sendString = data if data.endswith("\n") else data + "\n"
+                self.serialConnection.write(sendString.encode('utf-8'))
+                serialFeedback = self.serialConnection.readline().decode(
+                    'utf-8', errors='replace').rstrip()
+                return serialFeedback
+
+            except serialFrames.serialFrameError as e:
+                logging.error(f"{self.comPort} - {e}, "
+                              f"{self.frameDecoder.errorCount} corrupted "
+                              "frames so far")
+                self.frameFailures += 1
+                if self.frameFailures >= MAX_FRAME_FAILURES:
+                    self.frameFailures = 0
+                    self.closeConnection()
+                    self.supervisor.linkDown(f"{MAX_FRAME_FAILURES} binary "
+                                             "exchanges without a reply")
+                return "ERROR"
 
+            # Exception handling for Serial Communication Issue
+            except serial.SerialTimeoutException as e:
+                logging.error(f"{self.comPort} - SerialTimeoutException - "
+                              f"Exception: {e}")
+                if self.serialConnection is not None:
+                    self.closeConnection()
+                self.supervisor.linkDown(str(e))
+                return "ERROR"
+            except serial.SerialException as e:
+                logging.error(f"{self.comPort} - SerialException - Exception: "
+                              f"{e}")
+                if self.serialConnection is not None:
+                    self.closeConnection()
+                self.supervisor.linkDown(str(e))
+                return "ERROR"
+            # Exception for Serial Object not being available
+            except AttributeError:
+                logging.error(f"{self.comPort} - Object not available")
+                return "ERROR"
 
     def closeConnection(self) -> None:
         """Closes Connection with the Arduino
@@ -110,7 +533,22 @@ class arduinoCom:
         Raises:
             none
         """
+        if self.serialConnection is None:
+            return
         logging.info(f"Closing connection with {self.comPort}")
+        if self.binaryMode:
+            # Lets the next connection start in text mode without waiting for
+            # LINK_TIMEOUT
+            self.binaryMode = False
+            try:
+                self.serialConnection.timeout = 0.2
+                textMode = serialFrames.encodeSerialFrame(
+                    serialFrames.SERIAL_TEXT_MODE)
+                self.serialConnection.write(textMode)
+                self.serialConnection.read(4)
+            except serial.SerialException as e:
+                logging.debug(f"{self.comPort} - Unable to restore text mode: "
+                              f"{e}")
         self.serialConnection.close()
         self.serialConnection = None
 
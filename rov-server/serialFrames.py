@@ -0,0 +1,252 @@
+# Binary frames between the Raspberry Pi and the enclosure Arduinos
+#
+# Both Arduinos start in text mode at 9600 baud. After READY the Pi sends
+# "MODE <baud>", firmware that supports frames answers with the same line and
+# switches to <baud> and binary frames:
+#   start (0xA5) | type (B) | payload length (B) | payload |
+#   CRC-8 of type, length and payload
+# Replies use the request type with REPLY_FLAG set. Without a valid frame for
+# LINK_TIMEOUT the Arduino goes back to text mode at 9600, so the Pi sends PING
+# while the link is idle. The constants and the CRC are repeated in
+# enclosure-motors.ino and enclosure-sensors.ino, keep them in sync.
+#
+# arduinoCom keeps its text interface, commands and replies are
+# translated here.
+
+import struct
+
+FRAME_START = 0xA5
+MAX_PAYLOAD = 64
+TEXT_BAUD_RATE = 9600
+LINK_TIMEOUT = 2.0
+KEEPALIVE_INTERVAL = 0.5
+
+# Frame types
+SERIAL_MOTOR = 0x01          # Motor setpoint, MOTOR_PAYLOAD, reply is empty
+# Sensor reading request, empty, reply is SENSOR_PAYLOAD
+SERIAL_SENSOR_REQUEST = 0x02
+SERIAL_TEXT = 0x03           # Text command such as TYPE, reply is text
+SERIAL_PING = 0x04           # Keeps the link in binary mode, empty
+# Return to text mode at 9600 once the reply is sent, empty
+SERIAL_TEXT_MODE = 0x05
+# ESC values mixed on the Pi, ESC_PAYLOAD, reply is empty
+SERIAL_ESC = 0x06
+REPLY_FLAG = 0x80
+SERIAL_ERROR = 0xFF          # Reply to an unknown frame type, empty
+
+# Motor payload: mode ('D' or 'S') then x, z, rotation, y, left bumper, left
+# trigger, right bumper, right trigger in thousandths
+MOTOR_PAYLOAD = struct.Struct("<c8h")
+MOTOR_SCALE = 1000
+# ESC payload: x, y, zl, zr ESC values then the claw state (-1 closing, 0
+# still, 1 opening), see thrustMixer
+ESC_PAYLOAD = struct.Struct("<4Bb")
+ESC_COMMAND = "ESC"
+# Sensor payload: humidity, enclosure temperature, leak, vin, vout, current
+# out, pmbus temperature, power out
+SENSOR_PAYLOAD = struct.Struct("<8f")
+
+# Text command sent to the worker to ping the Arduino
+PING_COMMAND = "PING"
+
+
+class serialFrameError(Exception):
+    """No valid frame was received from the Arduino."""
+    pass
+
+
+def crc8(data: bytes) -> int:
+    """CRC-8 with polynomial 0x07, as computed by the firmware
+
+    Args:
+        data: bytes covered by the checksum
+
+    Returns:
+        checksum byte
+    """
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for bit in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x07) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+    return crc
+
+
+def encodeSerialFrame(frameType: int, payload: bytes = b"") -> bytes:
+    """Builds a frame ready to be written to the serial port
+
+    Args:
+        frameType: One of the SERIAL_* constants
+        payload: Payload bytes, at most MAX_PAYLOAD
+
+    Returns:
+        encoded frame
+
+    Raises:
+        ValueError: The payload is too long
+    """
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Serial payload of {len(payload)} bytes is over "
+                         f"{MAX_PAYLOAD}")
+    body = bytes((frameType, len(payload))) + payload
+    return bytes((FRAME_START,)) + body + bytes((crc8(body),))
+
+
+class serialFrameDecoder:
+    def __init__(self) -> None:
+        """Incremental decoder, resynchronises on the next start byte after
+        noise or a bad checksum
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.buffer = bytearray()
+        self.errorCount = 0
+
+    def feed(self, data: bytes) -> list:
+        """Adds received bytes and returns every frame that is now complete
+
+        Args:
+            data: Bytes read from the serial port
+
+        Returns:
+            List of (frame type, payload), may be empty
+        """
+        self.buffer += data
+        frames = []
+        while True:
+            start = self.buffer.find(FRAME_START)
+            if start < 0:
+                self.buffer.clear()
+                break
+            del self.buffer[:start]
+            if len(self.buffer) < 3:
+                break
+            frameType, length = self.buffer[1], self.buffer[2]
+            if length > MAX_PAYLOAD:
+                self.errorCount += 1
+                del self.buffer[0]
+                continue
+            end = 3 + length + 1
+            if len(self.buffer) < end:
+                break
+            if crc8(self.buffer[1:end - 1]) != self.buffer[end - 1]:
+                # The start byte may have been noise, look for the next one
+                self.errorCount += 1
+                del self.buffer[0]
+                continue
+            frames.append((frameType, bytes(self.buffer[3:end - 1])))
+            del self.buffer[:end]
+        return frames
+
+    def reset(self) -> None:
+        self.buffer.clear()
+
+
+def parseMotorCommand(command: str):
+    """Splits a motor setpoint of the text protocol
+
+    Args:
+        command: "D" or "S", then x,z, rotation,y and left bumper,left
+            trigger,right bumper,right trigger separated by tabs
+
+    Returns:
+        (mode, list of the 8 values), None if the command is not a motor
+        setpoint
+    """
+    groups = command.split("\t")
+    if len(groups) != 4 or groups[0] not in ("D", "S"):
+        return None
+    try:
+        values = [float(value) for group in groups[1:]
+                  for value in group.split(",")]
+    except ValueError:
+        return None
+    if len(values) != 8:
+        return None
+    return groups[0], values
+
+
+def escCommand(values: list, claw: int) -> str:
+    """Builds the text command setting the ESC values directly
+
+    Args:
+        values: x, y, zl, zr ESC values
+        claw: -1 closing, 0 still, 1 opening
+
+    Returns:
+        command for arduinoCom, e.g. "ESC 188,188,188,188,0"
+    """
+    escValues = ",".join(str(int(value)) for value in values)
+    return f"{ESC_COMMAND} {escValues},{int(claw)}"
+
+
+def commandToFrame(command: str) -> bytes:
+    """Translates a text command of arduinoCom to a frame
+
+    Motor setpoints become SERIAL_MOTOR, ESC values SERIAL_ESC, GET becomes
+    SERIAL_SENSOR_REQUEST, anything else is sent as text.
+
+    Args:
+        command: text command, without the newline
+
+    Returns:
+        encoded frame
+    """
+    if command == PING_COMMAND:
+        return encodeSerialFrame(SERIAL_PING)
+    if command == "GET":
+        return encodeSerialFrame(SERIAL_SENSOR_REQUEST)
+    if command.startswith(ESC_COMMAND + " "):
+        try:
+            values = [int(value)
+                      for value in command[len(ESC_COMMAND) + 1:].split(",")]
+            return encodeSerialFrame(SERIAL_ESC, ESC_PAYLOAD.pack(*values))
+        except (ValueError, struct.error):
+            pass
+    setpoint = parseMotorCommand(command)
+    if setpoint is not None:
+        mode, values = setpoint
+        scaled = [max(-32768, min(32767, round(value * MOTOR_SCALE)))
+                  for value in values]
+        payload = MOTOR_PAYLOAD.pack(mode.encode('ascii'), *scaled)
+        return encodeSerialFrame(SERIAL_MOTOR, payload)
+    return encodeSerialFrame(SERIAL_TEXT, command.encode('utf-8'))
+
+
+def frameToReply(frameType: int, payload: bytes) -> str:
+    """Translates a reply frame to the text reply of the text protocol
+
+    Args:
+        frameType: type of the reply frame
+        payload: payload of the reply frame
+
+    Returns:
+        reply text, sensor values are tab separated with two decimals like the
+        firmware's text mode
+
+    Raises:
+        serialFrameError: The reply is malformed
+    """
+    if frameType in (SERIAL_MOTOR | REPLY_FLAG, SERIAL_ESC | REPLY_FLAG):
+        return "OK"
+    if frameType == SERIAL_SENSOR_REQUEST | REPLY_FLAG:
+        if len(payload) != SENSOR_PAYLOAD.size:
+            raise serialFrameError(f"Sensor reply of {len(payload)} bytes, "
+                                   f"expected {SENSOR_PAYLOAD.size}")
+        return "\t".join(f"{value:.2f}"
+                         for value in SENSOR_PAYLOAD.unpack(payload))
+    if frameType == SERIAL_PING | REPLY_FLAG:
+        return "PONG"
+    if frameType in (SERIAL_TEXT | REPLY_FLAG, SERIAL_TEXT_MODE | REPLY_FLAG):
+        return payload.decode('utf-8', errors='replace')
+    return "ERROR"
@@ -1,5 +1,9 @@
 from serialCommunication import arduinoCom
+from deviceRegistry import deviceRegistry, DEFAULT_REGISTRY_PATH
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import serial.tools.list_ports
+import threading
 import logging
 
 class unableToConnectToArduino(Exception):
@@ -11,10 +15,16 @@ class unassignedArduinoType(Exception):
 
 
 class serialHandler:
-    def __init__(self):
+    def __init__(self, registryPath=DEFAULT_REGISTRY_PATH,
+                 fastBaudRate=115200):
         logging.debug("Initializing Serial Handler")
+        # Baud rate negotiated with firmware that supports binary frames, None
+        # keeps text at 9600
+        self.fastBaudRate = fastBaudRate
         self.motorCom = None
         self.sensorCom = None
+        # Remembers which USB device is which Arduino between boots
+        self.registry = deviceRegistry(registryPath)
 
     def sendMotorCommands(self, command):
         """Sends commands to Motor Arduino
@@ -23,7 +33,18 @@ class serialHandler:
         Returns:
             Arduino's response
         """
-        return self.motorCom.sendData(command)
+        return self.submitMotorCommands(command).result()
+
+    def submitMotorCommands(self, command):
+        """Queues commands for the Motor Arduino without waiting for the reply
+        Only the newest unsent setpoint is written, older ones resolve to
+        "DROPPED"
+        Args:
+            command: formmated string containing data necessary for movement
+        Returns:
+            Future resolving to the Arduino's response
+        """
+        return self.motorCom.submit(command, latestWins=True)
 
     def sendSensorCommands(self, command):
         """Sends commands to Motor Arduino
@@ -34,24 +55,89 @@ class serialHandler:
         """
         return self.sensorCom.sendData(command)
 
-    def autoConnect(self):
-        """Automatically establishes communication with onboard Arduinos
+    def sensorLinkUp(self):
+        """Whether the sensor Arduino can be polled, fails fast on reconnects
         Args:
             none
         Returns:
+            True if the sensor link is up
+        """
+        return self.sensorCom is not None and self.sensorCom.supervisor.isUp()
+
+    def linkReport(self):
+        """Connection state of both Arduinos
+        Args:
             none
+        Returns:
+            dict of linkSupervisor.report per role, None for an Arduino that
+            was never found
+        """
+        return {
+            role: None if com is None else com.supervisor.report()
+            for role, com in (("MOTOR", self.motorCom),
+                              ("SENSOR", self.sensorCom))
+        }
 
-        Raises:
+    def serialReport(self):
+        """Worker and link metrics of both Arduinos
+        Args:
             none
+        Returns:
+            dict of arduinoCom.report per role, None for an Arduino that was
+            never found
+        """
+        return {
+            role: None if com is None else com.report()
+            for role, com in (("MOTOR", self.motorCom),
+                              ("SENSOR", self.sensorCom))
+        }
+
+    def autoConnect(self, discoveryTimeout=20.0, useRegistry=True,
+                    serialPorts=None):
+        """Automatically establishes communication with onboard Arduinos
+
+        Devices listed in the registry are opened directly, without the boot
+        wait. A short TYPE exchange confirms their role, a board that does not
+        answer it is probed like any other. Every other candidate port is
+        probed at the same time. Discovery returns as soon as both the motor
+        and sensor Arduinos are found, or when discoveryTimeout expires. The
+        registry is updated with the probed devices afterwards.
+
+        Args:
+            discoveryTimeout: seconds allowed for the whole discovery
+            useRegistry: trust the device registry, False probes every port
+            serialPorts: ports to probe instead of the detected USB ports, e.g.
+                arduinoEmulator ptys. The registry is not used for them
+        Returns:
+            none
+
+        Raises:
+            unassignedArduinoType: The motor or sensor Arduino was not found
         """
-        ports = serial.tools.list_ports.comports()
         logging.debug("Automatically establishing serial communication")
-        logging.info(f"{len(ports)} available ports found")
-        for port, desc, hwid in sorted(ports):
-            # TODO : Verify which setting this is in based on device
-            if ("/dev/ttyUSB" in port) or ("/dev/ttyACM" in port): # For Raspbery Pi
-            # if ("COM" in port): # For testing on Windows Machines 
-                self.assignPort(port)
+        if serialPorts:
+            logging.info(f"Probing {len(serialPorts)} given ports")
+            self.discoverPorts(list(serialPorts), discoveryTimeout)
+        else:
+            ports = serial.tools.list_ports.comports()
+            logging.info(f"{len(ports)} available ports found")
+            candidates = []
+            for portInfo in sorted(ports):
+                port = portInfo.device
+                # TODO : Verify which setting this is in based on device
+                # For Raspbery Pi, testing on Windows Machines needs
+                # if ("COM" in port):
+                if ("/dev/ttyUSB" in port) or ("/dev/ttyACM" in port):
+                    candidates.append(portInfo)
+            if useRegistry:
+                unknownPorts = self.connectKnownDevices(candidates)
+            else:
+                unknownPorts = candidates
+            if (self.motorCom is None) or (self.sensorCom is None):
+                self.discoverPorts([portInfo.device
+                                    for portInfo in unknownPorts],
+                                   discoveryTimeout)
+                self.updateRegistry(unknownPorts)
         # Throws expections for not enough arduions are connected
         if (self.motorCom == None) and (self.sensorCom == None):
             raise unassignedArduinoType("There is no Arduino assigned to Motors and Sensors")
@@ -59,6 +145,165 @@ class serialHandler:
             raise unassignedArduinoType("There is no Arduino assigned to the Motor")
         if self.sensorCom == None:
             raise unassignedArduinoType("There is no Arduino assigned to the Sensor")
+        # Serial I/O is owned by one worker thread per Arduino from here on
+        self.motorCom.startWorker()
+        self.sensorCom.startWorker()
+
+    def connectKnownDevices(self, candidates, baudRate=9600):
+        """Opens the devices whose role is in the registry, confirmed by TYPE
+
+        A board that rebooted when its port was opened answers READY or
+        nothing, and a board moved to another role answers that role. Both are
+        probed, which corrects the registry.
+
+        Args:
+            candidates: ListPortInfo of the ports that may hold an Arduino
+            baudRate: BaudRate of the arduinos, default = 9600
+        Returns:
+            ListPortInfo of the ports that still need to be probed
+        """
+        unknownPorts = []
+        for portInfo in candidates:
+            role = self.registry.lookup(portInfo)
+            # Unknown devices, and a second device claiming an assigned role,
+            # go through probing
+            unassigned = (role == "MOTOR" and self.motorCom is None) or \
+                (role == "SENSOR" and self.sensorCom is None)
+            if unassigned:
+                temp = arduinoCom(portInfo.device, baudRate, self.fastBaudRate)
+                if temp.startConnection(resetBoard=False, expectedType=role):
+                    logging.info(f"Registry: {role} Arduino at "
+                                 f"{portInfo.device}")
+                    self.assignArduino(role, temp)
+                    continue
+                logging.warning(f"Registry: unable to confirm {role} Arduino "
+                                f"at {portInfo.device}, probing instead")
+            unknownPorts.append(portInfo)
+        return unknownPorts
+
+    def updateRegistry(self, probedPorts):
+        """Remembers the role of the probed devices that were assigned
+
+        Args:
+            probedPorts: ListPortInfo of the ports that were probed
+        Returns:
+            none
+        """
+        for portInfo in probedPorts:
+            port = portInfo.device
+            if self.motorCom is not None and self.motorCom.comPort == port:
+                self.registry.remember(portInfo, "MOTOR")
+            elif self.sensorCom is not None and self.sensorCom.comPort == port:
+                self.registry.remember(portInfo, "SENSOR")
+            elif self.registry.lookup(portInfo) is not None:
+                # Known device that is no longer an Arduino we use
+                self.registry.forget(portInfo)
+        self.registry.save()
+
+    def discoverPorts(self, ports, discoveryTimeout, baudRate=9600):
+        """Probes ports in parallel and assigns the Arduinos that are found
+
+        Args:
+            ports: serial ports to probe
+            discoveryTimeout: seconds allowed for the whole discovery
+            baudRate: BaudRate of the arduinos, default = 9600
+        Returns:
+            none
+        """
+        if not ports:
+            return
+        cancelEvent = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(ports),
+                                      thread_name_prefix="probe")
+        probes = [executor.submit(self.probePort, port, baudRate, cancelEvent)
+                  for port in ports]
+        try:
+            for probe in as_completed(probes, timeout=discoveryTimeout):
+                try:
+                    self.assignArduino(*probe.result())
+                except unableToConnectToArduino as e:
+                    logging.error(f"{e}")
+                if self.motorCom is not None and self.sensorCom is not None:
+                    break
+        except FutureTimeoutError:
+            logging.error("Serial discovery did not finish within "
+                          f"{discoveryTimeout}s")
+        finally:
+            # Stop the probes still waiting for READY and close any Arduino
+            # that is not needed
+            cancelEvent.set()
+            for probe in probes:
+                if not probe.cancel():
+                    probe.add_done_callback(self.closeUnassignedProbe)
+            executor.shutdown(wait=False)
+
+    def probePort(self, port, baudRate=9600, cancelEvent=None):
+        """Connects to a port and asks the device for its type
+
+        Args:
+            port: The ComPort of the arduino
+            baudRate: BaudRate of the arduino, default = 9600
+            cancelEvent: Aborts the probe when set
+
+        Returns:
+            (typeData, arduinoCom) for a connected Arduino, (None, None) if the
+            probe was cancelled
+
+        Raises:
+            unableToConnectToArduino: The port could not be opened
+        """
+        temp = arduinoCom(port, baudRate, self.fastBaudRate)
+        connectionSuccuss = temp.startConnection(cancelEvent)
+        if cancelEvent is not None and cancelEvent.is_set():
+            if connectionSuccuss:
+                temp.closeConnection()
+            return None, None
+        if not connectionSuccuss:
+            raise unableToConnectToArduino(
+                f"There was an issue connecting to {port}")
+        return temp.sendData("TYPE"), temp
+
+    def assignArduino(self, typeData, temp):
+        """Assigns a probed arduino to its object, other devices are closed
+
+        Args:
+            typeData: Reply of the device to TYPE
+            temp: arduinoCom connected to the device
+
+        Returns:
+            null
+        """
+        if temp is None:
+            return
+        # Assigns motor to motorCom Object
+        if typeData == "MOTOR" and self.motorCom is None:
+            logging.info(f"Motor Arduino at {temp.comPort}")
+            self.motorCom = temp
+        # Assigns sensor to sensorCom Object
+        elif typeData == "SENSOR" and self.sensorCom is None:
+            logging.info(f"Sensor Arduino at {temp.comPort}")
+            self.sensorCom = temp
+        # Desregards other serial devices
+        else:
+            logging.info("Unknown or duplicate Serial Device at "
+                         f"{temp.comPort}, '{typeData}'")
+            temp.closeConnection()
+
+    def closeUnassignedProbe(self, probe):
+        """Closes the Arduino of a probe that finished after discovery ended
+
+        Args:
+            probe: Future of probePort
+        Returns:
+            none
+        """
+        if probe.cancelled() or probe.exception() is not None:
+            return
+        typeData, temp = probe.result()
+        if temp is not None and temp not in (self.motorCom, self.sensorCom):
+            logging.debug(f"Closing late probe of {temp.comPort}")
+            temp.closeConnection()
+
     def assignPort(self, port, baudRate=9600):
         """Assigns known devices to objects
 
@@ -70,31 +315,9 @@ class serialHandler:
             null
 
         Raises:
-            null
+            unableToConnectToArduino: The port could not be opened
         """
-        # Assigns Unknown arduino to a temporary object and requests type
-        temp = arduinoCom(port, baudRate)
-        connectionSuccuss = temp.startConnection()
-
-        if connectionSuccuss:
-            typeData = temp.sendData("TYPE")
-            # Assigns motor to motorCom Object
-            if typeData == "MOTOR":
-                logging.info(f"Motor Arduino at {port}")
-                self.motorCom = temp
-                temp = None
-            # Assigns sensor to sensorCom Object
-            elif typeData == "SENSOR":
-                logging.info(f"Sensor Arduino at {port}")
-                self.sensorCom = temp
-                temp = None
-            # Desregards other serial devices
-            else:
-                logging.info(f"Unknown Serial Device at {port}, '{typeData}'")
-                temp.closeConnection()
-                temp = None
-        else:
-            raise unableToConnectToArduino(f"There was an issue connecting to {port}")
+        self.assignArduino(*self.probePort(port, baudRate))
 
     def closeAllConnections(self):
         """Closes Connections to Arduinos
@@ -105,10 +328,14 @@ class serialHandler:
         """
         logging.debug("Closing all Serial Connections")
         if not(self.motorCom == None):
+            self.motorCom.supervisor.close()
+            self.motorCom.stopWorker()
             self.motorCom.closeConnection()
         else:
             logging.debug("Cannot close Motor connection, as it was not established")
         if not(self.sensorCom == None):
+            self.sensorCom.supervisor.close()
+            self.sensorCom.stopWorker()
             self.sensorCom.closeConnection()
         else:
             logging.debug("Cannot close Sensor connection, as it was not established")
@@ -0,0 +1,246 @@
+# In-process counters of the server, read with the STATS command or on the
+# local stats port
+#
+# curl http://127.0.0.1:8002/   (serverPort + 2 by default)
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import frameProtocol as fp
+import collections
+import threading
+import logging
+import json
+import time
+
+CHANNEL_NAMES = {fp.CHANNEL_MOTOR: "motor", fp.CHANNEL_SENSOR: "sensor",
+                 fp.CHANNEL_CONTROL: "control",
+                 fp.CHANNEL_TELEMETRY: "telemetry"}
+
+
+class rateCounter:
+    def __init__(self, window: int = 10) -> None:
+        """Counts events in one second buckets to report a recent rate
+
+        Args:
+            window: seconds the rate is averaged over
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.window = window
+        self.total = 0
+        # [second, count], oldest first
+        self.buckets = collections.deque()
+
+    def add(self, now: float) -> None:
+        second = int(now)
+        if self.buckets and self.buckets[-1][0] == second:
+            self.buckets[-1][1] += 1
+        else:
+            self.buckets.append([second, 1])
+            while self.buckets[0][0] <= second - self.window:
+                self.buckets.popleft()
+        self.total += 1
+
+    def rate(self, now: float) -> float:
+        """Events per second over the last window, the current second included
+
+        Args:
+            now: time.monotonic()
+
+        Returns:
+            events per second
+        """
+        oldest = int(now) - self.window
+        recent = sum(count for second, count in self.buckets
+                     if second > oldest)
+        return round(recent / self.window, 2)
+
+
+class serverMetrics:
+    def __init__(self, window: int = 10) -> None:
+        """Message rates, error counts and connections of the server, safe to
+        use from several threads
+
+        Components with their own counters (serial links, watchdog, UDP server)
+        report them separately, see tcpServer.statsReport.
+
+        Args:
+            window: seconds the message rates are averaged over
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.window = window
+        self.started = time.monotonic()
+        self.messages = collections.OrderedDict()
+        self.errors = collections.Counter()
+        self.activeConnections = 0
+        self.totalConnections = 0
+        self.lock = threading.Lock()
+
+    def countMessage(self, name: str) -> None:
+        """Counts one message
+
+        Args:
+            name: channel name from CHANNEL_NAMES, or "text" for the legacy
+                protocol
+
+        Returns:
+            None
+        """
+        now = time.monotonic()
+        with self.lock:
+            counter = self.messages.get(name)
+            if counter is None:
+                counter = self.messages[name] = rateCounter(self.window)
+            counter.add(now)
+
+    def countFrame(self, receivedFrame) -> None:
+        self.countMessage(CHANNEL_NAMES.get(receivedFrame.channel,
+                                            f"channel{receivedFrame.channel}"))
+
+    def countError(self, kind: str) -> None:
+        with self.lock:
+            self.errors[kind] += 1
+
+    def connectionOpened(self) -> int:
+        """Counts a new client connection
+
+        Args:
+            None
+
+        Returns:
+            number of connected clients
+        """
+        with self.lock:
+            self.activeConnections += 1
+            self.totalConnections += 1
+            return self.activeConnections
+
+    def connectionClosed(self) -> int:
+        """Counts a closed client connection
+
+        Args:
+            None
+
+        Returns:
+            number of connected clients
+        """
+        with self.lock:
+            self.activeConnections -= 1
+            return self.activeConnections
+
+    def report(self) -> dict:
+        """Returns the counters
+
+        Args:
+            None
+
+        Returns:
+            dict with the uptime, per channel rate and total, error counts and
+            connections
+        """
+        now = time.monotonic()
+        with self.lock:
+            return {
+                "uptime": round(now - self.started, 1),
+                "messages": {name: {"rate": counter.rate(now),
+                                    "total": counter.total}
+                             for name, counter in self.messages.items()},
+                "errors": dict(self.errors),
+                "connections": {"active": self.activeConnections,
+                                "total": self.totalConnections},
+            }
+
+
+class metricsServer:
+    def __init__(self, report, statsIP: str = "127.0.0.1",
+                 statsPort: int = 8002) -> None:
+        """Serves a report as JSON over HTTP, any path returns it
+
+        Args:
+            report: function returning a JSON serialisable dict
+            statsIP: address to listen on, local only by default
+            statsPort: port to listen on
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.report = report
+        self.statsIP = statsIP
+        self.statsPort = statsPort
+        self.httpServer = None
+        self.serveThread = None
+
+    def start(self) -> None:
+        """Starts serving in a daemon thread, the server keeps running without
+        stats if the port is taken
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.httpServer is not None:
+            return
+        report = self.report
+
+        class statsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(report()).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Polling the stats must not fill the log
+                pass
+
+        try:
+            self.httpServer = ThreadingHTTPServer(
+                (self.statsIP, self.statsPort), statsHandler)
+        except OSError as e:
+            logging.error("Unable to serve stats on "
+                          f"{self.statsIP}:{self.statsPort}: {e}")
+            return
+        self.httpServer.daemon_threads = True
+        self.serveThread = threading.Thread(
+            target=self.httpServer.serve_forever, name="stats-server")
+        self.serveThread.daemon = True
+        self.serveThread.start()
+        logging.info("Serving stats on "
+                     f"http://{self.statsIP}:{self.statsPort}/")
+
+    def stop(self) -> None:
+        """Stops serving
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.httpServer is None:
+            return
+        self.httpServer.shutdown()
+        self.httpServer.server_close()
+        self.httpServer = None
+        self.serveThread = None
@@ -1,18 +1,98 @@
 from serialHandler import serialHandler, unableToConnectToArduino, unassignedArduinoType
+from serialCommunication import serialQueueFull
+from sensorPoller import sensorPoller, telemetrySubscriber
+from latencyStats import latencyStats
+from udpControl import udpMotorServer
+from commandWatchdog import commandWatchdog
+from thrustMixer import thrustMixer
+from serverMetrics import serverMetrics, metricsServer
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import frameProtocol as fp
 import threading
 import socket
+import argparse
+import json
 import logging
+import time
+
+# A peer that vanished without closing (tether cut, topside crash) is detected
+# after about KEEPALIVE_IDLE + KEEPALIVE_INTERVAL * KEEPALIVE_COUNT seconds,
+# unacknowledged sends fail after SEND_TIMEOUT_MS
+KEEPALIVE_IDLE = 5
+KEEPALIVE_INTERVAL = 2
+KEEPALIVE_COUNT = 3
+SEND_TIMEOUT_MS = 10000
+
+
+def configureClientSocket(clientSocket) -> None:
+    """Sets the options of an accepted client socket
+
+    Args:
+        clientSocket: socket returned by accept
+
+    Returns:
+        None
+    """
+    clientSocket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    clientSocket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Linux only options, the keepalive above still applies with the system
+    # timings elsewhere
+    for option, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+                          ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                          ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+                          ("TCP_USER_TIMEOUT", SEND_TIMEOUT_MS)):
+        if hasattr(socket, option):
+            clientSocket.setsockopt(socket.IPPROTO_TCP,
+                                    getattr(socket, option), value)
+
+
+class clientSession:
+    def __init__(self, clientAddress) -> None:
+        """Protocol state of a single client connection
 
+        Args:
+            clientAddress: Address of the connected client
 
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.clientAddress = clientAddress
+        # None until the first bytes arrive, then "text" or "binary"
+        self.protocol = None
+        self.decoder = fp.frameDecoder()
+        # Telemetry subscription, replies and pushed readings share the socket
+        self.subscriber = None
+        self.streamingSubscriber = None
+        self.sendLock = threading.Lock()
+        # time.monotonic() when the bytes being processed arrived
+        self.receivedAt = 0.0
 
 
 class tcpServer:
-    def __init__(self, serverIP: str, serverPort: int) -> None:
+    def __init__(self, serverIP: str, serverPort: int,
+                 sensorRate: float = 20.0, serialPorts: list = None,
+                 clientTimeout: float = 30.0, commandDeadline: float = 1.0,
+                 statsPort: int = None, mixOnPi: bool = False) -> None:
         """Server side of the ROV comunication protocol, run on raspberry pi
 
         Args:
             serverIP: IP address of this computer (device hosting the server)
             serverPort: port that the server will be avaliable on
+            sensorRate: readings per second taken from the sensor Arduino
+            serialPorts: serial ports to probe instead of the detected USB
+                ports, e.g. from arduinoEmulator
+            clientTimeout: seconds without data before a client connection is
+                closed, counted from its first command, subscribed clients
+                are exempt
+            commandDeadline: seconds without a motor command before the
+                thrusters are set to neutral
+            statsPort: local port serving statsReport as JSON, default is
+                serverPort + 2
+            mixOnPi: mix the setpoints into ESC values with thrustMixer, the
+                motor Arduino must support the ESC command
 
         Returns:
             serverIP:
@@ -27,9 +107,23 @@ class tcpServer:
         self.motorPort = serverPort
         self.sensorPort = serverPort + 1
         self.runThreading = True
+        self.clientTimeout = clientTimeout
         logging.info(f"Initializing Server - IP {self.serverIP}, MotorTCP: {self.motorPort}, SensorTCP: {self.sensorPort}")
         # Objects 
         self.serialH = None
+        self.sensorPoller = None
+        self.udpMotors = None
+        self.commandWatchdog = None
+        self.thrustMixer = None
+        # Server side hops of traced motor commands
+        self.latencyStats = latencyStats()
+        # Message rates, errors and connections, served with the other counters
+        # on the stats port
+        self.metrics = serverMetrics()
+        if statsPort is None:
+            statsPort = serverPort + 2
+        self.statsServer = metricsServer(self.statsReport, "127.0.0.1",
+                                         statsPort)
         self.tcp_motors = None
         self.tcp_sensors = None
 
@@ -38,7 +132,7 @@ class tcpServer:
         ############## Connect to serial handler (start communication with arduinos) ##############
         self.serialH = serialHandler()
         try:
-            self.serialH.autoConnect()
+            self.serialH.autoConnect(serialPorts=serialPorts)
         except unassignedArduinoType as e:
             logging.error(f"{e}")
             print("There was an issue connecting to the arduinos check the logs for more information")
@@ -47,6 +141,17 @@ class tcpServer:
             logging.error(f"{e}")
             print("There was an issue connecting to the arduinos check the logs for more information")
             self.stopAllServices() 
+        # Sensor requests are answered from this cache instead of the Arduino
+        self.sensorPoller = sensorPoller(self.serialH, sensorRate)
+        # Client motor commands go through the watchdog, whatever their
+        # transport, then the mixer if enabled
+        if mixOnPi:
+            self.thrustMixer = thrustMixer(self.serialH)
+        motorOutput = self.thrustMixer if mixOnPi else self.serialH
+        self.commandWatchdog = commandWatchdog(motorOutput, commandDeadline)
+        # Motor setpoints can also arrive over UDP on the motor port number
+        self.udpMotors = udpMotorServer(self.commandWatchdog, serverIP,
+                                        serverPort)
         ############## End of setup for aduino communicaiton ##############
 
     
@@ -88,26 +193,161 @@ class tcpServer:
             try: 
                 if client_socket == None:
                     client_socket, clientAddress = serverObj.accept()
+                    configureClientSocket(client_socket)
+                    session = clientSession(clientAddress)
                     logging.debug(f"Starting listen for {serverObj}")
-                    logging.info(f"Connection from: {clientAddress}")
+                    logging.info(f"Connection from: {clientAddress}, "
+                                 f"{self.metrics.connectionOpened()} active")
 
 
                 # Received Data from Client
-                receivedData = client_socket.recv(1024).decode('utf-8')
+                receivedData = client_socket.recv(4096)
                 if not receivedData:
-                    break
+                    # The client closed its side, the port is kept open for
+                    # its reconnection
+                    logging.info(f"Connection closed: "
+                                 f"{session.clientAddress}, "
+                                 f"{self.metrics.connectionClosed()} active")
+                    self.unsubscribeTelemetry(session)
+                    client_socket.close()
+                    client_socket = None
+                    continue
+                if session.protocol is None:
+                    # The idle timeout starts with the first command, the
+                    # topside connects well before the pilot presses START
+                    client_socket.settimeout(self.clientTimeout)
                 # Processes Data and Returns Data to Client
-                transmitData = self.processReceivedData(receivedData)
-                client_socket.send(transmitData.encode('utf-8'))
+                transmitData = self.processChunk(session, receivedData)
+                if transmitData:
+                    with session.sendLock:
+                        client_socket.sendall(transmitData)
+                if session.subscriber is not None and \
+                        session.subscriber is not session.streamingSubscriber:
+                    self.startTelemetryThread(session, client_socket)
+            except socket.timeout:
+                # Subscribed clients only listen, a dead peer is caught by
+                # keepalive instead
+                if session.subscriber is not None:
+                    continue
+                logging.warning(f"{serverObj} - No data from "
+                                f"{session.clientAddress} for "
+                                f"{self.clientTimeout}s, closing connection")
+                self.metrics.countError("clientTimeout")
+                self.metrics.connectionClosed()
+                client_socket.close()
+                client_socket = None
+            except fp.frameError as e:
+                logging.error(f"{serverObj} - Invalid frame from "
+                              f"{session.clientAddress}, dropping client: {e}")
+                self.metrics.countError("invalidFrame")
+                self.metrics.connectionClosed()
+                self.unsubscribeTelemetry(session)
+                client_socket.close()
+                client_socket = None
             except socket.error as e: 
                 logging.error(f"{serverObj} - Socket Error Occurred {e}")
+                self.metrics.countError("socket")
+                if client_socket is not None:
+                    self.metrics.connectionClosed()
+                self.unsubscribeTelemetry(session)
                 client_socket = None
             except Exception as e:
                 logging.error(f"{serverObj} - An Error has occurred {e}")
+                self.metrics.countError("other")
    
-        client_socket.close()
+        if client_socket is not None:
+            self.metrics.connectionClosed()
+            self.unsubscribeTelemetry(session)
+            client_socket.close()
         logging.debug(f"Server Closed: {serverObj}")
 
+    def startTelemetryThread(self, session, client_socket):
+        """Starts pushing the session's subscribed readings to the client
+
+        Args:
+            session: clientSession with an active subscriber
+            client_socket: socket of the client
+
+        Returns:
+            null
+        """
+        session.streamingSubscriber = session.subscriber
+        streamThread = threading.Thread(target=self.streamTelemetry,
+                                        args=(session.subscriber, session,
+                                              client_socket))
+        streamThread.daemon = True
+        streamThread.start()
+
+    def streamTelemetry(self, subscriber, session, client_socket):
+        """Sends every reading of a subscriber until it is closed
+
+        Args:
+            subscriber: telemetrySubscriber of the client
+            session: clientSession of the client
+            client_socket: socket of the client
+
+        Returns:
+            null
+        """
+        logging.debug(f"Streaming telemetry to {session.clientAddress}")
+        try:
+            while self.runThreading and subscriber.active:
+                reading = subscriber.get(1.0)
+                if reading is not None:
+                    transmitData = self.encodeSensorReading(
+                        reading, fp.CHANNEL_TELEMETRY, reading.sequence)
+                    with session.sendLock:
+                        client_socket.sendall(transmitData)
+                    self.metrics.countMessage("telemetry")
+        except socket.error as e:
+            logging.error(f"{session.clientAddress} - Telemetry stream "
+                          f"stopped {e}")
+            subscriber.close()
+        logging.debug(f"Telemetry stream to {session.clientAddress} closed, "
+                      f"{subscriber.droppedCount} readings dropped")
+
+    def subscribeTelemetry(self, session, rate: float) -> None:
+        """Subscribes a client to pushed readings, replacing its previous one
+
+        Args:
+            session: clientSession of the client
+            rate: readings per second, 0 or less unsubscribes
+
+        Returns:
+            null
+        """
+        self.unsubscribeTelemetry(session)
+        if rate > 0:
+            logging.info(f"{session.clientAddress} subscribed to telemetry at "
+                         f"{rate:g}Hz")
+            session.subscriber = self.createSubscriber(rate)
+            self.sensorPoller.addListener(session.subscriber.offer)
+
+    def createSubscriber(self, rate: float):
+        """Buffer of the readings pushed to one client, read by streamTelemetry
+
+        Args:
+            rate: readings per second
+
+        Returns:
+            telemetrySubscriber
+        """
+        return telemetrySubscriber(rate)
+
+    def unsubscribeTelemetry(self, session) -> None:
+        """Stops pushing sensor readings to a client
+
+        Args:
+            session: clientSession of the client
+
+        Returns:
+            null
+        """
+        if session.subscriber is not None:
+            self.sensorPoller.removeListener(session.subscriber.offer)
+            session.subscriber.close()
+            session.subscriber = None
+
     def startSockets(self):
         logging.info("Starting Sockets")
         self.tcp_motors = self.configureServer(self.motorPort)
@@ -115,6 +355,13 @@ class tcpServer:
 
     def startListeningThreads(self):
         logging.info("Starting Threads")
+        self.sensorPoller.start()
+        self.udpMotors.start()
+        self.commandWatchdog.start()
+        if self.thrustMixer is not None:
+            self.thrustMixer.start()
+        self.statsServer.start()
+        self.latencyStats.startPeriodicDump()
         try:
             thread_tcp_motor = threading.Thread(target=self.tcpServerListen,args=(self.tcp_motors,))
             thread_tcp_sensor = threading.Thread(target=self.tcpServerListen,args=(self.tcp_sensors,))
@@ -130,6 +377,203 @@ class tcpServer:
 
             self.stopAllServices()
 
+    def processChunk(self, session, data: bytes) -> bytes:
+        """Processes bytes received from a client in either protocol
+
+        The protocol is picked from the first bytes of the connection,
+        framed clients start with the frame magic while legacy clients send
+        plain text commands.
+
+        Args:
+            session: clientSession of the connection
+            data: raw bytes received from TCP
+
+        Returns:
+            bytes to send back to the client, may be empty
+
+        Raises:
+            frameError: A framed client sent a corrupted frame
+        """
+        session.receivedAt = time.monotonic()
+        self.detectProtocol(session, data)
+
+        if session.protocol == "text":
+            self.metrics.countMessage("text")
+            transmitData = self.processReceivedData(data.decode('utf-8'))
+            return transmitData.encode('utf-8') if transmitData else b""
+
+        return b"".join(self.processFrame(session, receivedFrame)
+                        for receivedFrame in self.receiveFrames(session, data))
+
+    def detectProtocol(self, session, data: bytes) -> None:
+        """Picks the protocol of a connection from its first bytes
+
+        Args:
+            session: clientSession of the connection
+            data: raw bytes received from TCP
+
+        Returns:
+            null
+        """
+        if session.protocol is None:
+            session.protocol = "binary" if fp.isFramedStream(data) else "text"
+            logging.info(f"{session.clientAddress} is using the "
+                         f"{session.protocol} protocol")
+
+    def receiveFrames(self, session, data: bytes) -> list:
+        """Decodes the frames of a chunk, motor frames are put first
+
+        A client multiplexing every channel on one connection may have sensor
+        requests queued in front of a setpoint, they are answered after it.
+
+        Args:
+            session: clientSession of a binary connection
+            data: raw bytes received from TCP
+
+        Returns:
+            list of frames
+
+        Raises:
+            frameError: The client sent a corrupted frame
+        """
+        receivedFrames = sorted(session.decoder.feed(data),
+                                key=fp.framePriority)
+        for receivedFrame in receivedFrames:
+            self.metrics.countFrame(receivedFrame)
+        return receivedFrames
+
+    def processFrame(self, session, receivedFrame):
+        """Processes a single binary frame and builds the reply frame
+
+        Args:
+            session: clientSession of the connection
+            receivedFrame: frame decoded from the client
+
+        Returns:
+            encoded reply frame
+
+        Raises:
+            null
+        """
+        channel = receivedFrame.channel
+        sequence = receivedFrame.sequence
+        try:
+            if receivedFrame.type == fp.FRAME_MOTOR:
+                # The serial worker writes the newest setpoint, the client does
+                # not wait for the Arduino
+                self.commandWatchdog.submitMotorCommands(
+                    fp.motorPayloadToText(receivedFrame.payload))
+                return fp.encodeFrame(fp.FRAME_REPLY, channel, sequence,
+                                      b"QUEUED")
+            elif receivedFrame.type == fp.FRAME_MOTOR_TRACED:
+                return self.processTracedMotorFrame(session, receivedFrame)
+            elif receivedFrame.type == fp.FRAME_SENSOR_REQUEST:
+                reading = self.sensorPoller.latest()
+                if reading is None:
+                    return fp.encodeFrame(fp.FRAME_ERROR, channel, sequence,
+                                          b"NO SENSOR DATA")
+                return self.encodeSensorReading(reading, channel, sequence)
+            elif receivedFrame.type == fp.FRAME_SUBSCRIBE:
+                rate = fp.decodeSubscribePayload(receivedFrame.payload)
+                self.subscribeTelemetry(session, rate)
+                return fp.encodeFrame(fp.FRAME_REPLY, channel, sequence,
+                                      b"SUBSCRIBED")
+            elif receivedFrame.type == fp.FRAME_TIME_SYNC:
+                return self.processTimeSyncFrame(session, receivedFrame)
+            elif receivedFrame.type == fp.FRAME_TEXT:
+                reply = self.processReceivedData(
+                    receivedFrame.payload.decode('utf-8'))
+                return fp.encodeFrame(fp.FRAME_REPLY, channel, sequence,
+                                      (reply or "").encode('utf-8'))
+            else:
+                return fp.encodeFrame(fp.FRAME_ERROR, channel, sequence,
+                                      b"INVALID COMMAND")
+        except (ValueError, fp.frameError, serialQueueFull) as e:
+            logging.error(f"Unable to process frame {receivedFrame.type} "
+                          f"#{sequence}: {e}")
+            self.metrics.countError("rejectedFrame")
+            return fp.encodeFrame(fp.FRAME_ERROR, channel, sequence,
+                                  str(e).encode('utf-8'))
+
+    def processTimeSyncFrame(self, session, receivedFrame) -> bytes:
+        """Answers a clock exchange with the server time the frame arrived and
+        the time of the reply
+
+        Args:
+            session: clientSession of the connection
+            receivedFrame: FRAME_TIME_SYNC frame
+
+        Returns:
+            encoded FRAME_TIME_SYNC frame
+        """
+        request = fp.decodeTimeSyncPayload(receivedFrame.payload)
+        # Wall clock time of the chunk, time spent here is not counted as
+        # network delay by the client
+        now = time.time()
+        serverReceived = now - (time.monotonic() - session.receivedAt)
+        payload = fp.encodeTimeSyncPayload(request.clientSent, serverReceived,
+                                           time.time())
+        return fp.encodeFrame(fp.FRAME_TIME_SYNC, receivedFrame.channel,
+                              receivedFrame.sequence, payload)
+
+    def processTracedMotorFrame(self, session, receivedFrame,
+                                receivedAt: float = None) -> bytes:
+        """Sends a motor setpoint, waits for the Arduino and reports the time
+        spent in each hop
+
+        Args:
+            session: clientSession of the connection
+            receivedFrame: FRAME_MOTOR_TRACED frame
+            receivedAt: time.monotonic() when the frame arrived, default is the
+                session's last chunk
+
+        Returns:
+            encoded FRAME_TRACE_REPLY frame
+        """
+        if receivedAt is None:
+            receivedAt = session.receivedAt
+        future = self.commandWatchdog.submitMotorCommands(
+            fp.motorPayloadToText(receivedFrame.payload))
+        try:
+            reply = future.result(timeout=2.0)
+        except FutureTimeoutError:
+            reply = "TIMEOUT"
+        now = time.monotonic()
+        # Superseded setpoints were never written, only the total is meaningful
+        # for them
+        writeStarted = getattr(future, "writeStarted", now)
+        replied = getattr(future, "replied", now)
+        queueTime = writeStarted - receivedAt
+        serialTime = replied - writeStarted
+        totalTime = now - receivedAt
+        self.latencyStats.record("serverQueue", queueTime)
+        self.latencyStats.record("serial", serialTime)
+        self.latencyStats.record("serverTotal", totalTime)
+        payload = fp.encodeTracePayload(queueTime, serialTime, totalTime,
+                                        reply)
+        return fp.encodeFrame(fp.FRAME_TRACE_REPLY, receivedFrame.channel,
+                              receivedFrame.sequence, payload)
+
+    def encodeSensorReading(self, reading, channel: int,
+                            sequence: int) -> bytes:
+        """Builds a sensor data frame from a cached reading
+
+        Args:
+            reading: sensorReading from the poller
+            channel: channel of the frame
+            sequence: sequence number of the frame
+
+        Returns:
+            encoded frame
+        """
+        age = time.monotonic() - reading.timestamp
+        # Sample time on the server clock, the client converts it with
+        # clockSync
+        sampleTime = time.time() - age
+        payload = fp.encodeSensorPayload(reading.values, reading.sequence, age,
+                                         sampleTime)
+        return fp.encodeFrame(fp.FRAME_SENSOR_DATA, channel, sequence, payload)
+
     def processReceivedData(self, data):
         """Processes Data received by TCP server and directs it to appropriate location
 
@@ -144,10 +588,30 @@ class tcpServer:
         """
         # Commands Starting with MOT are for motor control, thus they are sent to the motor arduino
         if data.startswith("MOT"):
-            return self.serialH.sendMotorCommands(data[3:])
-        # Commands Starting with SEN are for sensors, thus they are sent to the sensor arduino
+            # Text clients read the Arduino's reply, the binary protocol has
+            # FRAME_MOTOR to queue without waiting
+            future = self.commandWatchdog.submitMotorCommands(data[3:])
+            try:
+                return future.result(timeout=2.0)
+            except FutureTimeoutError:
+                return "TIMEOUT"
+        # Commands Starting with SEN are for sensors, they are answered with
+        # the latest cached reading
         elif data.startswith("SEN"):
-            return self.serialH.sendSensorCommands("GET")
+            reading = self.sensorPoller.latest()
+            return "ERROR" if reading is None else reading.raw
+        # Latency histograms of the traced motor commands, as JSON
+        elif data.startswith("LAT"):
+            return self.latencyStats.dump()
+        # Motor command deadline misses, as JSON
+        elif data.startswith("WDG"):
+            return json.dumps(self.commandWatchdog.report())
+        # Every counter of the server, as JSON, also served on the stats port
+        elif data.startswith("STATS"):
+            return json.dumps(self.statsReport())
+        # Serial link state and reconnect counters of both Arduinos, as JSON
+        elif data.startswith("LINK"):
+            return json.dumps(self.serialH.linkReport())
         elif data.startswith("STOP"): # FIXME: This no longer stops the threads
             logging.warning("Received Stop Command")
             self.runThreading = False
@@ -155,10 +619,33 @@ class tcpServer:
         else:
             return "INVALID COMMAND"
 
+    def statsReport(self) -> dict:
+        """Collects the counters of every component
 
+        Args:
+            null
 
-
-
+        Returns:
+            dict of serverMetrics.report, per Arduino serial metrics, sensor
+            poller, UDP, watchdog, mixer and traced latency
+        """
+        report = self.metrics.report()
+        report["serial"] = self.serialH.serialReport()
+        if self.sensorPoller is not None:
+            reading = self.sensorPoller.latest()
+            ageMs = None if reading is None else round(
+                (time.monotonic() - reading.timestamp) * 1000, 1)
+            report["sensorPoller"] = {"readings": self.sensorPoller.sequence,
+                                      "errors": self.sensorPoller.errorCount,
+                                      "ageMs": ageMs}
+        if self.udpMotors is not None:
+            report["udpMotors"] = self.udpMotors.report()
+        if self.commandWatchdog is not None:
+            report["watchdog"] = self.commandWatchdog.report()
+        if self.thrustMixer is not None:
+            report["mixer"] = self.thrustMixer.report()
+        report["latency"] = self.latencyStats.report()
+        return report
 
     def closeTCPsockets(self):
         logging.debug("Closing all TCP Connections")
@@ -168,13 +655,42 @@ class tcpServer:
 
     def stopAllServices(self):
         logging.warning("Stopping all services")
+        if self.sensorPoller is not None:
+            self.sensorPoller.stop()
+        if self.udpMotors is not None:
+            self.udpMotors.stop()
+        if self.commandWatchdog is not None:
+            self.commandWatchdog.stop()
+        if self.thrustMixer is not None:
+            self.thrustMixer.stop()
+        self.statsServer.stop()
         self.serialH.closeAllConnections()
         self.closeTCPsockets()
         quit()
 
 
 if __name__ == '__main__':
-    logging.basicConfig(filename = "log.log", encoding='utf-8', level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    c = tcpServer("10.10.2.5",8000)
+    parser = argparse.ArgumentParser(description="ROV server")
+    parser.add_argument("--ip", default="10.10.2.5")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--serial-port", action="append", default=None,
+                        help="port to probe instead of the USB ports, "
+                             "repeatable, e.g. arduinoEmulator ptys")
+    parser.add_argument("--stats-port", type=int, default=None,
+                        help="local port serving the STATS report, default is "
+                             "--port + 2")
+    parser.add_argument("--log-level", default="INFO",
+                        help="DEBUG logs every connection detail, the STATS "
+                             "report does not need it")
+    parser.add_argument("--mix-on-pi", action="store_true",
+                        help="mix the thrusters with thrustMixer and send ESC "
+                             "values to the motor Arduino")
+    args = parser.parse_args()
+    logging.basicConfig(filename="log.log", encoding='utf-8',
+                        level=args.log_level.upper(),
+                        format='%(asctime)s - %(name)s - %(levelname)s - '
+                               '%(message)s')
+    c = tcpServer(args.ip, args.port, serialPorts=args.serial_port,
+                  statsPort=args.stats_port, mixOnPi=args.mix_on_pi)
     c.startSockets()
     c.startListeningThreads()
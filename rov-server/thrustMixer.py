@@ -0,0 +1,272 @@
+# Mixes motor setpoints into ESC values on the Pi instead of the motor Arduino
+#
+# The firmware mixes at 20Hz and ramps each thruster by at most 7 every 50ms.
+# Here the mixing is an allocation matrix per input mode, so the thruster
+# layout can change without reflashing, and the ramp runs at rampRate Hz with
+# the same slew limit. The Arduino only applies the values of
+# "ESC x,y,zl,zr,claw".
+
+from serialCommunication import serialQueueFull
+import serialFrames
+import numpy as np
+import threading
+import logging
+import time
+
+# Thruster order of the ESC values
+THRUSTERS = ("x", "y", "zl", "zr")
+# ESC constants of enclosure-motors.ino
+ARM = 188
+MAX_SPEED = 35
+# ESC units per second, the firmware steps 7 every 50ms
+SLEW_RATE = 7 / 0.05
+
+# Horizontal mixing, rows are the thrusters and columns the x and z axes of the
+# mode. The result is clipped to [-1, 1] before scaling, like the firmware's
+# numpad table for the DPad.
+STICK_ALLOCATION = np.array([
+    [1.0, 0.0],   # x
+    [0.0, 0.0],   # y, vertical is mixed separately
+    [0.0, 1.0],   # zl
+    [0.0, 1.0],   # zr
+])
+DPAD_ALLOCATION = np.array([
+    [1.0, 1.0],
+    [0.0, 0.0],
+    [-1.0, 1.0],
+    [1.0, -1.0],
+])
+# Thrusters driven by the vertical axis and, when it is over
+# ROTATION_THRESHOLD, replaced by the rotation axis
+VERTICAL_ALLOCATION = np.array([0.0, 1.0, 0.0, 0.0])
+ROTATION_ALLOCATION = np.array([0.0, 0.0, 1.0, 1.0])
+ROTATION_THRESHOLD = 0.2
+
+
+class thrustMixer:
+    def __init__(self, serialH, allocation: dict = None,
+                 rampRate: float = 200.0, slewRate: float = SLEW_RATE,
+                 resendInterval: float = 0.5) -> None:
+        """Turns motor setpoints into ramped ESC values, drop in replacement
+        for serialHandler in commandWatchdog
+
+        Args:
+            serialH: serialHandler connected to the motor Arduino
+            allocation: horizontal allocation matrix per mode,
+                {"S": 4x2, "D": 4x2}, default is the firmware mixing
+            rampRate: ramp steps per second
+            slewRate: largest change of an ESC value per second
+            resendInterval: seconds after which unchanged ESC values are sent
+                again
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.serialH = serialH
+        self.allocation = {"S": STICK_ALLOCATION, "D": DPAD_ALLOCATION}
+        if allocation is not None:
+            self.allocation.update({mode: np.asarray(matrix, dtype=float)
+                                    for mode, matrix in allocation.items()})
+        self.rampRate = rampRate
+        self.slewRate = slewRate
+        self.resendInterval = resendInterval
+        # ESC offsets from ARM, float so small steps at a high ramp rate are
+        # not lost
+        self.target = np.zeros(len(THRUSTERS))
+        self.current = np.zeros(len(THRUSTERS))
+        self.claw = 0
+        self.mode = None
+        self.lastStep = None
+        self.lastSent = None
+        self.lastSentAt = 0.0
+        self.stepCount = 0
+        self.sentCount = 0
+        self.runThreading = False
+        self.rampThread = None
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts the ramp thread, ESC values follow the first setpoint
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.rampThread is not None:
+            return
+        logging.info(f"Mixing thrusters on the Pi, ramp {self.rampRate:.0f}Hz")
+        self.runThreading = True
+        self.rampThread = threading.Thread(target=self.rampLoop,
+                                           name="thrust-mixer")
+        self.rampThread.daemon = True
+        self.rampThread.start()
+
+    def stop(self) -> None:
+        """Stops the ramp thread
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.runThreading = False
+        if self.rampThread is not None:
+            self.rampThread.join(2)
+            self.rampThread = None
+
+    def mix(self, mode: str, values) -> np.ndarray:
+        """Target of every thruster, same rules as the firmware's mainLoop
+
+        Args:
+            mode: "S" or "D", anything else keeps the horizontal targets
+            values: x, z, rotation, y, left bumper, left trigger, right bumper,
+                right trigger
+
+        Returns:
+            ESC offsets from ARM in THRUSTERS order
+        """
+        values = np.asarray(values, dtype=float)
+        target = self.target.copy()
+        matrix = self.allocation.get(mode)
+        if matrix is not None:
+            if mode == "D":
+                # The firmware truncates the DPad to whole steps and inverts x
+                axes = np.array([-np.trunc(values[0]), np.trunc(values[1])])
+            else:
+                axes = values[0:2]
+            horizontal = matrix.any(axis=1)
+            mixed = np.trunc(np.clip(matrix @ axes, -1.0, 1.0) * MAX_SPEED)
+            target[horizontal] = mixed[horizontal]
+        # Right bumper holds the depth
+        if values[6] == 0:
+            vertical = VERTICAL_ALLOCATION != 0
+            depth = np.trunc(VERTICAL_ALLOCATION * -values[3] * MAX_SPEED)
+            target[vertical] = depth[vertical]
+        # Left bumper locks the rotation
+        rotation = -np.trunc(values[2] * 100) / 100
+        if abs(rotation) >= ROTATION_THRESHOLD and values[4] == 0:
+            rotating = ROTATION_ALLOCATION != 0
+            turn = np.trunc(ROTATION_ALLOCATION * rotation * MAX_SPEED)
+            target[rotating] = turn[rotating]
+        return np.clip(target, -MAX_SPEED, MAX_SPEED)
+
+    def submitMotorCommands(self, command: str):
+        """Mixes a motor setpoint and queues the first ramp step, same
+        interface as serialHandler
+
+        Args:
+            command: motor command of the text protocol,
+                "D\\tx,z\\trotation,y\\tLb,Lt,Rb,Rt"
+
+        Returns:
+            Future resolving to the Arduino's response
+
+        Raises:
+            serialQueueFull: The motor command queue is full
+        """
+        setpoint = serialFrames.parseMotorCommand(command)
+        if setpoint is None:
+            # Not a setpoint, the Arduino answers it as before
+            return self.serialH.submitMotorCommands(command)
+        mode, values = setpoint
+        with self.lock:
+            self.mode = mode
+            self.target = self.mix(mode, values)
+            self.claw = int(values[7] >= 0.5) - int(values[5] >= 0.5)
+            return self.step(time.monotonic(), force=True)
+
+    def step(self, now: float, force: bool = False):
+        """Moves every thruster toward its target by the slew limit and sends
+        the changed ESC values, called with the lock held
+
+        Args:
+            now: time.monotonic()
+            force: send even if the ESC values did not change
+
+        Returns:
+            Future of the ESC command, None if nothing was sent
+        """
+        if self.lastStep is not None:
+            limit = self.slewRate * (now - self.lastStep)
+            self.current += np.clip(self.target - self.current, -limit, limit)
+        self.lastStep = now
+        self.stepCount += 1
+        escValues = ((ARM + np.rint(self.current)).astype(int).tolist() +
+                     [self.claw])
+        unchanged = (escValues == self.lastSent and
+                     now - self.lastSentAt < self.resendInterval)
+        if not force and unchanged:
+            return None
+        # Latest wins, a slow link only skips intermediate steps
+        command = serialFrames.escCommand(escValues[:4], escValues[4])
+        future = self.serialH.submitMotorCommands(command)
+        self.lastSent = escValues
+        self.lastSentAt = now
+        self.sentCount += 1
+        return future
+
+    def rampLoop(self) -> None:
+        """Ramp thread, steps the thrusters rampRate times per second
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        interval = 1.0 / self.rampRate
+        nextStep = time.monotonic()
+        while self.runThreading:
+            nextStep += interval
+            delay = nextStep - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind, the slew limit uses the real elapsed time anyway
+                nextStep = time.monotonic()
+            with self.lock:
+                # Like the firmware, the thrusters are not driven before the
+                # first setpoint
+                if self.mode is None:
+                    continue
+                try:
+                    self.step(time.monotonic())
+                except serialQueueFull as e:
+                    logging.error(f"Unable to queue ESC values: {e}")
+
+    def report(self) -> dict:
+        """Returns the mixer state
+
+        Args:
+            None
+
+        Returns:
+            dict with the ramp rate, target and current ESC values, and the
+            steps and commands sent
+        """
+        with self.lock:
+            target = (ARM + self.target).astype(int).tolist()
+            current = (ARM + np.rint(self.current)).astype(int).tolist()
+            return {
+                "rampHz": self.rampRate,
+                "target": dict(zip(THRUSTERS, target)),
+                "current": dict(zip(THRUSTERS, current)),
+                "claw": self.claw,
+                "steps": self.stepCount,
+                "sent": self.sentCount,
+            }
@@ -0,0 +1,186 @@
+import frameProtocol as fp
+from serialCommunication import serialQueueFull
+import threading
+import logging
+import select
+import socket
+import time
+
+
+class udpMotorServer:
+    def __init__(self, serialH, serverIP: str, serverPort: int,
+                 clientExpiry: float = 5.0) -> None:
+        """Receives motor setpoints, one FRAME_MOTOR frame per UDP datagram
+
+        A lost or late datagram is never waited for, the next setpoint replaces
+        it. Datagrams older than the newest one received from the same client
+        are discarded, and of a burst that arrived together only the newest
+        setpoint is forwarded.
+
+        Args:
+            serialH: serialHandler connected to the motor Arduino, or the
+                commandWatchdog in front of it
+            serverIP: IP address to listen on
+            serverPort: UDP port to listen on
+            clientExpiry: seconds after which a silent client is forgotten
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.serialH = serialH
+        self.serverIP = serverIP
+        self.serverPort = serverPort
+        self.clientExpiry = clientExpiry
+        # client address -> [newest sequence, time.monotonic() it was received]
+        self.clients = {}
+        self.acceptedCount = 0
+        self.staleCount = 0
+        self.errorCount = 0
+        self.runThreading = False
+        self.receiveThread = None
+        self.udpSocket = None
+
+    def start(self) -> None:
+        """Opens the UDP socket and starts the receiving thread
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            OSError: The port could not be bound
+        """
+        if self.receiveThread is not None:
+            return
+        self.udpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.udpSocket.bind((self.serverIP, self.serverPort))
+        self.udpSocket.settimeout(0.5)
+        logging.info("Listening for UDP motor setpoints on "
+                     f"{self.serverIP}:{self.serverPort}")
+        self.runThreading = True
+        self.receiveThread = threading.Thread(target=self.receiveSetpoints,
+                                              name="udp-motors")
+        self.receiveThread.daemon = True
+        self.receiveThread.start()
+
+    def stop(self) -> None:
+        """Stops the receiving thread and closes the socket
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.runThreading = False
+        if self.receiveThread is not None:
+            self.receiveThread.join(2)
+            self.receiveThread = None
+        if self.udpSocket is not None:
+            self.udpSocket.close()
+            self.udpSocket = None
+        logging.info(f"UDP motor setpoints: {self.acceptedCount} accepted, "
+                     f"{self.staleCount} stale, {self.errorCount} invalid")
+
+    def report(self) -> dict:
+        """Returns the datagram counters
+
+        Args:
+            None
+
+        Returns:
+            dict with the accepted, stale and invalid datagram counts and the
+            number of known clients
+        """
+        return {"accepted": self.acceptedCount, "stale": self.staleCount,
+                "invalid": self.errorCount, "clients": len(self.clients)}
+
+    def receiveSetpoints(self) -> None:
+        """Receiving loop, forwards the newest setpoint of every burst
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        while self.runThreading:
+            try:
+                datagrams = [self.udpSocket.recvfrom(2048)]
+            except socket.timeout:
+                self.expireClients(time.monotonic())
+                continue
+            except OSError as e:
+                logging.error(f"UDP motor socket error {e}")
+                continue
+            # Everything else already waiting is read too, only the newest
+            # setpoint matters
+            try:
+                while select.select([self.udpSocket], [], [], 0)[0]:
+                    datagrams.append(self.udpSocket.recvfrom(2048))
+            except OSError as e:
+                logging.error(f"UDP motor socket error {e}")
+            now = time.monotonic()
+            newest = None
+            for data, address in datagrams:
+                receivedFrame = self.acceptDatagram(data, address, now)
+                if receivedFrame is not None:
+                    newest = receivedFrame
+            if newest is not None:
+                try:
+                    self.serialH.submitMotorCommands(
+                        fp.motorPayloadToText(newest.payload))
+                except (ValueError, fp.frameError, serialQueueFull) as e:
+                    self.errorCount += 1
+                    logging.error("Unable to forward UDP setpoint "
+                                  f"#{newest.sequence}: {e}")
+
+    def acceptDatagram(self, data: bytes, address, now: float):
+        """Checks a datagram and records its sequence number
+
+        Args:
+            data: bytes of the datagram
+            address: (ip, port) of the sender
+            now: time.monotonic() when it was received
+
+        Returns:
+            the motor frame, None if the datagram is invalid or stale
+        """
+        try:
+            receivedFrame = fp.decodeDatagram(data)
+        except fp.frameError as e:
+            self.errorCount += 1
+            logging.warning(f"Invalid UDP datagram from {address}: {e}")
+            return None
+        if receivedFrame.type != fp.FRAME_MOTOR:
+            self.errorCount += 1
+            logging.warning(f"Unexpected frame type {receivedFrame.type} over "
+                            f"UDP from {address}")
+            return None
+        client = self.clients.get(address)
+        if client is not None and \
+                not fp.isNewerSequence(receivedFrame.sequence, client[0]):
+            self.staleCount += 1
+            return None
+        self.clients[address] = [receivedFrame.sequence, now]
+        self.acceptedCount += 1
+        return receivedFrame
+
+    def expireClients(self, now: float) -> None:
+        # A restarted client sends from a new port, its old entry would never
+        # be used again
+        for address, (sequence, lastSeen) in list(self.clients.items()):
+            if now - lastSeen > self.clientExpiry:
+                del self.clients[address]
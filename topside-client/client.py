@@ -1,60 +1,163 @@
 from tcpClient import tcpClient
+from muxClient import muxClient
+from udpMotorSender import udpMotorSender
+from linkSupervisor import linkSupervisor
+from frameProtocol import CHANNEL_MOTOR, CHANNEL_SENSOR, frameError
 from gamePad import XboxController
+from gamePadRecorder import gamePadReplay
+from clockSync import clockSync
 from dataLogger import dataLogger
+from sensorSchema import CSV_HEADER
+from latencyStats import latencyStats
+from controlScheduler import controlScheduler
 import threading
 import logging
 import time
 from datetime import datetime
 
+
+def readMotorCommand(gamePad, gamePadState, deadband):
+    """Builds the motor command from a gamepad snapshot
+
+    Args:
+        gamePad: XboxController the snapshot was taken from
+        gamePadState: gamePadState snapshot, every value comes from the same
+            instant
+        deadband: function applied to the analog stick values, e.g.
+            controlScheduler.applyDeadband
+
+    Returns:
+        (mode, values, main buttons), see tcpClient.sendMotorCommand and
+        XboxController.readMainButtons
+    """
+    gamePadTriggers = gamePad.readTriggers(gamePadState)
+    gamePadSticks = gamePad.readAnalogSticks(gamePadState)
+    gamePadButtons = gamePad.readMainButtons(gamePadState)
+    # Use the following values if using both joysticks
+    # mode, values = "S", [deadband(gamePadSticks[1]),
+    #                      deadband(gamePadSticks[2]),
+    #                      deadband(gamePadSticks[4]),
+    #                      deadband(gamePadSticks[5])] + gamePadTriggers
+    # Use the following values if using dpad and right joystick
+    mode, values = "D", [gamePadButtons[6], gamePadButtons[7],
+                         deadband(gamePadSticks[4]),
+                         deadband(gamePadSticks[5])] + gamePadTriggers
+    return mode, values, gamePadButtons
+
+
 class main:
-    def __init__(self, serverIP, serverPort) -> None:
+    def __init__(self, serverIP, serverPort, protocol="binary", sensorRate=20,
+                 controlRate=30, logFormat="binary", traceEvery=10,
+                 multiplex=False, motorTransport="tcp", replayPath=None,
+                 replaySpeed=1.0) -> None:
         # Server variabeles
         self.serverIP = serverIP
         self.motorPort = serverPort
         self.sensorPort = serverPort + 1
+        # "binary" or the legacy "text" protocol, multiplexing needs frames
+        self.protocol = "binary" if multiplex else protocol
+        # sensor readings per second pushed by the server
+        self.sensorRate = sensorRate
+        # one motor command out of traceEvery reports its latency per hop,
+        # 0 disables
+        self.traceEvery = traceEvery
+        # motor and sensor channels share one binary connection
+        self.multiplex = multiplex
+        # "udp" sends setpoints as datagrams, sensors and control stay on TCP
+        self.motorTransport = motorTransport
         self.runThreading = True
         self.sendComPortCommands = False
         print("Starting...")
         logging.debug("Initializing Main - IP {self.serverIP}, MotorTCP: {self.motorPort}, SensorTCP: {self.sensorPort}")
         # Objects 
-        self.gamePad = XboxController()
+        # A recorded session replaces the gamepad for repeatable load tests,
+        # it starts with the joystick thread
+        self.replay = None
+        if replayPath:
+            self.replay = gamePadReplay(replayPath, replaySpeed,
+                                        autoStart=False)
+        self.gamePad = XboxController(self.replay)
+        self.controlScheduler = controlScheduler(controlRate)
+        self.latencyStats = latencyStats()
         self.tcp_motors = None
         self.tcp_sensors = None
-        self.dataSave = dataLogger(["Time(s)","Humidity(%)","Enclosure Temperature(C)","Leak","Vin(Vrms)","Vout(Vrms)","Current Out(A)", "PMBus Temperature(C)", "Power Out(W)"])
+        self.udp_motors = None
+        self.motorSender = None
+        # Reconnects every socket in the background when one fails, the control
+        # thread never blocks on it
+        self.link = linkSupervisor("server", self.connectSockets)
+        # Offset of the server clock, so the server's sample times can be
+        # logged in topside time. The exchanges go over the sensor connection,
+        # see streamSensorData
+        self.clockSync = clockSync() if self.protocol == "binary" else None
+        # logFormat "binary" writes typed .klog records, "csv" text logs
+        self.dataSave = dataLogger(CSV_HEADER, logFormat=logFormat)
         # print("READY")
 
 
 
     def startSockets(self):
         logging.info("Starting Sockets")
-        successfulConection = False
-        while not successfulConection:
-            try:
-                self.tcp_motors = tcpClient(self.serverIP, self.motorPort)
-                self.tcp_sensors = tcpClient(self.serverIP, self.sensorPort)
-                self.tcp_motors.startConnection()
-                self.tcp_sensors.startConnection()
-                successfulConection = True
-            except ConnectionRefusedError as e:
-                print(f"Connection Refused Error: {e}")
-                logging.debug(f"Starting Socket - Connection Refused Error: {e}")
-                successfulConection = False
-            except OSError as e:
-                print(f"OS Error: {e}")
-                logging.debug(f"Starting Socket - OS Error: {e}")
-                successfulConection = False
-            except Exception as e:
-                print(f"Error: {e}")
-                logging.debug(f"Starting Socket - Error: {e}")
-                successfulConection = False
-            # Retry connection
-            time.sleep(1)
+        try:
+            self.connectSockets()
+            self.link.linkUp()
+        except OSError as e:
+            print(f"Unable to connect: {e}, retrying")
+            logging.debug(f"Starting Socket - OS Error: {e}")
+            # Retried with backoff by the supervisor
+            self.link.linkDown(str(e))
+            self.link.waitUp()
         print("Connected")
 
+    def connectSockets(self):
+        # Also used by the supervisor to reconnect, the previous sockets are
+        # closed first
+        self.closeSockets()
+        if self.multiplex:
+            # Both threads use the same connection, their requests are told
+            # apart by channel
+            self.tcp_motors = muxClient(self.serverIP, self.motorPort,
+                                        self.latencyStats, self.traceEvery)
+            self.tcp_sensors = self.tcp_motors
+            self.tcp_motors.startConnection()
+        else:
+            self.tcp_motors = tcpClient(self.serverIP, self.motorPort,
+                                        self.protocol, CHANNEL_MOTOR,
+                                        self.latencyStats, self.traceEvery)
+            self.tcp_sensors = tcpClient(self.serverIP, self.sensorPort,
+                                         self.protocol, CHANNEL_SENSOR)
+            self.tcp_motors.startConnection()
+            self.tcp_sensors.startConnection()
+        self.motorSender = self.tcp_motors
+        if self.motorTransport == "udp":
+            self.udp_motors = udpMotorSender(self.serverIP, self.motorPort)
+            self.udp_motors.startConnection()
+            self.motorSender = self.udp_motors
+        return True
+
+    def closeSockets(self):
+        for connection in {self.tcp_motors, self.tcp_sensors, self.udp_motors}:
+            if connection is not None:
+                try:
+                    connection.closeConnection()
+                except (OSError, AttributeError):
+                    # Never connected, or already closed
+                    pass
+        self.tcp_motors = None
+        self.tcp_sensors = None
+        self.udp_motors = None
+        self.motorSender = None
 
+    def connectionFailed(self, connection, error):
+        # A socket replaced by a reconnect in the meantime says nothing about
+        # the current link
+        if connection in (self.tcp_motors, self.tcp_sensors, self.udp_motors):
+            self.link.linkDown(str(error))
 
     def startThreads(self):
         logging.info("Starting Threads")
+        if self.traceEvery:
+            self.latencyStats.startPeriodicDump()
         try:
             motorThread = threading.Thread(target=self.__Thread_process_joystick__)
             sensorThread = threading.Thread(target=self.__Thread_process_data__)
@@ -67,29 +170,56 @@ class main:
                 sensorThread.join(1)
         except KeyboardInterrupt:
             logging.warning("Keyboard Interrupt was preformed, closing threads")
+        # Make sure every queued row reaches the disk
+        self.dataSave.closeFile()
 
 
     def __Thread_process_joystick__(self):
         logging.info("Starting Joystick thread")
+        lastVersion = -1
+        lastSentVersion = -1
+        if self.replay is not None:
+            self.replay.start()
         while True:
             if self.runThreading:
-                gamePadTriggers = self.gamePad.readTriggers()
-                gamePadSticks = self.gamePad.readAnalogSticks()
-                gamePadButtons = self.gamePad.readMainButtons()
+                # Sleep until the input changes or a keepalive is due, then
+                # respect the maximum rate
+                lastVersion = self.gamePad.waitForChange(
+                    lastVersion,
+                    self.controlScheduler.keepaliveInterval).version
+                self.controlScheduler.waitForNextTick()
+                # One snapshot so every value of the command comes from the
+                # same instant
+                gamePadState = self.gamePad.snapshot()
+                lastVersion = gamePadState.version
+                mode, values, gamePadButtons = readMotorCommand(
+                    self.gamePad, gamePadState,
+                    self.controlScheduler.applyDeadband)
 
                 # COM Port is active
                 if self.sendComPortCommands:
-                    # Use the following format if using both joysticks
-                    # formmatedData = f"S\t{gamePadSticks[1]},{gamePadSticks[2]}\t{gamePadSticks[4]},{gamePadSticks[5]}\t{gamePadTriggers[0]},{gamePadTriggers[1]},{gamePadTriggers[2]},{gamePadTriggers[3]}"
-                    # Use the following format if using dpad and right joystick
-                    formmatedData = f"D\t{gamePadButtons[6]},{gamePadButtons[7]}\t{gamePadSticks[4]},{gamePadSticks[5]}\t{gamePadTriggers[0]},{gamePadTriggers[1]},{gamePadTriggers[2]},{gamePadTriggers[3]}"
-
-                    print(self.tcp_motors.sendData("MOT"+formmatedData))
+                    # Only changed commands are sent, plus a keepalive while
+                    # the input is idle
+                    if self.controlScheduler.shouldSend(mode, values):
+                        # Keepalives repeat an old input, they do not say
+                        # anything about input latency
+                        inputTimestamp = None
+                        if gamePadState.version != lastSentVersion:
+                            inputTimestamp = gamePadState.timestamp
+                        lastSentVersion = gamePadState.version
+                        print(self.sendMotorCommand(mode, values,
+                                                    inputTimestamp))
                 # SELECT + START to stop threading
                 if gamePadButtons[4] == 1 and gamePadButtons[5]== 1:
                     print("STOPING THREADS")
                     self.runThreading = False
 
+                # A replayed session ends once its last input was handled
+                if self.gamePad.finished.is_set() and \
+                        lastVersion == self.gamePad.snapshot().version:
+                    print("REPLAY FINISHED")
+                    self.runThreading = False
+
 
 
                 # Start Button to start sending data to arduinos
@@ -100,24 +230,87 @@ class main:
             else:
                 break
 
+    def sendMotorCommand(self, mode, values, inputTimestamp):
+        # Fails fast while the supervisor reconnects, the keepalive resends the
+        # setpoint once the link is back
+        motorSender = self.motorSender
+        if not self.link.isUp() or motorSender is None:
+            return "NOT CONNECTED"
+        try:
+            return motorSender.sendMotorCommand(mode, values, inputTimestamp)
+        except (OSError, frameError) as e:
+            logging.error(f"Unable to send motor command: {e}")
+            self.connectionFailed(motorSender, e)
+            return "NOT CONNECTED"
 
-    
     def __Thread_process_data__(self):
         logging.info("Starting DATA thread")
+        if self.protocol == "binary":
+            self.streamSensorData()
+            return
         lastDataCap = self.current_milli_time()
         while True:
             if self.runThreading  and self.sendComPortCommands and(self.current_milli_time() - lastDataCap >= 50):
                 # Fetch Data from the sensor server thread
-                returnedData = self.tcp_sensors.sendData("SEN")
-                # Parse Data
-                returnedDataCSV = returnedData.replace("\t",",")
-                returnedDataCSV = f"{datetime.now()},{returnedDataCSV}"
-                returnedDataList = returnedDataCSV.split(",")
-                print(returnedDataList)
-                self.dataSave.writeCSVString(returnedDataCSV)
+                sensors = self.tcp_sensors
+                if not self.link.isUp():
+                    lastDataCap = self.current_milli_time()
+                    continue
+                try:
+                    returnedData = sensors.requestSensorSample()
+                except (OSError, frameError) as e:
+                    logging.error(f"Unable to read sensor data: {e}")
+                    self.connectionFailed(sensors, e)
+                    lastDataCap = self.current_milli_time()
+                    continue
+                except ValueError as e:
+                    logging.error(f"Unable to read sensor data: {e}")
+                    lastDataCap = self.current_milli_time()
+                    continue
+                self.recordSensorData(returnedData)
                 lastDataCap = self.current_milli_time()
             elif (self.runThreading == False):
                 break
+
+    def streamSensorData(self):
+        # Wait for the pilot to press start, then let the server push readings
+        while self.runThreading and not self.sendComPortCommands:
+            time.sleep(0.05)
+        while self.runThreading:
+            # Subscriptions belong to a connection, a new one is made after
+            # every reconnect
+            if not self.link.waitUp(1.0):
+                continue
+            sensors = self.tcp_sensors
+            try:
+                if self.clockSync is not None:
+                    # Nothing else uses the connection yet, back to back
+                    # exchanges give the best delays
+                    self.clockSync.syncBurst(sensors)
+                sensors.subscribeSensors(self.sensorRate)
+                while self.runThreading:
+                    sample = sensors.readSensorSample()
+                    self.recordSensorData(sample)
+                    if self.clockSync is not None and self.clockSync.isDue():
+                        self.clockSync.exchange(sensors)
+            except (OSError, frameError) as e:
+                logging.error(f"Sensor stream interrupted: {e}")
+                self.connectionFailed(sensors, e)
+
+    def recordSensorData(self, sample):
+        # Samples are already decoded into numbers, they are stored as is
+        timestamp = time.time()
+        print([str(datetime.fromtimestamp(timestamp))] + sample.values)
+        rovTime = None
+        if self.clockSync is not None:
+            rovTime = self.clockSync.toLocalTime(sample.sampleTime)
+        if rovTime is not None:
+            # Server send to topside receive, the reading's age on the server
+            # is not included
+            self.latencyStats.record("sensorOneWay",
+                                     timestamp - rovTime - sample.age)
+        self.dataSave.writeRecord(timestamp, sample.values, sample.sequence,
+                                  sample.age, rovTime)
     
     def current_milli_time(self):
         return round(time.time() * 1000)
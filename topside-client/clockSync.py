@@ -0,0 +1,189 @@
+# Estimates the offset and drift of the ROV server clock against the topside
+# clock
+#
+# Every exchange gives four time.time() values, t1 request sent and t4 reply
+# received on the topside, t2 request received and t3 reply sent on the server,
+# like NTP:
+#   offset = ((t2 - t1) + (t3 - t4)) / 2    server clock minus topside clock
+#   delay = (t4 - t1) - (t3 - t2)           network round trip
+# An asymmetric route shifts the offset by at most delay / 2, so only the
+# exchanges with the lowest delays are used, and a line fitted through their
+# offsets gives the drift.
+
+import numpy as np
+import collections
+import threading
+import logging
+import time
+
+# localTime: topside time.time() halfway through the exchange
+syncSample = collections.namedtuple("syncSample",
+                                    ["localTime", "offset", "delay"])
+# offset at referenceTime, drift in seconds per second
+clockEstimate = collections.namedtuple("clockEstimate",
+                                       ["referenceTime", "offset", "drift",
+                                        "delay"])
+
+
+class clockSync:
+    def __init__(self, interval: float = 5.0, window: int = 64, burst: int = 8,
+                 bestFraction: float = 0.25,
+                 minDriftSpan: float = 60.0) -> None:
+        """Estimates the server clock from exchanges on an open connection
+
+        The owner of the connection calls syncBurst after every (re)connection,
+        before subscribing, and exchange between two readings whenever isDue.
+
+        Args:
+            interval: seconds between two exchanges
+            window: exchanges kept for the estimate
+            burst: exchanges made back to back by syncBurst, so the first
+                estimate is quick
+            bestFraction: fraction of the exchanges with the lowest delay used
+                for the estimate
+            minDriftSpan: seconds the used exchanges must span before a drift
+                is fitted
+
+        Returns:
+            null
+        """
+        self.interval = interval
+        self.burst = burst
+        self.bestFraction = bestFraction
+        self.minDriftSpan = minDriftSpan
+        self.samples = collections.deque(maxlen=window)
+        self.estimate = None
+        self.nextExchange = 0.0
+        self.exchangeCount = 0
+        self.lastError = None
+        self.lock = threading.Lock()
+
+    def isDue(self) -> bool:
+        return time.monotonic() >= self.nextExchange
+
+    def exchange(self, client):
+        """Makes one exchange on the client's connection
+
+        Args:
+            client: tcpClient or muxClient, only called by the thread that
+                reads its replies
+
+        Returns:
+            syncSample, None if the server does not answer time sync
+
+        Raises:
+            OSError: The connection failed, the owner reconnects as for any
+                other request
+            frameError: The reply is not a valid frame
+        """
+        self.nextExchange = time.monotonic() + self.interval
+        try:
+            t1, t2, t3, t4 = client.requestTimeSync()
+        except ValueError as e:
+            if self.lastError is None:
+                logging.warning(f"Clock sync failed: {e}")
+            self.lastError = str(e)
+            return None
+        sample = syncSample((t1 + t4) / 2, ((t2 - t1) + (t3 - t4)) / 2,
+                            (t4 - t1) - (t3 - t2))
+        self.addSample(sample)
+        self.exchangeCount += 1
+        self.lastError = None
+        return sample
+
+    def syncBurst(self, client) -> None:
+        """Makes burst exchanges back to back on an otherwise idle connection
+
+        Args:
+            client: tcpClient or muxClient
+
+        Returns:
+            null
+
+        Raises:
+            OSError: The connection failed
+            frameError: A reply is not a valid frame
+        """
+        for _ in range(self.burst):
+            if self.exchange(client) is None:
+                return
+
+    def addSample(self, sample) -> None:
+        """Adds an exchange and updates the estimate
+
+        Args:
+            sample: syncSample
+
+        Returns:
+            null
+        """
+        with self.lock:
+            self.samples.append(sample)
+            samples = np.array(self.samples)
+        # Lowest delays first, they carry the least asymmetry
+        bestCount = max(1, int(len(samples) * self.bestFraction))
+        best = samples[np.argsort(samples[:, 2])[:bestCount]]
+        localTimes, offsets, delays = best[:, 0], best[:, 1], best[:, 2]
+        referenceTime = float(localTimes.mean())
+        if len(best) >= 3 and np.ptp(localTimes) >= self.minDriftSpan:
+            drift, offset = np.polyfit(localTimes - referenceTime, offsets, 1)
+        else:
+            drift, offset = 0.0, np.median(offsets)
+        self.estimate = clockEstimate(referenceTime, float(offset),
+                                      float(drift), float(delays.min()))
+
+    def isSynced(self) -> bool:
+        return self.estimate is not None
+
+    def offsetAt(self, localTime: float) -> float:
+        """Server clock minus topside clock at a topside time
+
+        Args:
+            localTime: topside time.time()
+
+        Returns:
+            offset in seconds, 0 before the first exchange
+        """
+        estimate = self.estimate
+        if estimate is None:
+            return 0.0
+        elapsed = localTime - estimate.referenceTime
+        return estimate.offset + estimate.drift * elapsed
+
+    def toLocalTime(self, remoteTime: float):
+        """Converts a server time.time() to topside time
+
+        Args:
+            remoteTime: server time.time(), e.g.
+                frameProtocol.sensorSample.sampleTime
+
+        Returns:
+            topside time.time() of the same instant, None before the first
+            exchange or for a missing time
+        """
+        if self.estimate is None or not remoteTime:
+            return None
+        # The drift changes the offset by microseconds over the difference
+        # between both clocks
+        return remoteTime - self.offsetAt(remoteTime - self.estimate.offset)
+
+    def report(self) -> dict:
+        """Returns the current estimate
+
+        Args:
+            null
+
+        Returns:
+            dict with the offset and best delay in ms, the drift in ppm and the
+            exchange count
+        """
+        estimate = self.estimate
+        report = {"synced": estimate is not None, "offsetMs": None,
+                  "driftPpm": None, "delayMs": None,
+                  "exchanges": self.exchangeCount,
+                  "lastError": self.lastError}
+        if estimate is not None:
+            report["offsetMs"] = round(self.offsetAt(time.time()) * 1000, 3)
+            report["driftPpm"] = round(estimate.drift * 1e6, 2)
+            report["delayMs"] = round(estimate.delay * 1000, 3)
+        return report
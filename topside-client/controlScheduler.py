@@ -0,0 +1,94 @@
+import logging
+import time
+
+
+class controlScheduler:
+    def __init__(self, rate: float = 30.0, deadband: float = 0.08,
+                 changeThreshold: float = 0.02,
+                 keepaliveInterval: float = 0.5) -> None:
+        """Decides when the joystick thread sends a motor command
+
+        Commands are evaluated at a fixed rate and only sent when they
+        changed, with a low rate keepalive so the server knows the topside
+        is still there.
+
+        Args:
+            rate: command evaluations per second
+            deadband: analog values closer than this to 0 are sent as 0
+            changeThreshold: smallest change of a value that counts as a new
+                command
+            keepaliveInterval: seconds between repeated commands while the
+                input is idle
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.interval = 1.0 / rate
+        self.deadband = deadband
+        self.changeThreshold = changeThreshold
+        self.keepaliveInterval = keepaliveInterval
+        self.nextTick = time.monotonic()
+        self.lastCommand = None
+        self.lastSendTime = 0.0
+        self.sentCount = 0
+        self.skippedCount = 0
+        logging.debug(f"Control scheduler at {rate}Hz, deadband {deadband}, "
+                      f"keepalive {keepaliveInterval}s")
+
+    def waitForNextTick(self) -> None:
+        """Sleeps until the next evaluation, ticks that were missed are skipped
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.nextTick += self.interval
+        delay = self.nextTick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.nextTick = time.monotonic()
+
+    def applyDeadband(self, value: float) -> float:
+        """Removes stick drift around the centre
+
+        Args:
+            value: normalized analog value
+
+        Returns:
+            0 inside the deadband, otherwise the value
+        """
+        return 0.0 if abs(value) < self.deadband else value
+
+    def shouldSend(self, mode: str, values: list) -> bool:
+        """Checks if a command is worth sending and records it as sent if so
+
+        Args:
+            mode: motor command mode, 'D' or 'S'
+            values: motor command values
+
+        Returns:
+            True if the command changed or a keepalive is due
+        """
+        now = time.monotonic()
+        if self.lastCommand is None or mode != self.lastCommand[0]:
+            changed = True
+        else:
+            changed = any(abs(value - lastValue) > self.changeThreshold
+                          for value, lastValue in zip(values,
+                                                      self.lastCommand[1]))
+        if changed or now - self.lastSendTime >= self.keepaliveInterval:
+            self.lastCommand = (mode, list(values))
+            self.lastSendTime = now
+            self.sentCount += 1
+            return True
+        self.skippedCount += 1
+        return False
@@ -1,15 +1,98 @@
 from datetime import datetime
+import sensorSchema
+import numpy as np
+import atexit
 import csv
 import logging
+import os
+import queue
+import threading
+import time
 
 
 class dataLogger:
-    def __init__(self, dataCategories: list) -> None:
-        logging_path = datetime.now().strftime("data_logs/log-%b-%d-%Y-%H-%M.csv")
+    def __init__(self, dataCategories: list, logDirectory: str = "data_logs",
+                 flushRows: int = 50, flushInterval: float = 1.0,
+                 maxFileSize: int = 50 * 1024 * 1024,
+                 maxFileDuration: float = 30 * 60, queueSize: int = 10000,
+                 logFormat: str = "csv") -> None:
+        """Writes rows to log files from a background thread
+
+        Rows are queued by the caller and written in batches, a slow disk never
+        blocks the sensor thread. A new file is started when the current one is
+        too large or too old.
+
+        Args:
+            dataCategories: Header row written at the top of every csv file
+            logDirectory: Directory holding the log files
+            flushRows: Rows written before the file is flushed
+            flushInterval: Seconds after which pending rows are flushed
+            maxFileSize: Bytes after which a new file is started
+            maxFileDuration: Seconds after which a new file is started
+            queueSize: Rows that can wait for the writer, further rows are
+                dropped
+            logFormat: "csv" for text files, "binary" for sensorSchema records
+                in .klog files
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        self.dataCategories = dataCategories
+        self.logFormat = logFormat
+        self.pendingRecords = []
+        self.logDirectory = logDirectory
+        self.flushRows = flushRows
+        self.flushInterval = flushInterval
+        self.maxFileSize = maxFileSize
+        self.maxFileDuration = maxFileDuration
+        self.rowQueue = queue.Queue(maxsize=queueSize)
+        self.droppedRows = 0
+        self.writeErrors = 0
+        self.filePart = 0
+        self.closed = False
+        self.openFile()
+
+        self.writerThread = threading.Thread(target=self.writeRows,
+                                             name="data-logger")
+        self.writerThread.daemon = True
+        self.writerThread.start()
+        # Pending rows reach the disk even if closeFile is never called
+        atexit.register(self.closeFile)
+
+    def openFile(self) -> None:
+        """Starts a new log file and writes the header
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        fileName = datetime.now().strftime("log-%b-%d-%Y-%H-%M")
+        logging_path = os.path.join(self.logDirectory, fileName)
+        if self.filePart > 0:
+            logging_path += f"-part{self.filePart}"
+        logging_path += ".klog" if self.logFormat == "binary" else ".csv"
         logging.info(f"Preparing data logging file at {logging_path}")
-        self.csvFile = open(logging_path, "w", newline='')
-        self.csvWriter = csv.writer(self.csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        self.writeData(dataCategories)
+        if self.logFormat == "binary":
+            self.logFile = open(logging_path, "wb")
+            sensorSchema.writeLogHeader(self.logFile)
+        else:
+            self.logFile = open(logging_path, "w", newline='')
+            self.csvWriter = csv.writer(self.logFile, delimiter=',',
+                                        quotechar='"',
+                                        quoting=csv.QUOTE_MINIMAL)
+            self.csvWriter.writerow(self.dataCategories)
+        # Counted once the file is open, a failed rotation keeps its part
+        self.filePart += 1
+        self.fileOpened = time.monotonic()
+
     def writeData(self, data:list) -> None:
         """Writes line of data to the csv file
 
@@ -22,7 +105,40 @@ class dataLogger:
         Raises:
             null
         """
-        self.csvWriter.writerow(data)
+        try:
+            self.rowQueue.put_nowait(data)
+        except queue.Full:
+            self.droppedRows += 1
+            if self.droppedRows % 100 == 1:
+                logging.warning("Data logger queue is full, "
+                                f"{self.droppedRows} rows dropped")
+
+    def writeRecord(self, timestamp: float, values: list, sequence: int = 0,
+                    age: float = 0.0, rovTime: float = None) -> None:
+        """Writes a sensor sample, stored as a typed record in binary logs
+
+        Args:
+            timestamp: time.time() of the sample
+            values: sensor values in sensorSchema.SENSOR_SCHEMA order
+            sequence: reading sequence reported by the server
+            age: reading age reported by the server
+            rovTime: server sample time converted to topside time by clockSync,
+                None if the clocks are not synced
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        if self.logFormat == "binary":
+            self.writeData(sensorSchema.makeRecord(timestamp, values, sequence,
+                                                   age, rovTime))
+        else:
+            rovColumn = ("" if rovTime is None
+                         else datetime.fromtimestamp(rovTime))
+            self.writeData([datetime.fromtimestamp(timestamp)] + list(values) +
+                           [rovColumn])
 
     def writeCSVString(self, data:str) -> None:
         """Writes line of data to the csv file from a string csv
@@ -39,8 +155,12 @@ class dataLogger:
         formattedData = data.split(",")
         self.writeData(formattedData)
 
-    def closeFile(self) -> None:
-        """Closes the file
+    def writeRows(self) -> None:
+        """Writer thread, writes queued rows and flushes them in batches
+
+        A batch that fails to reach the disk is logged and dropped, the thread
+        keeps draining the queue and retries a failed file rotation with the
+        next batch.
 
         Args:
             null
@@ -51,7 +171,72 @@ class dataLogger:
         Raises:
             null
         """
-        logging.debug("Closing logging file")
-        self.csvFile.close()
+        pendingRows = 0
+        lastFlush = time.monotonic()
+        running = True
+        while running:
+            try:
+                row = self.rowQueue.get(timeout=self.flushInterval)
+                if row is None:
+                    running = False
+                else:
+                    self.pendingRecords.append(row)
+                    pendingRows += 1
+            except queue.Empty:
+                pass
 
+            now = time.monotonic()
+            if pendingRows and (pendingRows >= self.flushRows
+                                or now - lastFlush >= self.flushInterval
+                                or not running):
+                try:
+                    if self.logFile.closed:
+                        # The last rotation could not open a new file
+                        self.openFile()
+                    if self.logFormat == "binary":
+                        # One write per batch, the records are already fixed
+                        # width
+                        records = np.array(self.pendingRecords,
+                                           dtype=sensorSchema.RECORD_DTYPE)
+                        self.logFile.write(records.tobytes())
+                    else:
+                        self.csvWriter.writerows(self.pendingRecords)
+                    self.logFile.flush()
+                    if self.logFile.tell() >= self.maxFileSize or \
+                            now - self.fileOpened >= self.maxFileDuration:
+                        self.logFile.close()
+                        self.openFile()
+                except OSError as e:
+                    self.writeErrors += 1
+                    self.droppedRows += pendingRows
+                    if self.writeErrors % 100 == 1:
+                        logging.error(f"Data logger could not write to "
+                                      f"{self.logFile.name}, "
+                                      f"{self.droppedRows} rows dropped: {e}")
+                self.pendingRecords = []
+                pendingRows = 0
+                lastFlush = now
+        try:
+            self.logFile.close()
+        except OSError as e:
+            logging.error(f"Data logger could not close {self.logFile.name}: "
+                          f"{e}")
 
+    def closeFile(self) -> None:
+        """Writes the pending rows and closes the file
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        if self.closed:
+            return
+        self.closed = True
+        logging.debug("Closing logging file")
+        self.rowQueue.put(None)
+        self.writerThread.join()
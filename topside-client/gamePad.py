@@ -23,109 +23,144 @@
 
 
 from inputs import get_gamepad
+import collections
 import math
 import threading
+import time
+
+STATE_FIELDS = ["LeftJoystickY", "LeftJoystickX", "RightJoystickY",
+                "RightJoystickX", "LeftTrigger", "RightTrigger", "LeftBumper",
+                "RightBumper", "A", "X", "Y", "B", "LeftThumb", "RightThumb",
+                "Back", "Start", "DPadX", "DPadY"]
+# version increments on every change, timestamp is the time.monotonic() of the
+# change
+gamePadState = collections.namedtuple("gamePadState",
+                                      STATE_FIELDS + ["version", "timestamp"])
 
 class XboxController(object):
     MAX_TRIG_VAL = math.pow(2, 8)
     MAX_JOY_VAL = math.pow(2, 15)
 
-    def __init__(self):
-
-        self.LeftJoystickY = 0
-        self.LeftJoystickX = 0
-        self.RightJoystickY = 0
-        self.RightJoystickX = 0
-        self.LeftTrigger = 0
-        self.RightTrigger = 0
-        self.LeftBumper = 0
-        self.RightBumper = 0
-        self.A = 0
-        self.X = 0
-        self.Y = 0
-        self.B = 0
-        self.LeftThumb = 0
-        self.RightThumb = 0
-        self.Back = 0
-        self.Start = 0
-        self.DPadX = 0
-        self.DPadY = 0
+    # event code -> (index in STATE_FIELDS, scale), analog values are
+    # normalized by their scale
+    EVENT_MAP = {
+        # normalize between -1 and 1
+        'ABS_Y': (STATE_FIELDS.index("LeftJoystickY"), MAX_JOY_VAL),
+        'ABS_X': (STATE_FIELDS.index("LeftJoystickX"), MAX_JOY_VAL),
+        'ABS_RY': (STATE_FIELDS.index("RightJoystickY"), MAX_JOY_VAL),
+        'ABS_RX': (STATE_FIELDS.index("RightJoystickX"), MAX_JOY_VAL),
+        # normalize between 0 and 1
+        'ABS_Z': (STATE_FIELDS.index("LeftTrigger"), MAX_TRIG_VAL),
+        'ABS_RZ': (STATE_FIELDS.index("RightTrigger"), MAX_TRIG_VAL),
+        'BTN_TL': (STATE_FIELDS.index("LeftBumper"), 1),
+        'BTN_TR': (STATE_FIELDS.index("RightBumper"), 1),
+        'BTN_SOUTH': (STATE_FIELDS.index("A"), 1),
+        'BTN_NORTH': (STATE_FIELDS.index("X"), 1),
+        'BTN_WEST': (STATE_FIELDS.index("Y"), 1),
+        'BTN_EAST': (STATE_FIELDS.index("B"), 1),
+        'BTN_THUMBL': (STATE_FIELDS.index("LeftThumb"), 1),
+        'BTN_THUMBR': (STATE_FIELDS.index("RightThumb"), 1),
+        'BTN_SELECT': (STATE_FIELDS.index("Back"), 1),
+        'BTN_START': (STATE_FIELDS.index("Start"), 1),
+        'ABS_HAT0X': (STATE_FIELDS.index("DPadX"), 1),
+        'ABS_HAT0Y': (STATE_FIELDS.index("DPadY"), 1),
+    }
+
+    def __init__(self, eventSource=None):
+        """Reads the gamepad in a background thread
+
+        Args:
+            eventSource: callable returning the next batch of events, default
+                is inputs.get_gamepad, e.g. gamePadRecorder.gamePadReplay to
+                rerun a recorded session. It raises EOFError when it has no
+                more events.
+        """
+        self.eventSource = eventSource or get_gamepad
+        # Readers only ever see a complete gamePadState, it is replaced in a
+        # single assignment
+        self.state = gamePadState(*([0] * len(STATE_FIELDS)), 0,
+                                  time.monotonic())
+        self._changed = threading.Condition()
+        # Set once the event source is exhausted, the last state stays
+        # available
+        self.finished = threading.Event()
 
         self._monitor_thread = threading.Thread(target=self._monitor_controller, args=())
         self._monitor_thread.daemon = True
         self._monitor_thread.start()
 
+    def snapshot(self):
+        """Returns every input captured at the same instant
+
+        Returns:
+            gamePadState
+        """
+        return self.state
+
+    def waitForChange(self, lastVersion, timeout=None):
+        """Blocks until the input changes
+
+        Args:
+            lastVersion: version of the last state seen by the caller
+            timeout: seconds to wait, None waits forever
+
+        Returns:
+            The latest gamePadState, its version equals lastVersion if the wait
+            timed out
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.state.version != lastVersion,
+                                   timeout)
+        return self.state
+
+    # return the buttons/triggers that you care about in this methode
+    def readMainButtons(self, state=None):
+        s = state or self.state
+        return [s.A, s.B, s.X, s.Y, s.Start, s.Back, s.DPadX, s.DPadY]
+
+    def readTriggers(self, state=None):
+        s = state or self.state
+        return [s.LeftBumper, s.LeftTrigger, s.RightBumper, s.RightTrigger]
 
-    def readMainButtons(self): # return the buttons/triggers that you care about in this methode
-        a = self.A
-        b = self.B
-        x = self.X
-        y = self.Y
-        dx = self.DPadX
-        dy = self.DPadY
-        st = self.Start
-        ba = self.Back
-        return [a, b, x, y, st, ba, dx, dy]
-
-    def readTriggers(self):
-        lb = self.LeftBumper
-        rb = self.RightBumper
-        lt = self.LeftTrigger
-        rt = self.RightTrigger
-        return [lb, lt, rb, rt]
-
-    def readAnalogSticks(self):
-        lx = self.LeftJoystickX
-        ly = self.LeftJoystickY
-        rx = self.RightJoystickX
-        ry = self.RightJoystickY
-        lh = self.LeftThumb
-        rh = self.RightThumb
-        return [lh, lx, ly, rh, rx, ry]
+    def readAnalogSticks(self, state=None):
+        s = state or self.state
+        return [s.LeftThumb, s.LeftJoystickX, s.LeftJoystickY, s.RightThumb,
+                s.RightJoystickX, s.RightJoystickY]
 
 
     def _monitor_controller(self):
+        values = list(self.state[:len(STATE_FIELDS)])
+        version = 0
         while True:
-            events = get_gamepad()
+            try:
+                events = self.eventSource()
+            except EOFError:
+                self.finished.set()
+                return
+            changed = False
             for event in events:
-                if event.code == 'ABS_Y':
-                    self.LeftJoystickY = event.state / XboxController.MAX_JOY_VAL # normalize between -1 and 1
-                elif event.code == 'ABS_X':
-                    self.LeftJoystickX = event.state / XboxController.MAX_JOY_VAL # normalize between -1 and 1
-                elif event.code == 'ABS_RY':
-                    self.RightJoystickY = event.state / XboxController.MAX_JOY_VAL # normalize between -1 and 1
-                elif event.code == 'ABS_RX':
-                    self.RightJoystickX = event.state / XboxController.MAX_JOY_VAL # normalize between -1 and 1
-                elif event.code == 'ABS_Z':
-                    self.LeftTrigger = event.state / XboxController.MAX_TRIG_VAL # normalize between 0 and 1
-                elif event.code == 'ABS_RZ':
-                    self.RightTrigger = event.state / XboxController.MAX_TRIG_VAL # normalize between 0 and 1
-                elif event.code == 'BTN_TL':
-                    self.LeftBumper = event.state
-                elif event.code == 'BTN_TR':
-                    self.RightBumper = event.state
-                elif event.code == 'BTN_SOUTH':
-                    self.A = event.state
-                elif event.code == 'BTN_NORTH':
-                    self.X = event.state
-                elif event.code == 'BTN_WEST':
-                    self.Y = event.state
-                elif event.code == 'BTN_EAST':
-                    self.B = event.state
-                elif event.code == 'BTN_THUMBL':
-                    self.LeftThumb = event.state
-                elif event.code == 'BTN_THUMBR':
-                    self.RightThumb = event.state
-                elif event.code == 'BTN_SELECT':
-                    self.Back = event.state
-                elif event.code == 'BTN_START':
-                    self.Start = event.state
-                elif event.code == 'ABS_HAT0X':
-                    self.DPadX = event.state
-                elif event.code == 'ABS_HAT0Y':
-                    self.DPadY = event.state
+                mapping = XboxController.EVENT_MAP.get(event.code)
+                if mapping is None:
+                    continue
+                index, scale = mapping
+                value = event.state / scale if scale != 1 else event.state
+                if values[index] != value:
+                    values[index] = value
+                    changed = True
+            # Publish once per batch so a single snapshot never mixes two
+            # reports
+            if changed:
+                version += 1
+                with self._changed:
+                    self.state = gamePadState(*values, version,
+                                              time.monotonic())
+                    self._changed.notify_all()
 
 if __name__ == '__main__':
     joy = XboxController()
+    version = 0
     while True:
-        print(f"{joy.readMainButtons()}{joy.readTriggers()}{joy.readAnalogSticks()}")
+        state = joy.waitForChange(version)
+        version = state.version
+        print(f"{joy.readMainButtons(state)}{joy.readTriggers(state)}"
+              f"{joy.readAnalogSticks(state)}")
@@ -0,0 +1,244 @@
+# Records the raw gamepad events of a pilot session and replays them in place
+# of the gamepad
+#
+# python gamePadRecorder.py record session.kpad
+#   records until Ctrl+C
+# python gamePadRecorder.py info session.kpad
+#   prints the length of a recording
+# python gamePadRecorder.py play session.kpad --speed 4
+#   prints the replayed inputs 4 times faster
+#
+# File layout:
+#   RECORDING_HEADER
+#   then one block per batch returned by get_gamepad:
+#     BATCH_HEADER (seconds since the start of the recording, event count) |
+#     count * EVENT_RECORD (code index, state)
+# Only the codes of XboxController.EVENT_MAP are stored, sync reports and scan
+# codes carry no input.
+
+from gamePad import XboxController
+from inputs import get_gamepad
+import collections
+import threading
+import argparse
+import struct
+import time
+
+RECORDING_MAGIC = b"KPAD"
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct("<4sB")
+BATCH_HEADER = struct.Struct("<dH")
+EVENT_RECORD = struct.Struct("<Bi")
+# Index stored in EVENT_RECORD, new codes must be appended with a version bump
+EVENT_CODES = list(XboxController.EVENT_MAP)
+
+# Same fields as the events of the inputs package that XboxController reads
+replayEvent = collections.namedtuple("replayEvent",
+                                     ["ev_type", "code", "state"])
+
+
+class recordingError(Exception):
+    """Raised when a file is not a gamepad recording"""
+    pass
+
+
+def readRecording(path: str) -> list:
+    """Loads a whole recording
+
+    Args:
+        path: file written by gamePadRecorder
+
+    Returns:
+        list of (seconds since the start, list of replayEvent), one per batch
+
+    Raises:
+        recordingError: The file is not a recording or uses an unknown version
+    """
+    with open(path, "rb") as recordingFile:
+        data = recordingFile.read()
+    if len(data) < RECORDING_HEADER.size:
+        raise recordingError(f"{path} is too short to be a recording")
+    magic, version = RECORDING_HEADER.unpack_from(data)
+    if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+        raise recordingError(f"{path} is not a version {RECORDING_VERSION} "
+                             "gamepad recording")
+    batches = []
+    offset = RECORDING_HEADER.size
+    while offset + BATCH_HEADER.size <= len(data):
+        timestamp, count = BATCH_HEADER.unpack_from(data, offset)
+        offset += BATCH_HEADER.size
+        if offset + count * EVENT_RECORD.size > len(data):
+            # Cut short by an interrupted recording
+            break
+        events = []
+        block = data[offset:offset + count * EVENT_RECORD.size]
+        for codeIndex, state in EVENT_RECORD.iter_unpack(block):
+            code = EVENT_CODES[codeIndex]
+            eventType = "Absolute" if code.startswith("ABS_") else "Key"
+            events.append(replayEvent(eventType, code, state))
+        offset += count * EVENT_RECORD.size
+        batches.append((timestamp, events))
+    return batches
+
+
+class gamePadRecorder:
+    def __init__(self, path: str, eventSource=None,
+                 flushInterval: float = 1.0) -> None:
+        """Event source that records the events it passes on
+
+        Used as XboxController(gamePadRecorder("session.kpad")).
+
+        Args:
+            path: file to write, replaced if it exists
+            eventSource: callable returning the next batch of events, default
+                is inputs.get_gamepad
+            flushInterval: seconds between writes to disk, an interrupted
+                recording loses at most this much
+
+        Returns:
+            None
+        """
+        self.eventSource = eventSource or get_gamepad
+        self.flushInterval = flushInterval
+        self.recordingFile = open(path, "wb")
+        self.recordingFile.write(RECORDING_HEADER.pack(RECORDING_MAGIC,
+                                                       RECORDING_VERSION))
+        self.started = None
+        self.lastFlush = 0.0
+        self.batchCount = 0
+        self.eventCount = 0
+        self.lock = threading.Lock()
+
+    def __call__(self) -> list:
+        events = self.eventSource()
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+            self.lastFlush = now
+        records = [EVENT_RECORD.pack(EVENT_CODES.index(event.code),
+                                     event.state)
+                   for event in events
+                   if event.code in XboxController.EVENT_MAP]
+        with self.lock:
+            if records and not self.recordingFile.closed:
+                header = BATCH_HEADER.pack(now - self.started, len(records))
+                self.recordingFile.write(header + b"".join(records))
+                self.batchCount += 1
+                self.eventCount += len(records)
+                if now - self.lastFlush >= self.flushInterval:
+                    self.recordingFile.flush()
+                    self.lastFlush = now
+        # Passed on unchanged, the recording does not alter the session
+        return events
+
+    def close(self) -> None:
+        """Writes the remaining events and closes the file
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.recordingFile.close()
+
+
+class gamePadReplay:
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False,
+                 autoStart: bool = True) -> None:
+        """Event source that replays a recording
+
+        Used as XboxController(gamePadReplay("session.kpad", speed=4)). The
+        clock starts with start, every batch is then returned at its
+        recorded time divided by speed. Presses shorter than a control tick
+        once sped up are missed, like a live gamepad would miss them.
+
+        Args:
+            path: file written by gamePadRecorder
+            speed: 1 replays in real time, 4 four times faster
+            loop: start again at the end instead of raising EOFError
+            autoStart: start at the first call, False waits for start so no
+                input is replayed before the control loop runs
+
+        Returns:
+            None
+
+        Raises:
+            recordingError: The file is not a recording or uses an unknown
+                version
+            ValueError: speed is not positive
+        """
+        if speed <= 0:
+            raise ValueError("The replay speed must be positive")
+        self.batches = readRecording(path)
+        self.speed = speed
+        self.loop = loop
+        self.position = 0
+        self.started = None
+        self.startEvent = threading.Event()
+        if autoStart:
+            self.startEvent.set()
+
+    def start(self) -> None:
+        self.startEvent.set()
+
+    def duration(self) -> float:
+        return self.batches[-1][0] if self.batches else 0.0
+
+    def __call__(self) -> list:
+        if self.position >= len(self.batches):
+            if not self.loop or not self.batches:
+                raise EOFError("End of the gamepad recording")
+            self.position = 0
+            self.started = None
+        self.startEvent.wait()
+        timestamp, events = self.batches[self.position]
+        self.position += 1
+        if self.started is None:
+            # Sessions start at the first recorded batch, not at the time the
+            # recording was started
+            self.started = time.monotonic() - timestamp / self.speed
+        delay = self.started + timestamp / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return events
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Records and replays gamepad "
+                                                 "sessions")
+    parser.add_argument("action", choices=["record", "info", "play"])
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed, 2 replays twice as fast")
+    args = parser.parse_args()
+    if args.action == "record":
+        recorder = gamePadRecorder(args.path)
+        joy = XboxController(recorder)
+        print(f"Recording to {args.path}, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+                print(f"{recorder.batchCount} batches, "
+                      f"{recorder.eventCount} events", end="\r")
+        except KeyboardInterrupt:
+            recorder.close()
+            print(f"\nRecorded {recorder.batchCount} batches, "
+                  f"{recorder.eventCount} events")
+    elif args.action == "info":
+        replay = gamePadReplay(args.path)
+        print(f"{len(replay.batches)} batches, "
+              f"{sum(len(events) for _, events in replay.batches)} events, "
+              f"{replay.duration():.1f}s")
+    else:
+        joy = XboxController(gamePadReplay(args.path, args.speed))
+        version = 0
+        while True:
+            state = joy.waitForChange(version, 0.5)
+            if state.version != version:
+                version = state.version
+                print(f"{joy.readMainButtons(state)}{joy.readTriggers(state)}"
+                      f"{joy.readAnalogSticks(state)}")
+            elif joy.finished.is_set():
+                break
@@ -0,0 +1,136 @@
+# Rolling latency statistics per hop of the control path
+#
+# This file is shared by rov-server and topside-client, keep both copies
+# identical (checked in lint.yml).
+
+import collections
+import threading
+import logging
+import json
+import time
+
+
+class latencyHistogram:
+    def __init__(self, window: int = 1000) -> None:
+        """Keeps the last samples of one hop
+
+        Args:
+            window: number of samples kept, older samples are forgotten
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.samples = collections.deque(maxlen=window)
+        self.total = 0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.total += 1
+
+    def percentiles(self) -> dict:
+        """Summarises the samples in the window
+
+        Args:
+            None
+
+        Returns:
+            dict with the sample count and p50, p95, p99 and max in
+            milliseconds
+        """
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": self.total}
+
+        def percentile(fraction):
+            index = min(int(fraction * len(ordered)), len(ordered) - 1)
+            return round(ordered[index] * 1000, 3)
+
+        return {"count": self.total, "p50": percentile(0.50),
+                "p95": percentile(0.95), "p99": percentile(0.99),
+                "max": round(ordered[-1] * 1000, 3)}
+
+
+class latencyStats:
+    def __init__(self, window: int = 1000) -> None:
+        """Latency histograms for every hop, safe to use from several threads
+
+        Args:
+            window: samples kept per hop
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.window = window
+        self.hops = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.dumpThread = None
+
+    def record(self, hop: str, seconds: float) -> None:
+        """Adds a sample
+
+        Args:
+            hop: name of the hop
+            seconds: time spent in the hop
+
+        Returns:
+            None
+        """
+        with self.lock:
+            if hop not in self.hops:
+                self.hops[hop] = latencyHistogram(self.window)
+            self.hops[hop].record(seconds)
+
+    def report(self) -> dict:
+        """Returns the percentiles of every hop
+
+        Args:
+            None
+
+        Returns:
+            dict of hop name to latencyHistogram.percentiles
+        """
+        with self.lock:
+            return {hop: histogram.percentiles()
+                    for hop, histogram in self.hops.items()}
+
+    def dump(self) -> str:
+        """Logs and returns the report as JSON
+
+        Args:
+            None
+
+        Returns:
+            JSON string of report()
+        """
+        reportJSON = json.dumps(self.report())
+        logging.info(f"Latency: {reportJSON}")
+        return reportJSON
+
+    def startPeriodicDump(self, interval: float = 10.0) -> None:
+        """Logs the report every interval seconds from a daemon thread
+
+        Args:
+            interval: seconds between two reports
+
+        Returns:
+            None
+        """
+        if self.dumpThread is not None:
+            return
+
+        def dumpLoop():
+            while True:
+                time.sleep(interval)
+                if self.hops:
+                    self.dump()
+
+        self.dumpThread = threading.Thread(target=dumpLoop,
+                                           name="latency-dump")
+        self.dumpThread.daemon = True
+        self.dumpThread.start()
@@ -0,0 +1,194 @@
+# Reads binary sensor logs (.klog) written by dataLogger without loading them
+#
+# python logReader.py summary data_logs/log.klog
+# python logReader.py query data_logs/log.klog --field vin --start 60 \
+#     --end 360 --buckets 30
+#   start and end are seconds since the beginning of the log
+
+import argparse
+import bisect
+import os
+from datetime import datetime
+import numpy as np
+import sensorSchema
+
+
+class logReader:
+    def __init__(self, path: str, indexStride: int = 1024) -> None:
+        """Memory-maps a binary log and builds a sparse time index
+
+        Only the pages that a query touches are read from disk.
+
+        Args:
+            path: path of the .klog file
+            indexStride: records between two entries of the time index
+
+        Returns:
+            None
+
+        Raises:
+            logFormatError: The file is not a binary sensor log
+        """
+        self.path = path
+        self.indexStride = indexStride
+        with open(path, "rb") as logFile:
+            self.dataType, offset = sensorSchema.readLogHeader(logFile)
+        # A record may be half written if the logger is still running
+        self.count = (os.path.getsize(path) - offset) // self.dataType.itemsize
+        if self.count > 0:
+            self.records = np.memmap(path, dtype=self.dataType, mode='r',
+                                     offset=offset, shape=(self.count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dataType)
+        # Reads one record per stride, the log is written in time order
+        indexed = self.records["time"][::indexStride]
+        self.indexTimes = np.array(indexed).tolist()
+
+    def startTime(self) -> float:
+        return float(self.records["time"][0]) if self.count else 0.0
+
+    def endTime(self) -> float:
+        return float(self.records["time"][-1]) if self.count else 0.0
+
+    def findIndex(self, timestamp: float) -> int:
+        """Finds the first record at or after a time
+
+        Args:
+            timestamp: time.time() value
+
+        Returns:
+            record index, count if every record is older
+        """
+        block = max(bisect.bisect_right(self.indexTimes, timestamp) - 1, 0)
+        start = block * self.indexStride
+        end = min(start + self.indexStride + 1, self.count)
+        return start + int(np.searchsorted(self.records["time"][start:end],
+                                           timestamp, side='left'))
+
+    def timeRange(self, start: float, end: float):
+        """Returns the records between two times
+
+        Args:
+            start: first time included, time.time() value
+            end: first time excluded, time.time() value
+
+        Returns:
+            memory-mapped view of the records, nothing is copied
+        """
+        return self.records[self.findIndex(start):self.findIndex(end)]
+
+    def downsample(self, field: str, start: float, end: float,
+                   buckets: int) -> dict:
+        """Splits a time range in equal buckets and reduces a field in each
+
+        Args:
+            field: field name from sensorSchema.SENSOR_FIELDS
+            start: first time included, time.time() value
+            end: first time excluded, time.time() value
+            buckets: number of buckets
+
+        Returns:
+            dict of arrays: time (bucket start), count, min, max and mean,
+                empty buckets hold nan
+        """
+        edges = np.linspace(start, end, buckets + 1)
+        selected = self.timeRange(start, end)
+        times = np.asarray(selected["time"])
+        values = np.asarray(selected[field], dtype=np.float64)
+        bucketStarts = np.searchsorted(times, edges[:-1], side='left')
+        counts = np.diff(np.append(bucketStarts, len(times)))
+        result = {"time": edges[:-1], "count": counts}
+        filled = counts > 0
+        for name, reduce in (("min", np.fmin), ("max", np.fmax),
+                             ("mean", np.add)):
+            reduced = np.full(buckets, np.nan)
+            if len(values):
+                reduced[filled] = reduce.reduceat(values, bucketStarts[filled])
+            result[name] = reduced
+        result["mean"] = result["mean"] / np.where(filled, counts, 1)
+        return result
+
+    def summary(self, chunkSize: int = 65536) -> dict:
+        """Computes the range of every field, one chunk at a time
+
+        Args:
+            chunkSize: records read at once
+
+        Returns:
+            dict with the record count, start and end times and per field min,
+            max and mean
+        """
+        fields = {name: [np.inf, -np.inf, 0.0, 0]
+                  for name in sensorSchema.SENSOR_FIELDS}
+        for chunkStart in range(0, self.count, chunkSize):
+            chunk = self.records[chunkStart:chunkStart + chunkSize]
+            for name, stats in fields.items():
+                values = np.asarray(chunk[name], dtype=np.float64)
+                values = values[~np.isnan(values)]
+                if len(values):
+                    stats[0] = min(stats[0], values.min())
+                    stats[1] = max(stats[1], values.max())
+                    stats[2] += values.sum()
+                    stats[3] += len(values)
+        return {
+            "records": self.count,
+            "start": self.startTime(),
+            "end": self.endTime(),
+            "fields": {name: {"min": stats[0], "max": stats[1],
+                              "mean": (stats[2] / stats[3] if stats[3]
+                                       else float("nan"))}
+                       for name, stats in fields.items()},
+        }
+
+
+def printSummary(reader):
+    summary = reader.summary()
+    duration = summary["end"] - summary["start"]
+    print(f"{reader.path}: {summary['records']} records, {duration:.1f}s")
+    if summary["records"]:
+        print(f"From {datetime.fromtimestamp(summary['start'])} to "
+              f"{datetime.fromtimestamp(summary['end'])}")
+    for name, stats in summary["fields"].items():
+        print(f"{name:22s} min {stats['min']:10.3f} max {stats['max']:10.3f} "
+              f"mean {stats['mean']:10.3f}")
+
+
+def printQuery(reader, field, start, end, buckets):
+    start = reader.startTime() + start
+    end = reader.endTime() + 1e-6 if end is None else reader.startTime() + end
+    result = reader.downsample(field, start, end, buckets)
+    print(f"{'t(s)':>9s} {'count':>6s} {'min':>10s} {'max':>10s} "
+          f"{'mean':>10s}")
+    for index in range(buckets):
+        print(f"{result['time'][index] - reader.startTime():9.2f} "
+              f"{result['count'][index]:6d} {result['min'][index]:10.3f} "
+              f"{result['max'][index]:10.3f} {result['mean'][index]:10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarise and query binary "
+                                                 "sensor logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summaryParser = commands.add_parser("summary",
+                                        help="record count, time span and "
+                                             "range of every field")
+    summaryParser.add_argument("path")
+    queryParser = commands.add_parser("query",
+                                      help="min, max and mean of a field per "
+                                           "time bucket")
+    queryParser.add_argument("path")
+    queryParser.add_argument("--field", required=True,
+                             choices=sensorSchema.SENSOR_FIELDS)
+    queryParser.add_argument("--start", type=float, default=0.0,
+                             help="seconds since the start of the log")
+    queryParser.add_argument("--end", type=float, default=None,
+                             help="seconds since the start of the log, "
+                                  "default is the end")
+    queryParser.add_argument("--buckets", type=int, default=20)
+    args = parser.parse_args()
+
+    reader = logReader(args.path)
+    if args.command == "summary":
+        printSummary(reader)
+    else:
+        printQuery(reader, args.field, args.start, args.end, args.buckets)
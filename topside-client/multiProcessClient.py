@@ -0,0 +1,380 @@
+# Runs the topside client as three processes, console and disk output never
+# delay the control loop
+#
+#   control process: gamepad, control scheduler and motor transmit, replies go
+#     to the command ring
+#   telemetry process: sensor subscription, readings go to the sensor ring
+#   main process: prints both rings and logs the sensor readings
+#
+# python multiProcessClient.py --ip 10.10.2.5 --port 8000
+
+from client import readMotorCommand
+from gamePad import XboxController
+from gamePadRecorder import gamePadReplay
+from tcpClient import tcpClient
+from udpMotorSender import udpMotorSender
+from linkSupervisor import linkSupervisor
+from sharedRing import sharedRing
+from frameProtocol import CHANNEL_MOTOR, CHANNEL_SENSOR, frameError
+from controlScheduler import controlScheduler
+from latencyStats import latencyStats
+from clockSync import clockSync
+from dataLogger import dataLogger
+from datetime import datetime
+import sensorSchema
+import multiprocessing
+import numpy as np
+import argparse
+import logging
+import socket
+import time
+
+# One record per motor command sent, time is the topside time.time() of
+# the reply
+COMMAND_DTYPE = np.dtype([("time", "<f8"), ("mode", "S1"),
+                          ("values", "<f4", (8,)), ("reply", "S16")])
+
+
+class controlStage:
+    def __init__(self, serverIP: str, serverPort: int, controlRate: float,
+                 traceEvery: int, motorTransport: str, commandRingName: str,
+                 ringCapacity: int, startEvent, stopEvent,
+                 replayPath: str = None, replaySpeed: float = 1.0) -> None:
+        """Control process, reads the gamepad and sends motor commands
+
+        Args:
+            serverIP: IP address of the communication Server
+            serverPort: motor port of the communication server
+            controlRate: maximum motor commands per second
+            traceEvery: trace one motor command out of traceEvery, 0 disables
+                tracing
+            motorTransport: "tcp" or "udp"
+            commandRingName: shared memory name of the command ring
+            ringCapacity: records held by the ring
+            startEvent: set when the pilot presses start
+            stopEvent: set to stop every process
+            replayPath: gamepad recording replayed instead of the gamepad, see
+                gamePadRecorder
+            replaySpeed: replay speed, 2 replays twice as fast
+
+        Returns:
+            null
+        """
+        self.serverIP = serverIP
+        self.serverPort = serverPort
+        self.traceEvery = traceEvery
+        self.motorTransport = motorTransport
+        self.startEvent = startEvent
+        self.stopEvent = stopEvent
+        # The recording is opened here, in the control process, and starts with
+        # the control loop
+        self.replay = None
+        if replayPath:
+            self.replay = gamePadReplay(replayPath, replaySpeed,
+                                        autoStart=False)
+        self.gamePad = XboxController(self.replay)
+        self.controlScheduler = controlScheduler(controlRate)
+        self.latencyStats = latencyStats()
+        self.commandRing = sharedRing(COMMAND_DTYPE, ringCapacity,
+                                      commandRingName)
+        self.motorSender = None
+        self.link = linkSupervisor("motors", self.connect)
+
+    def connect(self):
+        if self.motorSender is not None:
+            try:
+                self.motorSender.closeConnection()
+            except OSError:
+                pass
+            self.motorSender = None
+        if self.motorTransport == "udp":
+            motorSender = udpMotorSender(self.serverIP, self.serverPort)
+        else:
+            motorSender = tcpClient(self.serverIP, self.serverPort, "binary",
+                                    CHANNEL_MOTOR, self.latencyStats,
+                                    self.traceEvery)
+        motorSender.startConnection()
+        self.motorSender = motorSender
+        return True
+
+    def sendMotorCommand(self, mode, values, inputTimestamp):
+        # Fails fast while the supervisor reconnects, the keepalive resends the
+        # setpoint once the link is back
+        motorSender = self.motorSender
+        if not self.link.isUp() or motorSender is None:
+            return "NOT CONNECTED"
+        try:
+            return motorSender.sendMotorCommand(mode, values, inputTimestamp)
+        except (OSError, frameError) as e:
+            logging.error(f"Unable to send motor command: {e}")
+            if motorSender is self.motorSender:
+                self.link.linkDown(str(e))
+            return "NOT CONNECTED"
+
+    def run(self):
+        logging.info("Starting control process")
+        self.link.linkDown("not connected yet")
+        if self.traceEvery:
+            self.latencyStats.startPeriodicDump()
+        lastVersion = -1
+        lastSentVersion = -1
+        if self.replay is not None:
+            self.replay.start()
+        while not self.stopEvent.is_set():
+            # Sleep until the input changes or a keepalive is due, then respect
+            # the maximum rate
+            lastVersion = self.gamePad.waitForChange(
+                lastVersion, self.controlScheduler.keepaliveInterval).version
+            self.controlScheduler.waitForNextTick()
+            gamePadState = self.gamePad.snapshot()
+            lastVersion = gamePadState.version
+            mode, values, gamePadButtons = readMotorCommand(
+                self.gamePad, gamePadState,
+                self.controlScheduler.applyDeadband)
+            if self.startEvent.is_set() and \
+                    self.controlScheduler.shouldSend(mode, values):
+                inputTimestamp = None
+                if gamePadState.version != lastSentVersion:
+                    inputTimestamp = gamePadState.timestamp
+                lastSentVersion = gamePadState.version
+                reply = self.sendMotorCommand(mode, values, inputTimestamp)
+                # Printed by the main process, a full ring only loses output
+                self.commandRing.put((time.time(), mode.encode('ascii'),
+                                      values, reply.encode('utf-8')[:16]))
+            # SELECT + START to stop every process
+            if gamePadButtons[4] == 1 and gamePadButtons[5] == 1:
+                self.stopEvent.set()
+            # Start Button to start sending data to arduinos
+            if gamePadButtons[3] == 1:
+                self.startEvent.set()
+            # A replayed session ends once its last input was handled
+            if self.gamePad.finished.is_set() and \
+                    lastVersion == self.gamePad.snapshot().version:
+                logging.info("Gamepad replay finished")
+                self.stopEvent.set()
+        self.link.close()
+        if self.motorSender is not None:
+            self.motorSender.closeConnection()
+        self.commandRing.close()
+
+
+class telemetryStage:
+    def __init__(self, serverIP: str, sensorPort: int, sensorRate: float,
+                 sensorRingName: str, ringCapacity: int, startEvent,
+                 stopEvent) -> None:
+        """Telemetry process, receives the sensor readings pushed by the server
+
+        Args:
+            serverIP: IP address of the communication Server
+            sensorPort: sensor port of the communication server
+            sensorRate: sensor readings per second pushed by the server
+            sensorRingName: shared memory name of the sensor ring
+            ringCapacity: records held by the ring
+            startEvent: set when the pilot presses start
+            stopEvent: set to stop every process
+
+        Returns:
+            null
+        """
+        self.serverIP = serverIP
+        self.sensorPort = sensorPort
+        self.sensorRate = sensorRate
+        self.startEvent = startEvent
+        self.stopEvent = stopEvent
+        self.sensorRing = sharedRing(sensorSchema.RECORD_DTYPE, ringCapacity,
+                                     sensorRingName)
+        # Server sample times are converted to topside time before they reach
+        # the ring, the exchanges go over the sensor connection
+        self.clockSync = clockSync()
+        self.tcp_sensors = None
+        self.link = linkSupervisor("sensors", self.connect)
+
+    def connect(self):
+        if self.tcp_sensors is not None:
+            try:
+                self.tcp_sensors.closeConnection()
+            except OSError:
+                pass
+            self.tcp_sensors = None
+        tcp_sensors = tcpClient(self.serverIP, self.sensorPort, "binary",
+                                CHANNEL_SENSOR)
+        tcp_sensors.startConnection()
+        # Short reads so the stop event is noticed while no reading arrives
+        tcp_sensors.connection.settimeout(1.0)
+        self.tcp_sensors = tcp_sensors
+        return True
+
+    def run(self):
+        logging.info("Starting telemetry process")
+        while not self.startEvent.wait(0.5):
+            if self.stopEvent.is_set():
+                break
+        self.link.linkDown("not connected yet")
+        while not self.stopEvent.is_set():
+            # Subscriptions belong to a connection, a new one is made after
+            # every reconnect
+            if not self.link.waitUp(1.0):
+                continue
+            sensors = self.tcp_sensors
+            try:
+                self.clockSync.syncBurst(sensors)
+                sensors.subscribeSensors(self.sensorRate)
+                while not self.stopEvent.is_set():
+                    try:
+                        if self.clockSync.isDue():
+                            self.clockSync.exchange(sensors)
+                        sample = sensors.readSensorSample()
+                    except socket.timeout:
+                        continue
+                    rovTime = self.clockSync.toLocalTime(sample.sampleTime)
+                    record = sensorSchema.makeRecord(time.time(),
+                                                     sample.values,
+                                                     sample.sequence,
+                                                     sample.age, rovTime)
+                    self.sensorRing.put(record)
+            except (OSError, frameError) as e:
+                logging.error(f"Sensor stream interrupted: {e}")
+                if sensors is self.tcp_sensors:
+                    self.link.linkDown(str(e))
+        self.link.close()
+        if self.tcp_sensors is not None:
+            self.tcp_sensors.closeConnection()
+        self.sensorRing.close()
+
+
+def runControlStage(*args):
+    try:
+        controlStage(*args).run()
+    except KeyboardInterrupt:
+        pass
+
+
+def runTelemetryStage(*args):
+    try:
+        telemetryStage(*args).run()
+    except KeyboardInterrupt:
+        pass
+
+
+class multiProcessClient:
+    def __init__(self, serverIP, serverPort, sensorRate=20, controlRate=30,
+                 logFormat="binary", traceEvery=10, motorTransport="tcp",
+                 ringCapacity=1024, replayPath=None, replaySpeed=1.0) -> None:
+        """Topside client split into control, telemetry and logging processes
+
+        Same behaviour as client.main with the binary protocol, multiplexing is
+        not available as every process has its own connection.
+
+        Args:
+            serverIP: IP address of the communication Server
+            serverPort: motor port of the communication server, sensors use
+                serverPort + 1
+            sensorRate: sensor readings per second pushed by the server
+            controlRate: maximum motor commands per second
+            logFormat: "binary" or "csv", see dataLogger
+            traceEvery: trace one motor command out of traceEvery, 0 disables
+                tracing
+            motorTransport: "tcp" or "udp"
+            ringCapacity: records held by each shared memory ring
+            replayPath: gamepad recording replayed instead of the gamepad, the
+                client stops at its end
+            replaySpeed: replay speed, 2 replays twice as fast
+
+        Returns:
+            null
+        """
+        self.serverIP = serverIP
+        self.motorPort = serverPort
+        self.sensorPort = serverPort + 1
+        self.sensorRate = sensorRate
+        self.controlRate = controlRate
+        self.logFormat = logFormat
+        self.traceEvery = traceEvery
+        self.motorTransport = motorTransport
+        self.ringCapacity = ringCapacity
+        self.replayPath = replayPath
+        self.replaySpeed = replaySpeed
+
+    def run(self):
+        """Starts the control and telemetry processes and displays and logs
+        their records until stopped
+
+        Args:
+            null
+
+        Returns:
+            null
+        """
+        print("Starting...")
+        sensorRing = sharedRing(sensorSchema.RECORD_DTYPE, self.ringCapacity)
+        commandRing = sharedRing(COMMAND_DTYPE, self.ringCapacity)
+        startEvent = multiprocessing.Event()
+        stopEvent = multiprocessing.Event()
+        dataSave = dataLogger(sensorSchema.CSV_HEADER,
+                              logFormat=self.logFormat)
+        controlArgs = (self.serverIP, self.motorPort, self.controlRate,
+                       self.traceEvery, self.motorTransport, commandRing.name,
+                       self.ringCapacity, startEvent, stopEvent,
+                       self.replayPath, self.replaySpeed)
+        telemetryArgs = (self.serverIP, self.sensorPort, self.sensorRate,
+                         sensorRing.name, self.ringCapacity, startEvent,
+                         stopEvent)
+        processes = [
+            multiprocessing.Process(target=runControlStage, name="control",
+                                    args=controlArgs),
+            multiprocessing.Process(target=runTelemetryStage,
+                                    name="telemetry", args=telemetryArgs),
+        ]
+        for process in processes:
+            process.start()
+        try:
+            while not stopEvent.is_set() and all(process.is_alive()
+                                                 for process in processes):
+                for record in sensorRing.get(timeout=0.05):
+                    values = [record[name].item()
+                              for name in sensorSchema.SENSOR_FIELDS]
+                    timestamp = float(record["time"])
+                    print([str(datetime.fromtimestamp(timestamp))] + values)
+                    rovTime = float(record["rovTime"])
+                    if np.isnan(rovTime):
+                        rovTime = None
+                    dataSave.writeRecord(timestamp, values,
+                                         int(record["sequence"]),
+                                         float(record["age"]), rovTime)
+                for command in commandRing.get():
+                    print(command["reply"].decode('utf-8'))
+        except KeyboardInterrupt:
+            logging.warning("Keyboard Interrupt was preformed, closing "
+                            "processes")
+        stopEvent.set()
+        for process in processes:
+            process.join(5)
+        if sensorRing.dropped() or commandRing.dropped():
+            logging.warning(f"Display fell behind, {sensorRing.dropped()} "
+                            f"readings not logged and {commandRing.dropped()} "
+                            "replies not shown")
+        dataSave.closeFile()
+        sensorRing.close()
+        commandRing.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Topside client, one process "
+                                                 "per stage")
+    parser.add_argument("--ip", default="10.10.2.5")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--motor-transport", choices=["tcp", "udp"],
+                        default="tcp")
+    parser.add_argument("--replay", default=None,
+                        help="gamepad recording to replay instead of the "
+                             "gamepad, see gamePadRecorder.py")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="replay speed, 2 replays twice as fast")
+    args = parser.parse_args()
+    logging.basicConfig(filename="log.log", encoding='utf-8',
+                        level=logging.DEBUG,
+                        format='%(asctime)s - %(process)d - %(name)s - '
+                               '%(levelname)s - %(message)s')
+    multiProcessClient(args.ip, args.port, motorTransport=args.motor_transport,
+                       replayPath=args.replay,
+                       replaySpeed=args.replay_speed).run()
@@ -0,0 +1,291 @@
+from tcpClient import tcpClient
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import frameProtocol as fp
+import collections
+import threading
+import logging
+import socket
+import queue
+
+# Channel used for each request type
+FRAME_CHANNELS = {
+    fp.FRAME_MOTOR: fp.CHANNEL_MOTOR,
+    fp.FRAME_MOTOR_TRACED: fp.CHANNEL_MOTOR,
+    fp.FRAME_SENSOR_REQUEST: fp.CHANNEL_SENSOR,
+    fp.FRAME_SUBSCRIBE: fp.CHANNEL_SENSOR,
+    fp.FRAME_TEXT: fp.CHANNEL_CONTROL,
+    fp.FRAME_TIME_SYNC: fp.CHANNEL_CONTROL,
+}
+
+
+class muxClient(tcpClient):
+    def __init__(self, serverIP: str, serverPort: int, latencyStats=None,
+                 traceEvery: int = 0, replyTimeout: float = 5.0,
+                 telemetryBuffer: int = 64) -> None:
+        """Carries the motor, sensor and control channels on one connection
+
+        Each channel numbers its own requests and replies are matched by
+        (channel, sequence), so several requests can be in flight from
+        different threads. A reader thread dispatches the replies and a writer
+        thread sends queued motor frames before sensor frames.
+
+        Args:
+            serverIP: IP address of the communication Server
+            serverPort: port of the communication server, either server port
+                accepts every channel
+            latencyStats: latencyStats receiving the hop timings of traced
+                motor commands
+            traceEvery: trace one motor command out of traceEvery, 0 disables
+                tracing
+            replyTimeout: seconds to wait for a reply
+            telemetryBuffer: pushed readings kept until readSensorSample, older
+                ones are dropped
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        super().__init__(serverIP, serverPort, "binary", fp.CHANNEL_MOTOR,
+                         latencyStats, traceEvery)
+        self.replyTimeout = replyTimeout
+        self.sequences = {channel: 0 for channel in fp.CHANNEL_PRIORITY}
+        self.pendingReplies = {}
+        self.pendingLock = threading.Lock()
+        self.sendQueue = queue.PriorityQueue()
+        self.sendCount = 0
+        self.telemetry = collections.deque(maxlen=telemetryBuffer)
+        self.telemetryCondition = threading.Condition()
+        self.connected = False
+        self.readerThread = None
+        self.writerThread = None
+
+    def startConnection(self):
+        """Establishes Connection with the Server and starts its threads
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        super().startConnection()
+        # The reader thread waits for frames as long as the connection is open,
+        # requests are timed by replyTimeout and a dead server is found by the
+        # keepalive
+        self.connection.settimeout(None)
+        self.connected = True
+        self.sendQueue = queue.PriorityQueue()
+        self.readerThread = threading.Thread(target=self.readFrames,
+                                             name="mux-reader")
+        self.writerThread = threading.Thread(target=self.writeFrames,
+                                             args=(self.sendQueue,),
+                                             name="mux-writer")
+        self.readerThread.daemon = True
+        self.writerThread.daemon = True
+        self.readerThread.start()
+        self.writerThread.start()
+
+    def sendData(self, data: str) -> str:
+        """Sends a text command on the control channel
+
+        Args:
+            data: The data that needs to be sent to the server in string format
+
+        Returns:
+            The server's reply
+
+        Raises:
+            null
+        """
+        reply = self.sendFrame(fp.FRAME_TEXT, data.encode('utf-8'))
+        return reply.payload.decode('utf-8')
+
+    def submitFrame(self, frameType: int, payload: bytes = b"",
+                    channel: int = None) -> Future:
+        """Queues a frame without waiting for its reply
+
+        Args:
+            frameType: One of the frameProtocol.FRAME_* constants
+            payload: Payload bytes
+            channel: channel of the frame, default is the channel of the frame
+                type
+
+        Returns:
+            Future resolving to the reply frame
+
+        Raises:
+            ConnectionError: The connection is closed
+        """
+        if channel is None:
+            channel = FRAME_CHANNELS.get(frameType, fp.CHANNEL_CONTROL)
+        future = Future()
+        with self.pendingLock:
+            if not self.connected:
+                raise ConnectionError(f"{self.serverIP}:{self.serverPort} is "
+                                      "not connected")
+            self.sequences[channel] = (self.sequences[
+                                           channel] + 1) & 0xFFFFFFFF
+            sequence = self.sequences[channel]
+            future.replyKey = (channel, sequence)
+            self.pendingReplies[future.replyKey] = future
+            # The counter keeps frames of the same channel in order
+            self.sendCount += 1
+            encoded = fp.encodeFrame(frameType, channel, sequence, payload)
+            self.sendQueue.put((fp.CHANNEL_PRIORITY[channel], self.sendCount,
+                                encoded))
+        return future
+
+    def sendFrame(self, frameType: int, payload: bytes = b""):
+        """Sends a frame and waits for its reply, other threads may have
+        requests in flight
+
+        Args:
+            frameType: One of the frameProtocol.FRAME_* constants
+            payload: Payload bytes
+
+        Returns:
+            The reply frame
+
+        Raises:
+            ConnectionError: The server closed the connection
+            TimeoutError: No reply within replyTimeout, the built-in one so
+                callers catching OSError see it
+        """
+        future = self.submitFrame(frameType, payload)
+        try:
+            return future.result(self.replyTimeout)
+        except FutureTimeoutError as e:
+            with self.pendingLock:
+                self.pendingReplies.pop(future.replyKey, None)
+            # concurrent.futures.TimeoutError is an OSError since Python 3.11
+            raise TimeoutError("No reply from "
+                               f"{self.serverIP}:{self.serverPort} within "
+                               f"{self.replyTimeout}s") from e
+
+    def readSensorSample(self, timeout: float = None):
+        """Blocks until the server pushes the next sensor reading
+
+        Args:
+            timeout: seconds to wait, None waits forever
+
+        Returns:
+            frameProtocol.sensorSample
+
+        Raises:
+            ConnectionError: The server closed the connection
+            TimeoutError: No reading within timeout
+        """
+        with self.telemetryCondition:
+            if not self.telemetryCondition.wait_for(lambda: self.telemetry
+                                                    or not self.connected,
+                                                    timeout):
+                raise TimeoutError("No sensor reading from "
+                                   f"{self.serverIP}:{self.serverPort} within "
+                                   f"{timeout}s")
+            if not self.telemetry:
+                raise ConnectionError(f"{self.serverIP}:{self.serverPort} "
+                                      "closed the connection")
+            return fp.decodeSensorPayload(self.telemetry.popleft().payload)
+
+    def writeFrames(self, sendQueue):
+        """Writer thread, sends queued frames in priority order
+
+        Args:
+            sendQueue: PriorityQueue of the connection, None stops the thread
+
+        Returns:
+            null
+        """
+        while True:
+            priority, count, data = sendQueue.get()
+            if data is None:
+                return
+            try:
+                self.connection.sendall(data)
+            except OSError as e:
+                logging.error(f"{self.serverIP}:{self.serverPort} - Unable to "
+                              f"send frame {e}")
+                self.connectionLost(e)
+                return
+
+    def readFrames(self):
+        """Reader thread, resolves pending requests and buffers readings
+
+        Args:
+            null
+
+        Returns:
+            null
+        """
+        try:
+            while self.connected:
+                receivedFrame = self.readFrame()
+                if receivedFrame.channel == fp.CHANNEL_TELEMETRY:
+                    with self.telemetryCondition:
+                        self.telemetry.append(receivedFrame)
+                        self.telemetryCondition.notify_all()
+                    continue
+                with self.pendingLock:
+                    future = self.pendingReplies.pop(
+                        (receivedFrame.channel, receivedFrame.sequence), None)
+                if future is None:
+                    logging.warning("Discarding stale reply "
+                                    f"{receivedFrame.channel}#"
+                                    f"{receivedFrame.sequence} from "
+                                    f"{self.serverIP}:{self.serverPort}")
+                else:
+                    future.set_result(receivedFrame)
+        except (ConnectionError, OSError, fp.frameError) as e:
+            self.connectionLost(e)
+
+    def connectionLost(self, error, closing: bool = False) -> None:
+        """Fails every pending request and wakes the telemetry readers
+
+        Args:
+            error: exception that ended the connection
+            closing: the client closed the connection itself
+
+        Returns:
+            null
+        """
+        with self.pendingLock:
+            if not self.connected:
+                return
+            self.connected = False
+            pendingReplies = list(self.pendingReplies.values())
+            self.pendingReplies.clear()
+        if not closing:
+            logging.error(f"{self.serverIP}:{self.serverPort} - Connection "
+                          f"lost {error}")
+        for future in pendingReplies:
+            future.set_exception(ConnectionError(
+                f"{self.serverIP}:{self.serverPort} connection lost: "
+                f"{error}"))
+        self.sendQueue.put((-1, 0, None))
+        with self.telemetryCondition:
+            self.telemetryCondition.notify_all()
+
+    def closeConnection(self) -> None:
+        """Stops the reader and writer threads and closes the connection
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        self.connectionLost(ConnectionError("closed by the client"),
+                            closing=True)
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        super().closeConnection()
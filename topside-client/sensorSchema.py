@@ -0,0 +1,165 @@
+# Sensor record layout shared by the data logger and the log reader
+#
+# Binary logs (.klog) are a small header followed by fixed width records:
+#   magic (4s) | format version (H) | descriptor length (H) |
+#   JSON dtype descriptor | records
+# Each record is RECORD_DTYPE, so a log can be loaded or memory-mapped straight
+# into a NumPy structured array.
+
+from datetime import datetime
+import numpy as np
+import struct
+import json
+import csv
+
+# (field name, numpy type, csv header) in the order sent by the sensor Arduino
+SENSOR_SCHEMA = [
+    ("humidity", "<f4", "Humidity(%)"),
+    ("enclosureTemperature", "<f4", "Enclosure Temperature(C)"),
+    ("leak", "u1", "Leak"),
+    ("vin", "<f4", "Vin(Vrms)"),
+    ("vout", "<f4", "Vout(Vrms)"),
+    ("currentOut", "<f4", "Current Out(A)"),
+    ("pmbusTemperature", "<f4", "PMBus Temperature(C)"),
+    ("powerOut", "<f4", "Power Out(W)"),
+]
+SENSOR_FIELDS = [name for name, dataType, header in SENSOR_SCHEMA]
+CSV_HEADER = (["Time(s)"] +
+              [header for name, dataType, header in SENSOR_SCHEMA] +
+              ["ROV Time(s)"])
+
+# time: topside time.time() of the sample, sequence and age: reading sequence
+# and age reported by the server, rovTime: time the server took the reading,
+# converted to topside time by clockSync, NaN when the clocks are not synced
+RECORD_DTYPE = np.dtype([("time", "<f8"), ("sequence", "<u4"),
+                         ("age", "<f4"), ("rovTime", "<f8")] +
+                        [(name, dataType)
+                         for name, dataType, header in SENSOR_SCHEMA])
+
+LOG_MAGIC = b"KLOG"
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct("<4sHH")
+
+
+class logFormatError(Exception):
+    """The file is not a binary sensor log."""
+    pass
+
+
+def makeRecord(timestamp: float, values: list, sequence: int = 0,
+               age: float = 0.0, rovTime: float = None) -> tuple:
+    """Builds a record matching RECORD_DTYPE
+
+    Args:
+        timestamp: time.time() of the sample
+        values: values in SENSOR_SCHEMA order
+        sequence: reading sequence reported by the server
+        age: reading age reported by the server
+        rovTime: server sample time in topside time, see clockSync.toLocalTime,
+            None if unknown
+
+    Returns:
+        tuple that can be stored in a RECORD_DTYPE array
+    """
+    return (timestamp, sequence, age,
+            np.nan if rovTime is None else rovTime) + tuple(values)
+
+
+def recordToCSVRow(record) -> list:
+    """Converts a record to a row of the csv log
+
+    Args:
+        record: RECORD_DTYPE element
+
+    Returns:
+        list of values matching CSV_HEADER
+    """
+    # Logs written before rovTime existed have no such field
+    rovTime = np.nan
+    if "rovTime" in record.dtype.names:
+        rovTime = float(record["rovTime"])
+    rovColumn = "" if np.isnan(rovTime) else datetime.fromtimestamp(rovTime)
+    return ([datetime.fromtimestamp(float(record["time"]))] +
+            [record[name].item() for name in SENSOR_FIELDS] + [rovColumn])
+
+
+def writeLogHeader(logFile) -> None:
+    """Writes the header of a binary log
+
+    Args:
+        logFile: file opened in binary mode
+
+    Returns:
+        None
+    """
+    fields = np.lib.format.dtype_to_descr(RECORD_DTYPE)
+    descriptor = json.dumps(fields).encode('utf-8')
+    header = LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, len(descriptor))
+    logFile.write(header + descriptor)
+
+
+def readLogHeader(logFile):
+    """Reads the header of a binary log
+
+    Args:
+        logFile: file opened in binary mode, positioned at the start
+
+    Returns:
+        (record dtype, offset of the first record)
+
+    Raises:
+        logFormatError: The file is not a binary sensor log
+    """
+    header = logFile.read(LOG_HEADER.size)
+    if len(header) != LOG_HEADER.size:
+        raise logFormatError("File is too short")
+    magic, version, descriptorLength = LOG_HEADER.unpack(header)
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        raise logFormatError(f"Unsupported log magic {magic!r} version "
+                             f"{version}")
+    descriptor = json.loads(logFile.read(descriptorLength).decode('utf-8'))
+    # JSON turns the field tuples into lists
+    dataType = np.lib.format.descr_to_dtype(
+        [tuple(field) for field in descriptor])
+    return dataType, LOG_HEADER.size + descriptorLength
+
+
+def loadLog(path: str):
+    """Reads a whole binary log
+
+    Args:
+        path: path of the .klog file
+
+    Returns:
+        NumPy structured array of records
+    """
+    with open(path, "rb") as logFile:
+        dataType, offset = readLogHeader(logFile)
+        return np.fromfile(logFile, dtype=dataType)
+
+
+def exportCSV(path: str, csvPath: str) -> None:
+    """Converts a binary log to the csv format written by dataLogger
+
+    Args:
+        path: path of the .klog file
+        csvPath: path of the csv file to write
+
+    Returns:
+        None
+    """
+    records = loadLog(path)
+    with open(csvPath, "w", newline='') as csvFile:
+        csvWriter = csv.writer(csvFile, delimiter=',', quotechar='"',
+                               quoting=csv.QUOTE_MINIMAL)
+        csvWriter.writerow(CSV_HEADER)
+        for record in records:
+            csvWriter.writerow(recordToCSVRow(record))
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 3:
+        print("Usage: python sensorSchema.py <log.klog> <output.csv>")
+        sys.exit(1)
+    exportCSV(sys.argv[1], sys.argv[2])
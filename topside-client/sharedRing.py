@@ -0,0 +1,121 @@
+# Single producer, single consumer ring of fixed width records in shared memory
+#
+# Layout of the block:
+#   header (HEADER_DTYPE, padded to HEADER_SIZE) |
+#   capacity records of the record dtype
+# The producer only writes the records and writeIndex, the consumer only writes
+# readIndex, so neither side needs a lock. Indexes count records since the
+# start and are never wrapped.
+
+from multiprocessing import shared_memory
+import numpy as np
+import time
+
+HEADER_DTYPE = np.dtype([("writeIndex", "<u8"), ("readIndex", "<u8"),
+                         ("dropped", "<u8")])
+HEADER_SIZE = 64
+
+
+class sharedRing:
+    def __init__(self, dataType, capacity: int, name: str = None) -> None:
+        """Creates a ring, or attaches to the ring created by another process
+        when name is given
+
+        Args:
+            dataType: NumPy dtype of a record, e.g. sensorSchema.RECORD_DTYPE
+            capacity: records held by the ring, the producer drops records
+                while it is full
+            name: shared memory name of an existing ring, None creates a new
+                one
+
+        Returns:
+            None
+
+        Raises:
+            FileNotFoundError: No ring with this name exists
+        """
+        self.dataType = np.dtype(dataType)
+        self.capacity = capacity
+        self.owner = name is None
+        size = HEADER_SIZE + capacity * self.dataType.itemsize
+        self.memory = shared_memory.SharedMemory(
+            name=name, create=self.owner, size=size if self.owner else 0)
+        headerBuffer = self.memory.buf[:HEADER_DTYPE.itemsize]
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=headerBuffer)
+        self.records = np.ndarray((capacity,), dtype=self.dataType,
+                                  buffer=self.memory.buf[HEADER_SIZE:size])
+        if self.owner:
+            self.header[()] = (0, 0, 0)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def put(self, record) -> bool:
+        """Appends a record, producer side only
+
+        Args:
+            record: tuple or structured scalar matching the record dtype
+
+        Returns:
+            True if the record was stored, False if the ring was full and it
+            was dropped
+        """
+        writeIndex = int(self.header["writeIndex"])
+        if writeIndex - int(self.header["readIndex"]) >= self.capacity:
+            self.header["dropped"] += 1
+            return False
+        self.records[writeIndex % self.capacity] = record
+        # Published after the record is complete
+        self.header["writeIndex"] = writeIndex + 1
+        return True
+
+    def get(self, maxRecords: int = None, timeout: float = 0.0,
+            pollInterval: float = 0.002):
+        """Takes the waiting records, consumer side only
+
+        Args:
+            maxRecords: most records returned, None returns every waiting
+                record
+            timeout: seconds to wait for a record when the ring is empty
+            pollInterval: seconds between two checks while waiting
+
+        Returns:
+            NumPy array of records, copied out of the ring, empty if none
+            arrived in time
+        """
+        deadline = time.monotonic() + timeout
+        readIndex = int(self.header["readIndex"])
+        writeIndex = int(self.header["writeIndex"])
+        while writeIndex == readIndex and time.monotonic() < deadline:
+            time.sleep(pollInterval)
+            writeIndex = int(self.header["writeIndex"])
+        count = writeIndex - readIndex
+        if maxRecords is not None:
+            count = min(count, maxRecords)
+        start = readIndex % self.capacity
+        # At most two slices, the second one wraps from the end to the start
+        firstCount = min(count, self.capacity - start)
+        records = np.concatenate((self.records[start:start + firstCount],
+                                  self.records[:count - firstCount]))
+        self.header["readIndex"] = readIndex + count
+        return records
+
+    def dropped(self) -> int:
+        return int(self.header["dropped"])
+
+    def close(self) -> None:
+        """Detaches from the ring, the creator also frees it
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        # The views must be released before the block can be closed
+        self.header = None
+        self.records = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
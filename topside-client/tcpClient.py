@@ -1,13 +1,35 @@
+import frameProtocol as fp
 import socket
 import logging
+import time
+
+# Replies and pushed readings arrive well within RECEIVE_TIMEOUT seconds, a
+# stalled link raises socket.timeout instead of blocking the caller. Keepalive
+# probes find a server that vanished while the connection is idle after about
+# KEEPALIVE_IDLE + KEEPALIVE_INTERVAL * KEEPALIVE_COUNT seconds
+RECEIVE_TIMEOUT = 5.0
+KEEPALIVE_IDLE = 5
+KEEPALIVE_INTERVAL = 2
+KEEPALIVE_COUNT = 3
+
+
 # TODO: THIS NEEDS ERROR HANDLING
 class tcpClient:
-    def __init__(self, serverIP: str, serverPort: int) -> None:
+    def __init__(self, serverIP: str, serverPort: int,
+                 protocol: str = "binary", channel: int = fp.CHANNEL_MOTOR,
+                 latencyStats=None, traceEvery: int = 0) -> None:
         """None
 
         Args:
             serverIP: IP address of the communication Server
             serverPort: port of the communication server
+            protocol: "binary" for framed messages, "text" for the legacy
+                string protocol
+            channel: channel written in the header of every frame
+            latencyStats: latencyStats receiving the hop timings of traced
+                motor commands
+            traceEvery: trace one motor command out of traceEvery, 0 disables
+                tracing
 
         Returns:
             null
@@ -18,6 +40,17 @@ class tcpClient:
         
         self.serverIP = serverIP
         self.serverPort = serverPort
+        self.protocol = protocol
+        self.channel = channel
+        self.sequence = 0
+        self.decoder = fp.frameDecoder()
+        self.receivedFrames = []
+        # Readings pushed on CHANNEL_TELEMETRY while a reply was awaited, kept
+        # for readSensorSample
+        self.pushedFrames = []
+        self.latencyStats = latencyStats
+        self.traceEvery = traceEvery
+        self.motorCommandCount = 0
         logging.debug(f"Initializing Client - IP {self.serverIP}:{self.serverPort}")
 
     def startConnection(self):
@@ -34,7 +67,21 @@ class tcpClient:
         """
         logging.info(f"Attempting to establish connection with {self.serverIP}:{self.serverPort}")
         self.connection = socket.socket()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Linux only options, the keepalive above still applies with the system
+        # timings elsewhere
+        for option, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+                              ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                              ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+            if hasattr(socket, option):
+                self.connection.setsockopt(socket.IPPROTO_TCP,
+                                           getattr(socket, option), value)
+        self.connection.settimeout(RECEIVE_TIMEOUT)
         self.connection.connect((self.serverIP, self.serverPort))
+        self.decoder = fp.frameDecoder()
+        self.receivedFrames = []
+        self.pushedFrames = []
 
     def sendData(self, data: str) -> str:
         """Sends data to the server
@@ -48,10 +95,235 @@ class tcpClient:
         Raises:
             null
         """
+        if self.protocol == "binary":
+            reply = self.sendFrame(fp.FRAME_TEXT, data.encode('utf-8'))
+            return reply.payload.decode('utf-8')
         self.connection.send(data.encode('utf-8'))
         serverFeedback = self.connection.recv(1024).decode('utf-8')
         return serverFeedback
 
+    def sendMotorCommand(self, mode: str, values: list,
+                         inputTimestamp: float = None) -> str:
+        """Sends a motor setpoint to the server
+
+        Args:
+            mode: 'D' when the dpad is used for horizontal movement, 'S' for
+                the left stick
+            values: [x, z, rotation, y, left bumper, left trigger, right
+                bumper, right trigger]
+            inputTimestamp: time.monotonic() of the gamepad event behind the
+                command, used for tracing
+
+        Returns:
+            The motor Arduino's response
+
+        Raises:
+            null
+        """
+        if self.protocol == "text":
+            v = values
+            return self.sendData(f"MOT{mode}\t{v[0]},{v[1]}\t{v[2]},{v[3]}\t"
+                                 f"{v[4]},{v[5]},{v[6]},{v[7]}")
+        self.motorCommandCount += 1
+        if self.latencyStats is not None and self.traceEvery and \
+                self.motorCommandCount % self.traceEvery == 0:
+            return self.sendTracedMotorCommand(mode, values, inputTimestamp)
+        payload = fp.encodeMotorPayload(mode, values)
+        reply = self.sendFrame(fp.FRAME_MOTOR, payload)
+        return reply.payload.decode('utf-8')
+
+    def sendTracedMotorCommand(self, mode: str, values: list,
+                               inputTimestamp: float = None) -> str:
+        """Sends a motor setpoint that waits for the Arduino and records the
+        time spent in each hop
+
+        Args:
+            mode: 'D' when the dpad is used for horizontal movement, 'S' for
+                the left stick
+            values: [x, z, rotation, y, left bumper, left trigger, right
+                bumper, right trigger]
+            inputTimestamp: time.monotonic() of the gamepad event behind the
+                command
+
+        Returns:
+            The motor Arduino's response
+
+        Raises:
+            null
+        """
+        sentAt = time.monotonic()
+        reply = self.sendFrame(fp.FRAME_MOTOR_TRACED,
+                               fp.encodeMotorPayload(mode, values))
+        roundTrip = time.monotonic() - sentAt
+        if reply.type != fp.FRAME_TRACE_REPLY:
+            return reply.payload.decode('utf-8')
+        trace = fp.decodeTracePayload(reply.payload)
+        if inputTimestamp is not None:
+            self.latencyStats.record("input", sentAt - inputTimestamp)
+        self.latencyStats.record("roundTrip", roundTrip)
+        self.latencyStats.record("network", roundTrip - trace.total)
+        self.latencyStats.record("serverQueue", trace.queue)
+        self.latencyStats.record("serial", trace.serial)
+        inputDelay = 0.0
+        if inputTimestamp is not None:
+            inputDelay = sentAt - inputTimestamp
+        self.latencyStats.record("endToEnd", roundTrip + inputDelay)
+        return trace.reply
+
+    def requestSensorData(self) -> list:
+        """Requests the latest sensor values from the server
+
+        Args:
+            null
+
+        Returns:
+            List of sensor values, see frameProtocol.SENSOR_PAYLOAD for the
+            order
+
+        Raises:
+            ValueError: The server replied with an error
+        """
+        return self.requestSensorSample().values
+
+    def requestSensorSample(self):
+        """Requests the latest sensor reading cached by the server
+
+        Args:
+            null
+
+        Returns:
+            frameProtocol.sensorSample, the text protocol has no sequence, age
+            or sample time and reports 0 for them
+
+        Raises:
+            ValueError: The server replied with an error
+        """
+        if self.protocol == "text":
+            values = [float(value)
+                      for value in self.sendData("SEN").split("\t")]
+            return fp.sensorSample(values, 0, 0.0, 0.0)
+        reply = self.sendFrame(fp.FRAME_SENSOR_REQUEST)
+        if reply.type != fp.FRAME_SENSOR_DATA:
+            raise ValueError("Sensor request failed: "
+                             f"{reply.payload.decode('utf-8')}")
+        return fp.decodeSensorPayload(reply.payload)
+
+    def subscribeSensors(self, rate: float) -> None:
+        """Asks the server to push sensor readings on this connection
+
+        Only available with the binary protocol. Once subscribed, read the
+        readings with readSensorSample.
+
+        Args:
+            rate: readings per second, 0 to unsubscribe
+
+        Returns:
+            null
+
+        Raises:
+            ValueError: The server refused the subscription
+        """
+        reply = self.sendFrame(fp.FRAME_SUBSCRIBE,
+                               fp.encodeSubscribePayload(rate))
+        if reply.type != fp.FRAME_REPLY:
+            raise ValueError("Subscription failed: "
+                             f"{reply.payload.decode('utf-8')}")
+
+    def readSensorSample(self):
+        """Blocks until the server pushes the next sensor reading
+
+        Args:
+            null
+
+        Returns:
+            frameProtocol.sensorSample
+
+        Raises:
+            ConnectionError: The server closed the connection
+        """
+        while True:
+            if self.pushedFrames:
+                receivedFrame = self.pushedFrames.pop(0)
+            else:
+                receivedFrame = self.readFrame()
+            if receivedFrame.type == fp.FRAME_SENSOR_DATA:
+                return fp.decodeSensorPayload(receivedFrame.payload)
+
+    def requestTimeSync(self):
+        """Exchanges clock readings with the server, see clockSync
+
+        Args:
+            null
+
+        Returns:
+            (client send, server receive, server send, client receive), every
+            value a time.time() of its host
+
+        Raises:
+            ValueError: The server does not support time sync
+        """
+        clientSent = time.time()
+        reply = self.sendFrame(fp.FRAME_TIME_SYNC,
+                               fp.encodeTimeSyncPayload(clientSent))
+        clientReceived = time.time()
+        if reply.type != fp.FRAME_TIME_SYNC:
+            raise ValueError("Time sync failed: "
+                             f"{reply.payload.decode('utf-8')}")
+        sync = fp.decodeTimeSyncPayload(reply.payload)
+        return clientSent, sync.serverReceived, sync.serverSent, clientReceived
+
+    def sendFrame(self, frameType: int, payload: bytes = b""):
+        """Sends a frame and waits for the reply with its channel and sequence
+
+        Readings pushed by a subscription meanwhile are kept for
+        readSensorSample.
+
+        Args:
+            frameType: One of the frameProtocol.FRAME_* constants
+            payload: Payload bytes
+
+        Returns:
+            The reply frame
+
+        Raises:
+            ConnectionError: The server closed the connection
+        """
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        sequence = self.sequence
+        self.connection.sendall(fp.encodeFrame(frameType, self.channel,
+                                               sequence, payload))
+        while True:
+            receivedFrame = self.readFrame()
+            if receivedFrame.channel == self.channel and \
+                    receivedFrame.sequence == sequence:
+                return receivedFrame
+            if receivedFrame.channel == fp.CHANNEL_TELEMETRY:
+                self.pushedFrames.append(receivedFrame)
+                continue
+            logging.warning("Discarding stale reply "
+                            f"#{receivedFrame.sequence} from "
+                            f"{self.serverIP}:{self.serverPort}")
+
+    def readFrame(self):
+        """Blocks until a complete frame has been received
+
+        Args:
+            null
+
+        Returns:
+            The next frame sent by the server
+
+        Raises:
+            ConnectionError: The server closed the connection
+        """
+        while not self.receivedFrames:
+            receivedData = self.connection.recv(4096)
+            if not receivedData:
+                raise ConnectionError(f"{self.serverIP}:{self.serverPort} "
+                                      "closed the connection")
+            self.receivedFrames.extend(self.decoder.feed(receivedData))
+        return self.receivedFrames.pop(0)
+
     def closeConnection(self) -> None:
         """Closes the connection to the server
 
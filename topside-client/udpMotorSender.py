@@ -0,0 +1,99 @@
+import frameProtocol as fp
+import socket
+import logging
+
+
+class udpMotorSender:
+    def __init__(self, serverIP: str, serverPort: int) -> None:
+        """Sends motor setpoints over UDP, sensors and control stay on TCP
+
+        Nothing is retransmitted or waited for, a lost setpoint is replaced by
+        the next one. The server discards datagrams that arrive after a newer
+        sequence number.
+
+        Args:
+            serverIP: IP address of the communication Server
+            serverPort: motor port of the communication server
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        self.serverIP = serverIP
+        self.serverPort = serverPort
+        self.sequence = 0
+        self.connection = None
+        logging.debug("Initializing UDP motor sender - IP "
+                      f"{self.serverIP}:{self.serverPort}")
+
+    def startConnection(self):
+        """Opens the UDP socket towards the server
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        self.connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Ask the network to favour latency, ignored where not supported
+            self.connection.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, 0x10)
+        except (AttributeError, OSError):
+            pass
+        self.connection.connect((self.serverIP, self.serverPort))
+
+    def sendMotorCommand(self, mode: str, values: list,
+                         inputTimestamp: float = None) -> str:
+        """Sends a motor setpoint without waiting for a reply
+
+        Args:
+            mode: 'D' when the dpad is used for horizontal movement, 'S' for
+                the left stick
+            values: [x, z, rotation, y, left bumper, left trigger, right
+                bumper, right trigger]
+            inputTimestamp: accepted for compatibility with tcpClient, UDP
+                setpoints are not traced
+
+        Returns:
+            "SENT", or "NOT SENT" if the datagram could not be handed to the
+            network
+
+        Raises:
+            null
+        """
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        try:
+            payload = fp.encodeMotorPayload(mode, values)
+            self.connection.send(fp.encodeFrame(fp.FRAME_MOTOR,
+                                                fp.CHANNEL_MOTOR,
+                                                self.sequence, payload))
+        except OSError as e:
+            # e.g. ICMP port unreachable while the server restarts, the next
+            # setpoint is tried anyway
+            logging.warning(f"Unable to send UDP setpoint #{self.sequence}: "
+                            f"{e}")
+            return "NOT SENT"
+        return "SENT"
+
+    def closeConnection(self) -> None:
+        """Closes the UDP socket
+
+        Args:
+            null
+
+        Returns:
+            null
+
+        Raises:
+            null
+        """
+        logging.info("Closing UDP socket for "
+                     f"{self.serverIP}:{self.serverPort}")
+        if self.connection is not None:
+            self.connection.close()